@@ -11,4 +11,4 @@ fi
 
 cd "$APP_HOME" || exit
 
-django-admin send_approvals_to_pe --wet-run --delay=1
+django-admin send_approvals_to_pe --wet-run
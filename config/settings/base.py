@@ -455,6 +455,8 @@ HUEY = {
     "consumer": {
         "workers": 2,
         "worker_type": "thread",
+        # Release the locks held by tasks interrupted by a restart.
+        "flush_locks": True,
     },
     "immediate": ITOU_ENVIRONMENT not in ("DEMO", "PROD"),
 }
@@ -1,16 +1,15 @@
+import collections
 import concurrent.futures
-import os
-import shutil
-import stat
-import subprocess
-import tempfile
+import contextlib
+import queue
+import socket
+import struct
 import time
 
 from botocore.exceptions import ConnectionError as BotoConnectionError, HTTPClientError
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
-from django.core.management.base import CommandError
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models import F
 from django.utils import timezone
 
@@ -20,111 +19,217 @@ from itou.utils.command import BaseCommand
 from itou.utils.storage.s3 import s3_client
 
 
+# Default clamd socket of the Debian package.
+CLAMD_SOCKET = "/var/run/clamav/clamd.ctl"
+# Seconds without news from clamd before giving up on a file.
+CLAMD_TIMEOUT = 300
+# Size of the chunks read from S3 and sent to clamd, well below clamd StreamMaxLength.
+CHUNK_SIZE = 64 * 1024
+S3_ATTEMPTS = 5
+
+
+class ClamdError(Exception):
+    pass
+
+
+class ClamdStreamTooLarge(ClamdError):
+    """The file is larger than clamd StreamMaxLength, scanning it again would fail the same way."""
+
+
+def clamd_instream(chunks, *, socket_path=CLAMD_SOCKET, timeout=CLAMD_TIMEOUT):
+    """
+    Scan the content of `chunks` (an iterable of bytes) with the INSTREAM command of clamd,
+    without writing it to disk. Returns the virus signature, or None for a clean stream.
+
+    https://docs.clamav.net/manual/Usage/Scanning.html#instream
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(b"zINSTREAM\0")
+        try:
+            for chunk in chunks:
+                if chunk:
+                    sock.sendall(struct.pack("!L", len(chunk)))
+                    sock.sendall(chunk)
+            sock.sendall(struct.pack("!L", 0))
+        except (BrokenPipeError, ConnectionResetError):
+            # clamd stops reading when the stream is too large, its reply explains why.
+            pass
+        response = b""
+        while not response.endswith(b"\0"):
+            try:
+                data = sock.recv(4096)
+            except ConnectionResetError:
+                break
+            if not data:
+                break
+            response += data
+
+    response = response.rstrip(b"\0").decode(errors="replace")
+    # Replies look like "stream: OK", "stream: Eicar-Signature FOUND"
+    # or "INSTREAM size limit exceeded. ERROR".
+    if response == "stream: OK":
+        return None
+    if response.startswith("stream: ") and response.endswith(" FOUND"):
+        return response.removeprefix("stream: ").removesuffix(" FOUND")
+    if response.startswith("INSTREAM size limit exceeded"):
+        raise ClamdStreamTooLarge(response)
+    raise ClamdError(response or "Connection closed by clamd.")
+
+
 class Command(BaseCommand):
     help = "Run ClamAV antivirus scan on files hosted in an S3 like bucket."
-    # Takes less than 10 seconds to run on a recent machine. Since crons can be
-    # interrupted, prefer frequent and quick iterations.
+    # Files are streamed to clamd and results are committed file by file.
+    # Since crons can be interrupted, prefer frequent and quick iterations.
     BATCH_SIZE = 200
+    # More workers result in warnings:
+    #
+    # Connection pool is full, discarding connection:
+    # cellar-c2.services.clever-cloud.com. Connection pool size: 10
+    #
+    # https://urllib3.readthedocs.io/en/latest/advanced-usage.html#customizing-pool-behavior
+    # indicates the default pool size is indeed 10. It also matches clamd default MaxThreads.
+    WORKERS = 10
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=self.BATCH_SIZE)
+        parser.add_argument("--workers", dest="workers", type=int, default=self.WORKERS)
+        parser.add_argument("--clamd-socket", dest="clamd_socket", default=CLAMD_SOCKET)
+
+    @staticmethod
+    def files_to_scan(now):
+        return File.objects.exclude(scan__clamav_completed_at__gt=now - relativedelta(months=1))
 
-    def handle(self, *args, **options):
+    def handle(self, *args, batch_size, workers, clamd_socket, **options):
         start = time.perf_counter()
         now = timezone.now()
-        files = File.objects.exclude(scan__clamav_completed_at__gt=now - relativedelta(months=1)).order_by(
-            F("scan__clamav_completed_at").asc(nulls_first=True)
-        )[: self.BATCH_SIZE]
-        # Indicate these files are being processed to concurrent scans.
-        files = files.select_for_update(of=["self"], skip_locked=True, no_key=True)
-        with tempfile.TemporaryDirectory() as workdir:
-            with transaction.atomic():
-                filepath_s3key = self.download_files(files, workdir)
-
-                shutil.chown(workdir, group="clamav")
-                os.chmod(workdir, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP)
-                for filepath in filepath_s3key:
-                    shutil.chown(filepath, group="clamav")
-                    os.chmod(filepath, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP)
-
-                result = self.scan(workdir)
-                viruses_keys = self.process_report(result, filepath_s3key) if result is not None else set()
-
-                Scan.objects.bulk_create(
-                    [
-                        Scan(
-                            file=file,
-                            clamav_completed_at=now,
-                            # On conflict, the virus field is not updated. Assume legitimate files.
-                            infected=file.key in viruses_keys,
-                        )
-                        for file in files
-                    ],
-                    update_conflicts=True,
-                    update_fields=["clamav_completed_at"],
-                    unique_fields=["file_id"],
-                )
-        elapsed = time.perf_counter() - start
-        self.stderr.write(f"Scanned {len(files)} files in {elapsed:.2f}s.")
+        self.clamd_socket = clamd_socket
+        self.client = s3_client()
 
-    def download_files(self, files, workdir):
-        client = s3_client()
+        files_pks = queue.SimpleQueue()
+        for pk in (
+            self.files_to_scan(now)
+            .order_by(F("scan__clamav_completed_at").asc(nulls_first=True))
+            .values_list("pk", flat=True)[:batch_size]
+        ):
+            files_pks.put(pk)
 
-        def download_file_descriptor_with_retry(key, fd):
-            with os.fdopen(fd, "wb") as fileobj:
-                for _ in range(5):
-                    try:
-                        client.download_fileobj(settings.AWS_STORAGE_BUCKET_NAME, key, fileobj)
-                    except (BotoConnectionError, HTTPClientError):
-                        pass
-                    else:
-                        break
-
-        filepath_s3key = {}
-        # More workers result in warnings:
-        #
-        # Connection pool is full, discarding connection:
-        # cellar-c2.services.clever-cloud.com. Connection pool size: 10
-        #
-        # https://urllib3.readthedocs.io/en/latest/advanced-usage.html#customizing-pool-behavior
-        # indicates the default pool size is indeed 10.
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            batch_futures = []
-            for file in files:
-                fd, path = tempfile.mkstemp(dir=workdir)
-                batch_futures.append(executor.submit(download_file_descriptor_with_retry, file.key, fd))
-                filepath_s3key[path] = file.key
-            _done, not_done = concurrent.futures.wait(batch_futures, timeout=3600)
-        if not_done:
-            raise CommandError("Could not download files to scan.")
-        return filepath_s3key
+        stats = collections.Counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.scan_worker, files_pks, now) for _ in range(workers)]
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    stats.update(future.result())
+                except Exception:
+                    # Stop the other workers, e.g. when clamd is not reachable.
+                    with contextlib.suppress(queue.Empty):
+                        while True:
+                            files_pks.get_nowait()
+                    raise
 
-    @staticmethod
-    def scan(path):
-        result = subprocess.run(
-            ["clamdscan", "--no-summary", "--infected", path],
-            capture_output=True,
-            text=True,
+        elapsed = time.perf_counter() - start
+        megabytes = stats["bytes"] / 1024 / 1024
+        self.stderr.write(
+            f"Scanned {stats['scanned']} files ({megabytes:.1f} MB) in {elapsed:.2f}s: "
+            f"{stats['scanned'] / elapsed:.1f} files/s, {megabytes / elapsed:.2f} MB/s, "
+            f"{stats['infected']} infected, {stats['too_large']} too large, {stats['skipped']} skipped, "
+            f"{stats['errors']} errors."
+        )
+        self.logger.info(
+            "Antivirus scan throughput",
+            extra={
+                "files_per_second": stats["scanned"] / elapsed,
+                "bytes_per_second": stats["bytes"] / elapsed,
+                **stats,
+            },
         )
-        match result.returncode:
-            case 0:
-                return None
-            case 1:
-                return result.stdout
-            case _:
-                raise CommandError(result.stderr)
+
+    def scan_worker(self, files_pks, now):
+        """
+        Claim the files one at a time and scan them.
+        The claim (a row lock skipped by concurrent scans) lasts as long as the scan of the file.
+        """
+        stats = collections.Counter()
+        try:
+            while True:
+                try:
+                    file_pk = files_pks.get_nowait()
+                except queue.Empty:
+                    return stats
+                with transaction.atomic():
+                    file = (
+                        self.files_to_scan(now)
+                        .filter(pk=file_pk)
+                        .select_for_update(of=["self"], skip_locked=True, no_key=True)
+                        .first()
+                    )
+                    if file is None:
+                        # Being scanned by a concurrent command, or already scanned.
+                        stats["skipped"] += 1
+                        continue
+                    try:
+                        signature, size = self.scan_file(file.key)
+                    except ClamdStreamTooLarge as e:
+                        # Not retried until the next monthly scan, the admin lists it as suspicious.
+                        self.logger.warning("File %s is too large to be scanned: %s", file.key, e)
+                        self.save_scan(file, now, str(e), infected=None)
+                        stats["too_large"] += 1
+                        continue
+                    except (BotoConnectionError, HTTPClientError, ClamdError) as e:
+                        self.logger.error("Could not scan file %s: %s", file.key, e)
+                        stats["errors"] += 1
+                        continue
+                    # New detections are left for the staff to review, like the files too large to be scanned.
+                    self.save_scan(file, now, signature, infected=False if signature is None else None)
+                stats["scanned"] += 1
+                stats["bytes"] += size
+                if signature is not None:
+                    stats["infected"] += 1
+        finally:
+            # Each thread has its own database connection.
+            connection.close()
+
+    def scan_file(self, key):
+        """Stream the S3 object to clamd, returns its signature (None when clean) and its size."""
+        for attempt in range(1, S3_ATTEMPTS + 1):
+            size = 0
+
+            def counted(chunks):
+                nonlocal size
+                for chunk in chunks:
+                    size += len(chunk)
+                    yield chunk
+
+            try:
+                body = self.client.get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)["Body"]
+                with contextlib.closing(body):
+                    signature = clamd_instream(counted(body.iter_chunks(CHUNK_SIZE)), socket_path=self.clamd_socket)
+            except (BotoConnectionError, HTTPClientError):
+                if attempt == S3_ATTEMPTS:
+                    raise
+            else:
+                return signature, size
 
     @staticmethod
-    def process_report(report, filepath_s3key):
-        viruses = {}
-        for line in report.splitlines():
-            local_path, details = line.split(":", maxsplit=1)
-            signature, _found = details.strip().split(" ", maxsplit=1)
-            s3key = filepath_s3key[local_path]
-            viruses[s3key] = signature
-
-        viruses_keys = set(viruses)
-        scans = []
-        for scan in Scan.objects.filter(file_id__in=viruses):
-            scan.clamav_signature = viruses.pop(scan.file_id)
-            scans.append(scan)
-        Scan.objects.bulk_update(scans, fields=["clamav_signature"])
-        Scan.objects.bulk_create(Scan(file_id=key, clamav_signature=signature) for key, signature in viruses.items())
-        return viruses_keys
+    def save_scan(file, now, signature, *, infected):
+        """
+        Record the scan of `file`. `infected` is None when clamd could not tell, `signature` then
+        explains why, so that the file is reviewed by the staff.
+        """
+        scan, created = Scan.objects.get_or_create(
+            file=file,
+            defaults={
+                "clamav_completed_at": now,
+                "infected": infected,
+                "clamav_signature": signature or "",
+            },
+        )
+        if not created:
+            # The virus field is not updated, it may have been reviewed. Assume legitimate files.
+            scan.clamav_completed_at = now
+            update_fields = ["clamav_completed_at"]
+            if signature is not None:
+                scan.clamav_signature = signature
+                update_fields.append("clamav_signature")
+            scan.save(update_fields=update_fields)
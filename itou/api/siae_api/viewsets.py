@@ -11,6 +11,7 @@ from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.throttling import UserRateThrottle
 
 from itou.cities.models import City
+from itou.companies.facets import count_by, count_companies_by_location
 from itou.companies.models import Company, JobDescription
 from itou.companies.serializers import SiaeSerializer
 
@@ -18,6 +19,7 @@ from itou.companies.serializers import SiaeSerializer
 logger = logging.getLogger("api_drf")
 CODE_INSEE_PARAM_NAME = "code_insee"
 DISTANCE_FROM_CODE_INSEE_PARAM_NAME = "distance_max_km"
+FACETS_PARAM_NAME = "facettes"
 MAX_DISTANCE_RADIUS_KM = 100
 
 SIAE_ORDERING_FILTER_MAPPING = {
@@ -133,6 +135,12 @@ On peut spécifier la direction de tri :
                 required=True,
                 type=str,
             ),
+            OpenApiParameter(
+                name=FACETS_PARAM_NAME,
+                description="Ajoute le nombre de SIAE par département et par type à la réponse",
+                required=False,
+                type=bool,
+            ),
             OpenApiParameter(name="format", description="Format de sortie", required=False, enum=["json", "api"]),
             OpenApiParameter(
                 name="o",
@@ -148,7 +156,16 @@ On peut spécifier la direction de tri :
     )
     def list(self, request):
         # we need this despite the default behavior because of the documentation annotations
-        return super().list(request)
+        response = super().list(request)
+        if request.query_params.get(FACETS_PARAM_NAME) in ("true", "1"):
+            # Facets only need aggregates, not the job descriptions.
+            companies = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+            departments, _districts = count_companies_by_location(companies)
+            response.data[FACETS_PARAM_NAME] = {
+                "departement": departments,
+                "type": count_by(companies, "kind"),
+            }
+        return response
 
     def get_queryset(self):
         # We only get to this point if permissions are OK
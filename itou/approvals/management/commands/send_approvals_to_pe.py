@@ -1,18 +1,56 @@
-from time import sleep
+import concurrent.futures
 
+import httpx
 from django.db.models import Q
 from django.utils import timezone
 
 from itou.approvals import models as approvals_models
 from itou.job_applications.models import JobApplicationWorkflow
-from itou.utils.apis import enums as api_enums
+from itou.utils.apis import enums as api_enums, pole_emploi_api_client
+from itou.utils.apis.pole_emploi import RateLimiter
 from itou.utils.command import BaseCommand
 
 
+# Calls per second to the PE API. The rate limiter slows down when PE answers with a 429 anyway.
+DEFAULT_RATE = 5
+# Number of calls waiting for PE at the same time: the API is pretty slow.
+DEFAULT_CONCURRENCY = 10
 # arbitrary value, set so that we don't run the cron for too long.
-# if the delay is set to 1 second, then this would take approximately 280 seconds
+# an approval needs up to 2 calls, at 5 calls per second this would take approximately 240 seconds.
 # Since the cron runs every 5 minutes, it should be fine
-MAX_APPROVALS_PER_RUN = 140
+MAX_APPROVALS_PER_RUN = 600
+
+
+def send_notifications(instances, *, rate, concurrency):
+    """
+    Notify PE of `instances` (all of the same model), with at most `concurrency` calls in flight
+    and `rate` calls per second. The outcomes are saved at the end, in bulk, even when sending
+    one of the notifications raised an unexpected exception (which is then re-raised).
+    """
+    if not instances:
+        return
+    now = timezone.now()
+    # Preliminary checks access the database: keep them in the main thread.
+    to_send = [(instance, notification) for instance in instances if (notification := instance.pe_notification(now))]
+    futures = {}
+    try:
+        with httpx.Client(limits=httpx.Limits(max_connections=concurrency)) as http_client:
+            pe_client = pole_emploi_api_client(http_client=http_client, rate_limiter=RateLimiter(rate))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for instance, notification in to_send:
+                    future = executor.submit(instance.pe_send_notification, notification, pe_client)
+                    futures[future] = (instance, notification)
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+    finally:
+        # The executor waited for every notification: save the ones which were sent.
+        sent = [
+            instance_and_notification
+            for future, instance_and_notification in futures.items()
+            if future.done() and not future.cancelled() and future.exception() is None
+        ]
+        if sent:
+            type(instances[0]).pe_bulk_save_notifications(sent)
 
 
 class Command(BaseCommand):
@@ -20,9 +58,10 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("--wet-run", dest="wet_run", action="store_true")
-        parser.add_argument("--delay", action="store", dest="delay", default=0, type=int, choices=range(0, 5))
+        parser.add_argument("--rate", action="store", dest="rate", default=DEFAULT_RATE, type=float)
+        parser.add_argument("--concurrency", action="store", dest="concurrency", default=DEFAULT_CONCURRENCY, type=int)
 
-    def handle(self, *, wet_run, delay, **options):
+    def handle(self, *, wet_run, rate, concurrency, **options):
         today = timezone.localdate()
 
         # Check if approvals in ERROR on endpoint rech_individu are now linked to an user
@@ -67,13 +106,13 @@ class Command(BaseCommand):
         self.stdout.write(f"approvals needing to be sent count={nb_approvals}, batch count={MAX_APPROVALS_PER_RUN}")
         nb_approvals_to_send = min(nb_approvals, MAX_APPROVALS_PER_RUN)
 
-        for approval in queryset[:nb_approvals_to_send]:
+        approvals = list(queryset.select_related("user__jobseeker_profile")[:nb_approvals_to_send])
+        for approval in approvals:
             self.stdout.write(
                 f"approvals={approval} start_at={approval.start_at} pe_state={approval.pe_notification_status}"
             )
-            if wet_run:
-                approval.notify_pole_emploi()
-                sleep(delay)
+        if wet_run:
+            send_notifications(approvals, rate=rate, concurrency=concurrency)
 
         # Send READY CancelledApprovals
         batch_left = MAX_APPROVALS_PER_RUN - nb_approvals_to_send
@@ -86,11 +125,11 @@ class Command(BaseCommand):
         self.stdout.write(
             f"cancelled approvals needing to be sent count={cancelled_queryset.count()}, batch count={batch_left}"
         )
-        for cancelled_approval in cancelled_queryset[:batch_left]:
+        cancelled_approvals = list(cancelled_queryset[:batch_left])
+        for cancelled_approval in cancelled_approvals:
             self.stdout.write(
                 f"cancelled_approval={cancelled_approval} start_at={cancelled_approval.start_at} "
                 f"pe_state={cancelled_approval.pe_notification_status}"
             )
-            if wet_run:
-                cancelled_approval.notify_pole_emploi()
-                sleep(delay)
+        if wet_run:
+            send_notifications(cancelled_approvals, rate=rate, concurrency=concurrency)
@@ -1,3 +1,5 @@
+import collections
+import dataclasses
 import datetime
 import functools
 import logging
@@ -222,7 +224,6 @@ class ApprovalQuerySet(CommonApprovalQuerySet):
         return self.annotate(
             assigned_company=Subquery(
                 job_application_model.objects.accepted()
-                .with_accepted_at()
                 .filter(job_seeker=OuterRef("user"))
                 .order_by("-accepted_at", "-hiring_start_at")
                 .values("to_company")[:1],
@@ -240,6 +241,35 @@ class ApprovalQuerySet(CommonApprovalQuerySet):
         return self.filter(eligibility_diagnosis__isnull=False).exclude(eligibility_diagnosis__job_seeker=F("user"))
 
 
+PE_NOTIFICATION_FIELDS = [
+    "pe_notification_status",
+    "pe_notification_time",
+    "pe_notification_endpoint",
+    "pe_notification_exit_code",
+]
+
+
+@dataclasses.dataclass
+class PENotification:
+    """What is sent to PE about an approval, and the outcome of the API calls."""
+
+    first_name: str
+    last_name: str
+    nir: str
+    birthdate: datetime.date
+    siae_siret: str
+    siae_kind: str
+    sender_kind: str
+    prescriber_kind: str | None
+    at: datetime.datetime
+    id_national: str | None = None
+    # Set by PENotificationMixin.pe_send_notification()
+    id_national_found: bool = False
+    status: str | None = None
+    endpoint: str | None = None
+    exit_code: str | None = None
+
+
 class PENotificationMixin(models.Model):
     pe_notification_status = models.CharField(
         verbose_name="état de la notification à PE",
@@ -270,9 +300,23 @@ class PENotificationMixin(models.Model):
     class Meta:
         abstract = True
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.pe_notification is PENotificationMixin.pe_notification:
+            raise TypeError(f"{cls.__name__} must define pe_notification() to be notified to PE.")
+
     def get_pe_end_at(self):
         return self.end_at.strftime(DATE_FORMAT)
 
+    def _pe_notification_values(self, status, at=None, endpoint=None, exit_code=None):
+        update_dict = {
+            "pe_notification_status": status,
+            "pe_notification_time": at if at else timezone.now(),
+            "pe_notification_endpoint": endpoint,
+            "pe_notification_exit_code": exit_code,
+        }
+        return {key: value for key, value in update_dict.items() if value}
+
     def _pe_notification_update(self, status, at=None, endpoint=None, exit_code=None):
         """A helper method to update the fields of the mixin:
         - whatever the destination class (Approval, PoleEmploiApproval)
@@ -280,14 +324,8 @@ class PENotificationMixin(models.Model):
 
         This will become useless when we will stop managing the PoleEmploiApproval that much.
         """
-        update_dict = {
-            "pe_notification_status": status,
-            "pe_notification_time": at if at else timezone.now(),
-            "pe_notification_endpoint": endpoint,
-            "pe_notification_exit_code": exit_code,
-        }
         queryset = self.__class__.objects.filter(pk=self.pk)
-        queryset.update(**{key: value for key, value in update_dict.items() if value})
+        queryset.update(**self._pe_notification_values(status, at, endpoint, exit_code))
 
     def pe_save_pending(self, reason, at=None):
         self._pe_notification_update(api_enums.PEApiNotificationStatus.PENDING, at, None, reason)
@@ -316,48 +354,103 @@ class PENotificationMixin(models.Model):
     def pe_log_err(self, fmt, *args, **kwargs):
         self._pe_log("!", fmt, *args, **kwargs)
 
-    def pe_rech_individu(self, first_name, last_name, nir, birthdate, at):
-        pe_client = pole_emploi_api_client()
-        try:
-            return pe_client.recherche_individu_certifie(first_name, last_name, birthdate, nir)
-        except PoleEmploiAPIException:
-            self.pe_log_err("got a recoverable error in recherche_individu")
-            self.pe_save_should_retry(at)
-        except PoleEmploiAPIBadResponse as exc:
-            self.pe_log_err("got an unrecoverable error={} in recherche_individu", exc.response_code)
-            self.pe_save_error(api_enums.PEApiEndpoint.RECHERCHE_INDIVIDU, exc.response_code, at)
+    def pe_notification(self, at):
+        """
+        Return the PENotification to send for this instance, or None if it can't be sent:
+        the reason is then saved in the notification fields.
 
-    def pe_maj_pass(self, id_national_pe, siae_siret, siae_kind, sender_kind, prescriber_kind=None, at=None):
-        pe_client = pole_emploi_api_client()
+        Every model using the mixin defines it, see `__init_subclass__()`.
+        """
+
+    def pe_set_id_national(self, id_national):
+        """
+        Store the PE identifier of the job seeker found by `recherche_individu_certifie`,
+        and return the object to save with its updated fields, if any.
+        """
+        return None
+
+    def pe_send_notification(self, notification, pe_client):
+        """
+        Send the notification to PE and record the outcome in it.
+
+        It doesn't access the database, so that notifications can be sent from several threads.
+        """
+        if not notification.id_national:
+            try:
+                notification.id_national = pe_client.recherche_individu_certifie(
+                    notification.first_name, notification.last_name, notification.birthdate, notification.nir
+                )
+            except PoleEmploiAPIException:
+                self.pe_log_err("got a recoverable error in recherche_individu")
+                notification.status = api_enums.PEApiNotificationStatus.SHOULD_RETRY
+                return
+            except PoleEmploiAPIBadResponse as exc:
+                self.pe_log_err("got an unrecoverable error={} in recherche_individu", exc.response_code)
+                notification.status = api_enums.PEApiNotificationStatus.ERROR
+                notification.endpoint = api_enums.PEApiEndpoint.RECHERCHE_INDIVIDU
+                notification.exit_code = exc.response_code
+                return
+            notification.id_national_found = True
 
         typologie_prescripteur = None
-        if prescriber_kind:
+        if notification.prescriber_kind:
             typologie_prescripteur = prescribers_enums.PrescriberOrganizationKind(
-                prescriber_kind
+                notification.prescriber_kind
             ).to_PE_typologie_prescripteur()
 
-        origine_candidature = job_application_enums.sender_kind_to_pe_origine_candidature(sender_kind)
+        origine_candidature = job_application_enums.sender_kind_to_pe_origine_candidature(notification.sender_kind)
 
         try:
             pe_client.mise_a_jour_pass_iae(
                 self,
-                id_national_pe,
-                siae_siret,
-                companies_enums.siae_kind_to_pe_type_siae(siae_kind),
+                notification.id_national,
+                notification.siae_siret,
+                companies_enums.siae_kind_to_pe_type_siae(notification.siae_kind),
                 origine_candidature=origine_candidature,
                 typologie_prescripteur=typologie_prescripteur,
             )
         except PoleEmploiAPIException:
             self.pe_log_err("got a recoverable error in maj_pass_iae")
-            self.pe_save_should_retry(at)
-            return
+            notification.status = api_enums.PEApiNotificationStatus.SHOULD_RETRY
         except PoleEmploiAPIBadResponse as exc:
             self.pe_log_err("got an unrecoverable error={} in maj_pass_iae", exc.response_code)
-            self.pe_save_error(api_enums.PEApiEndpoint.MISE_A_JOUR_PASS_IAE, exc.response_code, at)
-            return
+            notification.status = api_enums.PEApiNotificationStatus.ERROR
+            notification.endpoint = api_enums.PEApiEndpoint.MISE_A_JOUR_PASS_IAE
+            notification.exit_code = exc.response_code
         else:
             self.pe_log_info("got success in maj_pass_iae")
-            self.pe_save_success(at)
+            notification.status = api_enums.PEApiNotificationStatus.SUCCESS
+
+    def pe_save_notification(self, notification):
+        if notification.id_national_found and (to_save := self.pe_set_id_national(notification.id_national)):
+            obj, fields = to_save
+            obj.save(update_fields=fields)
+        self._pe_notification_update(
+            notification.status, notification.at, notification.endpoint, notification.exit_code
+        )
+
+    @classmethod
+    def pe_bulk_save_notifications(cls, instances_and_notifications):
+        """Save the outcome of several notifications with a few UPDATE queries."""
+        objs_by_fields = collections.defaultdict(list)
+        for instance, notification in instances_and_notifications:
+            if notification.id_national_found and (to_save := instance.pe_set_id_national(notification.id_national)):
+                obj, fields = to_save
+                objs_by_fields[(type(obj), tuple(fields))].append(obj)
+            values = instance._pe_notification_values(
+                notification.status, notification.at, notification.endpoint, notification.exit_code
+            )
+            for field, value in values.items():
+                setattr(instance, field, value)
+            objs_by_fields[(cls, tuple(PE_NOTIFICATION_FIELDS))].append(instance)
+        with transaction.atomic():
+            for (model, fields), objs in objs_by_fields.items():
+                model.objects.bulk_update(objs, fields, batch_size=1000)
+
+    def notify_pole_emploi(self):
+        if notification := self.pe_notification(timezone.now()):
+            self.pe_send_notification(notification, pole_emploi_api_client())
+            self.pe_save_notification(notification)
 
 
 class CancelledApproval(PENotificationMixin, CommonApprovalMixin):
@@ -396,8 +489,7 @@ class CancelledApproval(PENotificationMixin, CommonApprovalMixin):
         # For cancelled approval, we send start_at == end_at
         return self.start_at.strftime(DATE_FORMAT)
 
-    def notify_pole_emploi(self):
-        at = timezone.now()
+    def pe_notification(self, at):
         if self.start_at > at.date():
             self.pe_log_err("start_at={} starts after today={}", self.start_at, at.date())
             self.pe_save_pending(
@@ -440,27 +532,23 @@ class CancelledApproval(PENotificationMixin, CommonApprovalMixin):
             )
             return
 
-        if not self.user_id_national_pe:
-            id_national = self.pe_rech_individu(
-                self.user_first_name,
-                self.user_last_name,
-                self.user_nir,
-                self.user_birthdate,
-                at,
-            )
-            if not id_national:
-                return
-            self.user_id_national_pe = id_national
-            self.save(update_fields=["user_id_national_pe"])
-        self.pe_maj_pass(
-            id_national_pe=self.user_id_national_pe,
+        return PENotification(
+            first_name=self.user_first_name,
+            last_name=self.user_last_name,
+            nir=self.user_nir,
+            birthdate=self.user_birthdate,
             siae_siret=self.origin_siae_siret,
             siae_kind=self.origin_siae_kind,
             sender_kind=self.origin_sender_kind,
             prescriber_kind=self.origin_prescriber_organization_kind,
             at=at,
+            id_national=self.user_id_national_pe,
         )
 
+    def pe_set_id_national(self, id_national):
+        self.user_id_national_pe = id_national
+        return self, ["user_id_national_pe"]
+
 
 class Approval(PENotificationMixin, CommonApprovalMixin):
     """
@@ -892,7 +980,7 @@ class Approval(PENotificationMixin, CommonApprovalMixin):
             - datetime.timedelta(days=1)
         )
 
-    def notify_pole_emploi(self):
+    def pe_notification(self, now):
         # We do not send approvals that start in the future to PE, because their IS can't handle them.
         # In this case, do not mark them as "should retry" but leave them pending. The pending ones
         # will be caught by the second pass cron. The "should retry" then assumes:
@@ -954,29 +1042,25 @@ class Approval(PENotificationMixin, CommonApprovalMixin):
             )
             return
 
-        if not self.user.jobseeker_profile.pe_obfuscated_nir:
-            id_national = self.pe_rech_individu(
-                self.user.first_name,
-                self.user.last_name,
-                self.user.jobseeker_profile.nir,
-                self.user.birthdate,
-                now,
-            )
-            if not id_national:
-                return
-            self.user.jobseeker_profile.pe_obfuscated_nir = id_national
-            self.user.jobseeker_profile.pe_last_certification_attempt_at = timezone.now()
-            self.user.jobseeker_profile.save(update_fields=["pe_obfuscated_nir", "pe_last_certification_attempt_at"])
-
-        self.pe_maj_pass(
-            id_national_pe=self.user.jobseeker_profile.pe_obfuscated_nir,
+        return PENotification(
+            first_name=self.user.first_name,
+            last_name=self.user.last_name,
+            nir=self.user.jobseeker_profile.nir,
+            birthdate=self.user.birthdate,
             siae_siret=siae_siret,
             siae_kind=siae_kind,
             sender_kind=sender_kind,
             prescriber_kind=prescriber_organization_kind,
             at=now,
+            id_national=self.user.jobseeker_profile.pe_obfuscated_nir,
         )
 
+    def pe_set_id_national(self, id_national):
+        jobseeker_profile = self.user.jobseeker_profile
+        jobseeker_profile.pe_obfuscated_nir = id_national
+        jobseeker_profile.pe_last_certification_attempt_at = timezone.now()
+        return jobseeker_profile, ["pe_obfuscated_nir", "pe_last_certification_attempt_at"]
+
 
 class SuspensionQuerySet(models.QuerySet):
     @property
@@ -1888,24 +1972,18 @@ class PoleEmploiApproval(PENotificationMixin, CommonApprovalMixin):
     def number_with_spaces(self):
         return f"{self.number[:5]} {self.number[5:7]} {self.number[7:]}"
 
-    def notify_pole_emploi(self):
-        now = timezone.now()
-        id_national = self.pe_rech_individu(
+    def pe_notification(self, at):
+        return PENotification(
             first_name=self.first_name,
             last_name=self.last_name,
-            birthdate=self.birthdate,
             nir=self.nir,
-            at=now,
+            birthdate=self.birthdate,
+            siae_siret=self.siae_siret,
+            siae_kind=self.siae_kind,
+            sender_kind=job_application_enums.SenderKind.PRESCRIBER,
+            prescriber_kind=prescribers_enums.PrescriberOrganizationKind.PE,
+            at=at,
         )
-        if id_national:
-            self.pe_maj_pass(
-                id_national_pe=id_national,
-                siae_siret=self.siae_siret,
-                siae_kind=self.siae_kind,
-                sender_kind=job_application_enums.SenderKind.PRESCRIBER,
-                prescriber_kind=prescribers_enums.PrescriberOrganizationKind.PE,
-                at=now,
-            )
 
 
 class OriginalPoleEmploiApproval(CommonApprovalMixin):
@@ -11,6 +11,7 @@ from django.db.models.deletion import RestrictedError
 from itou.asp.models import Commune
 from itou.cities.models import City
 from itou.users.models import JobSeekerProfile
+from itou.utils.autocomplete_versions import bump_version
 from itou.utils.command import BaseCommand
 from itou.utils.sync import DiffItemKind, yield_sync_diff
 
@@ -192,3 +193,4 @@ class Command(BaseCommand):
                         fields=["birth_place", "hexa_commune"],
                     )
                     self.stdout.write(f"> realigned count={n_objs} JobSeeker profiles with updated communes.")
+            bump_version(Commune)
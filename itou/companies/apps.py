@@ -12,6 +12,35 @@ class CompaniesAppConfig(AppConfig):
         super().ready()
         models.signals.post_migrate.connect(create_pole_emploi_company, sender=self)
 
+        from itou.companies.models import JobDescription
+        from itou.companies.tasks import (
+            update_job_app_score_on_job_application_delete,
+            update_job_app_score_on_job_application_save,
+            update_job_app_score_on_job_description_change,
+        )
+        from itou.job_applications.models import JobApplication
+
+        models.signals.post_save.connect(
+            update_job_app_score_on_job_application_save,
+            sender=JobApplication,
+            dispatch_uid="job-app-score-JobApplication-save",
+        )
+        models.signals.post_delete.connect(
+            update_job_app_score_on_job_application_delete,
+            sender=JobApplication,
+            dispatch_uid="job-app-score-JobApplication-delete",
+        )
+        models.signals.post_save.connect(
+            update_job_app_score_on_job_description_change,
+            sender=JobDescription,
+            dispatch_uid="job-app-score-JobDescription-save",
+        )
+        models.signals.post_delete.connect(
+            update_job_app_score_on_job_description_change,
+            sender=JobDescription,
+            dispatch_uid="job-app-score-JobDescription-delete",
+        )
+
 
 def create_pole_emploi_company(*args, **kwargs):
     from itou.companies.models import Company
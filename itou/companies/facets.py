@@ -0,0 +1,58 @@
+"""
+Facets of the employers and job descriptions searches, e.g. the number of results by department.
+
+They are computed with grouped aggregate queries on the already filtered querysets,
+instead of loading every matching company or job description in Python.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db.models import Case, Count, F, When
+
+from itou.common_apps.address.departments import DEPARTMENTS_WITH_DISTRICTS
+
+
+def count_by(queryset, field):
+    """
+    Return `{value: count}` for the given field of the queryset (or expression, e.g. a `Case()`).
+    """
+    if not isinstance(field, str):
+        queryset = queryset.annotate(facet=field)
+        field = "facet"
+    # Clear the ordering, which would otherwise be added to the GROUP BY.
+    return dict(queryset.order_by().values_list(field).annotate(count=Count("pk")))
+
+
+def _count_by_location(rows):
+    departments = Counter()
+    districts = defaultdict(Counter)
+    for department, post_code, count in rows:
+        if not department:
+            continue
+        departments[department] += count
+        if department in DEPARTMENTS_WITH_DISTRICTS and post_code.isdigit():
+            if int(post_code) <= DEPARTMENTS_WITH_DISTRICTS[department]["max"]:
+                districts[department][post_code] += count
+    return dict(departments), {department: dict(counts) for department, counts in districts.items()}
+
+
+def count_companies_by_location(companies):
+    """
+    Return the `{department: count}` and `{department: {district: count}}` facets of companies,
+    where districts are the post codes of the cities with districts (Paris, Lyon, Marseille).
+
+    Both facets come from the same query, grouped by department and post code.
+    """
+    rows = companies.order_by().values_list("department", "post_code").annotate(count=Count("pk"))
+    return _count_by_location(rows)
+
+
+def count_job_descriptions_by_department(job_descriptions):
+    """
+    Return the `{department: count}` facet of job descriptions, located in their company when they have no location.
+    """
+    department = Case(
+        When(location__isnull=False, then=F("location__department")),
+        default=F("company__department"),
+    )
+    return {department: count for department, count in count_by(job_descriptions, department).items() if department}
@@ -9,6 +9,7 @@ import gzip
 import os
 import zipfile
 
+import numpy as np
 import pandas as pd
 from django.conf import settings
 from django.utils import timezone
@@ -294,18 +295,9 @@ def anonymize_fluxiae_df(df):
     return df
 
 
-def get_fluxiae_df(
-    vue_name,
-    converters=None,
-    description=None,
-    parse_dates=None,
-    skip_first_row=True,
-    anonymize_sensitive_data=True,
-    infer_datetime_format=True,
-):
+def _get_fluxiae_read_csv_kwargs(vue_name, description=None, skip_first_row=True):
     """
-    Load fluxIAE CSV file as a dataframe.
-    Any sensitive data will be dropped and/or anonymized.
+    Find the fluxIAE CSV file of `vue_name` and return the `pandas.read_csv` arguments needed to load it.
     """
     filename = get_filename(
         filename_prefix=vue_name,
@@ -349,6 +341,35 @@ def get_fluxiae_df(
 
     print(f"Loading {nrows} rows for {vue_name} ...")
 
+    return {
+        "filepath_or_buffer": filename,
+        "sep": "|",
+        # Some rows have a single `"` in a field, for example in fluxIAE_Mission the mission_descriptif field of
+        # the mission id 1003399237 is `"AIEHPAD` (no closing double quote). This screws CSV parsing big time
+        # as the parser will read many rows until the next `"` and consider all of them as part of the
+        # initial mission_descriptif field value o_O. Let's just disable quoting alltogether to avoid that.
+        "quoting": csv.QUOTE_NONE,
+        "nrows": nrows,
+        **kwargs,
+    }
+
+
+def get_fluxiae_df(
+    vue_name,
+    converters=None,
+    description=None,
+    parse_dates=None,
+    skip_first_row=True,
+    anonymize_sensitive_data=True,
+    infer_datetime_format=True,
+):
+    """
+    Load fluxIAE CSV file as a dataframe.
+    Any sensitive data will be dropped and/or anonymized.
+    """
+    kwargs = _get_fluxiae_read_csv_kwargs(vue_name, description=description, skip_first_row=skip_first_row)
+    nrows = kwargs["nrows"]
+
     if converters:
         kwargs["converters"] = converters
 
@@ -365,14 +386,6 @@ def get_fluxiae_df(
     kwargs["dayfirst"] = True
 
     df = pd.read_csv(
-        filename,
-        sep="|",
-        # Some rows have a single `"` in a field, for example in fluxIAE_Mission the mission_descriptif field of
-        # the mission id 1003399237 is `"AIEHPAD` (no closing double quote). This screws CSV parsing big time
-        # as the parser will read many rows until the next `"` and consider all of them as part of the
-        # initial mission_descriptif field value o_O. Let's just disable quoting alltogether to avoid that.
-        quoting=csv.QUOTE_NONE,
-        nrows=nrows,
         **kwargs,
         # Fix DtypeWarning (Columns have mixed types) and avoid error when field value in later rows contradicts
         # the field data format guessed on first rows.
@@ -389,3 +402,54 @@ def get_fluxiae_df(
         df = anonymize_fluxiae_df(df)
 
     return df
+
+
+def _merge_dtypes(dtype, other_dtype):
+    # Same rules as pandas when it infers the dtype of a whole column.
+    if dtype == other_dtype:
+        return dtype
+    if {dtype, other_dtype} == {np.dtype("int64"), np.dtype("float64")}:
+        return np.dtype("float64")
+    return np.dtype("object")
+
+
+def get_fluxiae_df_chunks(vue_name, chunksize=10_000, skip_first_row=True, anonymize_sensitive_data=True):
+    """
+    Load fluxIAE CSV file as dataframes of at most `chunksize` rows, so that memory use does not grow
+    with the file size.
+
+    Column dtypes are inferred once on the whole file, in a first pass, so that every chunk
+    gets the dtypes `get_fluxiae_df` would have given to the whole dataframe. The file is thus
+    parsed twice, but the first pass only parses: it is cheaper than anonymizing and storing the
+    chunks, and parsing the whole file was already needed to load it at once. It also checks
+    the row count before any chunk is yielded, so that a truncated file is not partially stored.
+    Any sensitive data will be dropped and/or anonymized.
+    """
+    kwargs = _get_fluxiae_read_csv_kwargs(vue_name, skip_first_row=skip_first_row)
+    nrows = kwargs["nrows"]
+
+    dtypes = {}
+    read_rows = 0
+    with pd.read_csv(**kwargs, chunksize=chunksize, low_memory=False) as reader:
+        for df_chunk in reader:
+            read_rows += len(df_chunk)
+            for column_name, dtype in df_chunk.dtypes.items():
+                dtypes[column_name] = _merge_dtypes(dtypes.get(column_name, dtype), dtype)
+
+    # If there is only one column, something went wrong, let's break early.
+    # Most likely an incorrect skip_first_row value.
+    assert len(dtypes) >= 2
+
+    assert read_rows == nrows
+
+    # Strings which look like numbers in some chunks (e.g. "01234") must not be converted.
+    kwargs["dtype"] = {column_name: dtype for column_name, dtype in dtypes.items() if dtype != np.dtype("int64")}
+    read_rows = 0
+    with pd.read_csv(**kwargs, chunksize=chunksize, low_memory=False) as reader:
+        for df_chunk in reader:
+            read_rows += len(df_chunk)
+            if anonymize_sensitive_data:
+                df_chunk = anonymize_fluxiae_df(df_chunk)
+            yield df_chunk
+
+    assert read_rows == nrows
@@ -12,6 +12,7 @@ from itou.invitations import models as invitations_models
 from itou.job_applications import models as job_applications_models
 from itou.users import models as users_models
 from itou.utils.command import BaseCommand
+from itou.utils.perms.memberships import invalidate_organizations_cache
 
 
 HELP_TEXT = """
@@ -215,13 +216,17 @@ class Command(BaseCommand):
                 for job_application in job_applications_to_clear:
                     job_application.selected_jobs.clear()
 
-            job_applications_sent.update(sender_company_id=to_id)
-            job_applications_received.update(to_company_id=to_id)
+            # Queryset updates do not bump `updated_at`, which tells the job application changed.
+            job_applications_sent.update(sender_company_id=to_id, updated_at=timezone.now())
+            job_applications_received.update(to_company_id=to_id, updated_at=timezone.now())
 
             if move_all_data:
                 # do not move duplicated job_descriptions
                 job_descriptions.exclude(appellation_id__in=to_company_appellation_id).update(company_id=to_id)
+                moved_user_pks = list(members.values_list("user_id", flat=True))
                 members.update(company_id=to_id)
+                # Queryset updates don't send the signals invalidating the memberships resolved by the middleware.
+                transaction.on_commit(lambda: invalidate_organizations_cache(moved_user_pks))
                 diagnoses.update(author_siae_id=to_id)
                 prolongations.update(declared_by_siae_id=to_id)
                 suspensions.update(siae_id=to_id)
@@ -0,0 +1,16 @@
+import time
+
+from itou.companies import models
+from itou.utils.command import BaseCommand
+from itou.utils.search_versions import bump_versions
+
+
+class Command(BaseCommand):
+    help = """Rebuild the index read by the employers search"""
+
+    def handle(self, **options):
+        start = time.perf_counter()
+        nb_indexed, changed_departments = models.CompanySearchIndex.refresh()
+        # Renew the cached search results around the changed companies.
+        bump_versions("companies", changed_departments)
+        self.stdout.write(f"Indexed {nb_indexed} companies in {time.perf_counter() - start:.3f} seconds")
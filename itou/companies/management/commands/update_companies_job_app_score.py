@@ -1,22 +1,42 @@
+"""
+Scores are updated in the background when job applications and job descriptions change,
+see `itou.companies.tasks`. By default, this command only updates the companies whose
+job applications just got too old to be counted in the score.
+
+With --reconcile, the score of every company is recomputed and the drift is reported.
+"""
+
+import datetime
 import time
 
-from django.db.models import F, Q
+from django.utils import timezone
 
 from itou.companies import models
+from itou.job_applications.models import JobApplication
 from itou.utils.command import BaseCommand
 
 
+# The command runs every hour: leave a margin so that a late or failed run doesn't miss job applications.
+AGEING_WINDOW = datetime.timedelta(hours=3)
+
+
 class Command(BaseCommand):
     help = """Update the company job_app_score"""
 
-    def handle(self, **options):
+    def add_arguments(self, parser):
+        parser.add_argument("--reconcile", action="store_true", dest="reconcile")
+
+    def handle(self, *, reconcile, **options):
         start = time.perf_counter()
-        nb_updated = (
-            models.Company.objects.with_computed_job_app_score()
-            # Do not update if nothing changes (NULL values have to be handled separately because NULL)
-            .exclude(
-                Q(job_app_score=F("computed_job_app_score"))
-                | Q(job_app_score__isnull=True) & Q(computed_job_app_score__isnull=True)
-            ).update(job_app_score=F("computed_job_app_score"))
-        )
+        companies = models.Company.objects.all()
+        if not reconcile:
+            old_after = timezone.now() - datetime.timedelta(weeks=JobApplication.WEEKS_BEFORE_CONSIDERED_OLD)
+            companies = companies.filter(
+                pk__in=JobApplication.objects.filter(
+                    created_at__gte=old_after - AGEING_WINDOW, created_at__lt=old_after
+                ).values("to_company")
+            )
+        nb_updated = companies.update_job_app_score()
         self.stdout.write(f"Updated {nb_updated} companies in {time.perf_counter() - start:.3f} seconds")
+        if reconcile and nb_updated:
+            self.logger.warning("job_app_score drift on %d companies", nb_updated)
@@ -0,0 +1,68 @@
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("companies", "0012_company_insee_city"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompanySearchIndex",
+            fields=[
+                (
+                    "company",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_index",
+                        serialize=False,
+                        to="companies.company",
+                        verbose_name="entreprise",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("EI", "Entreprise d'insertion"),
+                            ("AI", "Association intermédiaire"),
+                            ("ACI", "Atelier chantier d'insertion"),
+                            ("ETTI", "Entreprise de travail temporaire d'insertion"),
+                            ("EITI", "Entreprise d'insertion par le travail indépendant"),
+                            ("GEIQ", "Groupement d'employeurs pour l'insertion et la qualification"),
+                            ("EA", "Entreprise adaptée"),
+                            ("EATT", "Entreprise adaptée de travail temporaire"),
+                            ("OPCS", "Organisation porteuse de la clause sociale"),
+                        ],
+                        max_length=8,
+                        verbose_name="type",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, verbose_name="nom")),
+                ("brand", models.CharField(blank=True, max_length=255, verbose_name="enseigne")),
+                (
+                    "department",
+                    models.CharField(blank=True, db_index=True, max_length=3, verbose_name="département"),
+                ),
+                ("post_code", models.CharField(blank=True, max_length=5, verbose_name="code postal")),
+                (
+                    "coords",
+                    django.contrib.gis.db.models.fields.PointField(blank=True, geography=True, null=True, srid=4326),
+                ),
+                ("has_active_members", models.BooleanField(verbose_name="a des membres actifs")),
+                ("block_job_applications", models.BooleanField(verbose_name="blocage des candidatures")),
+                ("job_app_score", models.FloatField(null=True, verbose_name="score de recommandation")),
+                (
+                    "active_job_descriptions_count",
+                    models.PositiveIntegerField(verbose_name="nombre de fiches de poste actives"),
+                ),
+            ],
+            options={
+                "verbose_name": "index de recherche des entreprises",
+                "verbose_name_plural": "index de recherche des entreprises",
+            },
+        ),
+    ]
@@ -1,9 +1,10 @@
 from django.conf import settings
+from django.contrib.gis.db import models as gis_models
 from django.contrib.gis.measure import D
 from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MaxValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models import BooleanField, Case, Count, Exists, F, OuterRef, Q, Subquery, When
 from django.db.models.constraints import UniqueConstraint
 from django.db.models.functions import Cast, Coalesce
@@ -166,6 +167,19 @@ class CompanyQuerySet(OrganizationQuerySet):
             )
         )
 
+    def update_job_app_score(self):
+        """
+        Store the computed job_app_score of the companies, return the number of companies updated.
+        """
+        return (
+            self.with_computed_job_app_score()
+            # Do not update if nothing changes (NULL values have to be handled separately because NULL)
+            .exclude(
+                Q(job_app_score=F("computed_job_app_score"))
+                | Q(job_app_score__isnull=True) & Q(computed_job_app_score__isnull=True)
+            ).update(job_app_score=F("computed_job_app_score"))
+        )
+
     def with_has_active_members(self):
         # Prefer a sub query to a join for performance reasons.
         # See `self.with_count_recent_received_job_apps`.
@@ -497,6 +511,107 @@ class CompanyMembership(MembershipAbstract):
         ]
 
 
+class CompanySearchIndexQuerySet(models.QuerySet):
+    def within(self, point, distance_km):
+        return self.filter(coords__dwithin=(point, D(km=distance_km)))
+
+
+class CompanySearchIndex(models.Model):
+    """
+    Denormalised copy of the active companies, read by the employers search.
+
+    Filtering, sorting and counting companies around a city from this table avoids evaluating
+    `Company.objects.active()` and `with_has_active_members()` on every search.
+    It is rebuilt from scratch by `refresh()`, see the `refresh_company_search_index` command.
+    """
+
+    company = models.OneToOneField(
+        Company, on_delete=models.CASCADE, primary_key=True, related_name="search_index", verbose_name="entreprise"
+    )
+    kind = models.CharField(verbose_name="type", max_length=8, choices=CompanyKind.choices)
+    name = models.CharField(verbose_name="nom", max_length=255)
+    brand = models.CharField(verbose_name="enseigne", max_length=255, blank=True)
+    department = models.CharField(verbose_name="département", max_length=3, blank=True, db_index=True)
+    post_code = models.CharField(verbose_name="code postal", max_length=5, blank=True)
+    coords = gis_models.PointField(geography=True, null=True, blank=True)
+    has_active_members = models.BooleanField(verbose_name="a des membres actifs")
+    block_job_applications = models.BooleanField(verbose_name="blocage des candidatures")
+    job_app_score = models.FloatField(verbose_name="score de recommandation", null=True)
+    active_job_descriptions_count = models.PositiveIntegerField(verbose_name="nombre de fiches de poste actives")
+
+    objects = CompanySearchIndexQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "index de recherche des entreprises"
+        verbose_name_plural = "index de recherche des entreprises"
+
+    @property
+    def display_name(self):
+        # Same as `Company.display_name`, without fetching the company.
+        if self.brand:
+            return self.brand
+        return self.name.capitalize()
+
+    @classmethod
+    def refresh(cls):
+        """
+        Rebuild the index, returns the number of indexed companies and the departments whose entries changed.
+        """
+        companies = (
+            Company.objects.active()
+            .with_has_active_members()
+            .with_count_active_job_descriptions()
+            .values(
+                "pk",
+                "kind",
+                "name",
+                "brand",
+                "department",
+                "post_code",
+                "coords",
+                "block_job_applications",
+                "job_app_score",
+                "has_active_members",
+                "count_active_job_descriptions",
+            )
+        )
+        entries = [
+            cls(
+                company_id=company["pk"],
+                kind=company["kind"],
+                name=company["name"],
+                brand=company["brand"],
+                department=company["department"],
+                post_code=company["post_code"],
+                coords=company["coords"],
+                has_active_members=company["has_active_members"],
+                block_job_applications=company["block_job_applications"],
+                job_app_score=company["job_app_score"],
+                active_job_descriptions_count=company["count_active_job_descriptions"],
+            )
+            for company in companies
+        ]
+        fields = [field.attname for field in cls._meta.concrete_fields]
+        # Searches keep reading the previous index until the transaction is committed.
+        with transaction.atomic():
+            previous_entries = {row[0]: row for row in cls.objects.values_list(*fields)}
+            cls.objects.all().delete()
+            cls.objects.bulk_create(entries, batch_size=1000)
+
+        department_index = fields.index("department")
+        changed_departments = set()
+        for entry in entries:
+            row = tuple(getattr(entry, field) for field in fields)
+            previous_row = previous_entries.pop(entry.pk, None)
+            if row != previous_row:
+                changed_departments.add(row[department_index])
+                if previous_row is not None:
+                    changed_departments.add(previous_row[department_index])
+        # Companies which left the index.
+        changed_departments.update(row[department_index] for row in previous_entries.values())
+        return len(entries), changed_departments
+
+
 class JobDescriptionQuerySet(models.QuerySet):
     def with_job_applications_count(self, filters=None):
         if filters:
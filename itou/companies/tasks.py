@@ -0,0 +1,36 @@
+from django.db import transaction
+from huey.contrib.djhuey import db_task
+
+from itou.companies.models import Company
+
+
+@db_task()
+def huey_update_job_app_score(company_ids):
+    Company.objects.filter(pk__in=company_ids).update_job_app_score()
+
+
+def schedule_job_app_score_update(*company_ids):
+    """
+    Recompute the job_app_score of the companies in the background, once the transaction is committed.
+    Job applications ageing out of the score window and bulk updates are handled by
+    the `update_companies_job_app_score` command.
+    """
+    company_ids = sorted({pk for pk in company_ids if pk})
+    if company_ids:
+        transaction.on_commit(lambda: huey_update_job_app_score(company_ids))
+
+
+def update_job_app_score_on_job_application_save(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        schedule_job_app_score_update(instance.to_company_id)
+    elif update_fields and "to_company" in update_fields:
+        # Transferred job application, see JobApplication.transfer_to().
+        schedule_job_app_score_update(instance.to_company_id, instance.transferred_from_id)
+
+
+def update_job_app_score_on_job_application_delete(sender, instance, **kwargs):
+    schedule_job_app_score_update(instance.to_company_id)
+
+
+def update_job_app_score_on_job_description_change(sender, instance, **kwargs):
+    schedule_job_app_score_update(instance.company_id)
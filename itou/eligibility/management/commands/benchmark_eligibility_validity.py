@@ -0,0 +1,69 @@
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from itou.companies.enums import SIAE_WITH_CONVENTION_KINDS
+from itou.eligibility.models import EligibilityDiagnosis
+from itou.job_applications.models import JobApplication
+from itou.utils.command import BaseCommand
+
+
+def load_pairs(job_application_pks):
+    # Fresh instances for each measure, so that no cached property is shared between them.
+    job_applications = JobApplication.objects.filter(pk__in=job_application_pks).select_related(
+        "job_seeker__jobseeker_profile", "to_company"
+    )
+    return [(job_application.job_seeker, job_application.to_company) for job_application in job_applications]
+
+
+def per_row(pairs):
+    return {
+        (job_seeker.pk, siae.pk): (
+            EligibilityDiagnosis.objects.last_considered_valid(job_seeker, for_siae=siae),
+            EligibilityDiagnosis.objects.has_considered_valid(job_seeker, for_siae=siae),
+        )
+        for job_seeker, siae in pairs
+    }
+
+
+def bulk(pairs):
+    diagnoses = EligibilityDiagnosis.objects.last_considered_valid_for(pairs)
+    # Same as `has_considered_valid_for()`, without evaluating the diagnoses twice.
+    return {
+        (job_seeker.pk, siae.pk): (
+            diagnoses[(job_seeker.pk, siae.pk)],
+            job_seeker.has_valid_common_approval or diagnoses[(job_seeker.pk, siae.pk)] is not None,
+        )
+        for job_seeker, siae in pairs
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare the per job seeker and the bulk evaluation of the eligibility diagnoses considered valid"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sample", type=int, default=500, help="Number of recent job applications")
+
+    def measure(self, label, evaluate, job_application_pks):
+        pairs = load_pairs(job_application_pks)
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            results = evaluate(pairs)
+            duration = time.perf_counter() - start
+        self.stdout.write(f"{label}: {duration * 1000:.1f}ms, {len(queries)} queries")
+        return results
+
+    def handle(self, *, sample, **options):
+        job_application_pks = list(
+            JobApplication.objects.filter(to_company__kind__in=SIAE_WITH_CONVENTION_KINDS)
+            .order_by("-created_at")
+            .values_list("pk", flat=True)[:sample]
+        )
+        self.stdout.write(f"Evaluating {len(job_application_pks)} (job seeker, SIAE) pairs")
+        per_row_results = self.measure("per row", per_row, job_application_pks)
+        bulk_results = self.measure("bulk", bulk, job_application_pks)
+        mismatches = [key for key, result in per_row_results.items() if bulk_results[key] != result]
+        self.stdout.write(f"{len(mismatches)} pairs with different results")
+        for job_seeker_pk, siae_pk in mismatches[:20]:
+            self.stdout.write(f"  - job_seeker={job_seeker_pk} siae={siae_pk}")
@@ -3,11 +3,13 @@ import logging
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.db import models, transaction
-from django.db.models import Case, Exists, OuterRef, When
+from django.db.models import Case, Exists, F, OuterRef, Q, When, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 
 from itou.approvals.models import Approval
 from itou.eligibility.enums import AdministrativeCriteriaLevel, AuthorKind
+from itou.users.models import User
 
 from .common import (
     AbstractAdministrativeCriteria,
@@ -86,6 +88,74 @@ class EligibilityDiagnosisManager(models.Manager):
         # not.
         return query.first()
 
+    def last_considered_valid_for(self, pairs):
+        """
+        Bulk version of `last_considered_valid()` for `(job_seeker, for_siae)` pairs,
+        with a single query for the diagnoses.
+
+        The latest approvals of the job seekers are primed (see `User.prefetch_latest_common_approvals()`).
+        Returns a `{(job_seeker_pk, for_siae_pk or None): diagnosis or None}` dict.
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return {}
+        User.prefetch_latest_common_approvals(job_seeker for job_seeker, _for_siae in pairs)
+        job_seeker_pks = {job_seeker.pk for job_seeker, _for_siae in pairs}
+        with_valid_approval_pks = {
+            job_seeker.pk for job_seeker, _for_siae in pairs if job_seeker.has_valid_common_approval
+        }
+        siae_pks = {for_siae.pk for _job_seeker, for_siae in pairs if for_siae is not None}
+
+        from_prescriber = Case(When(author_kind=AuthorKind.PRESCRIBER, then=1), default=0)
+        # The last diagnosis made by a prescriber, and the last one made by each employer, of every job seeker.
+        # A diagnosis is considered valid for the duration of an approval, whether it is expired or not.
+        diagnoses = (
+            self.filter(job_seeker__in=job_seeker_pks)
+            .filter(Q(author_kind=AuthorKind.PRESCRIBER) | Q(author_siae__in=siae_pks))
+            .filter(Q(job_seeker__in=with_valid_approval_pks) | Q(expires_at__gt=timezone.now()))
+            .select_related("author", "author_siae", "author_prescriber_organization")
+            .annotate(
+                from_prescriber=from_prescriber,
+                rank=Window(
+                    RowNumber(),
+                    partition_by=[F("job_seeker"), from_prescriber, F("author_siae")],
+                    order_by=F("created_at").desc(),
+                ),
+            )
+            .filter(rank=1)
+        )
+        last_by_prescriber = {}
+        last_by_siae = {}
+        for diagnosis in diagnoses:
+            if diagnosis.from_prescriber:
+                last_by_prescriber[diagnosis.job_seeker_id] = diagnosis
+            else:
+                last_by_siae[(diagnosis.job_seeker_id, diagnosis.author_siae_id)] = diagnosis
+
+        result = {}
+        for job_seeker, for_siae in pairs:
+            for_siae_pk = for_siae.pk if for_siae is not None else None
+            # A diagnosis made by a prescriber takes precedence even when an employer diagnosis already exists.
+            diagnosis = last_by_prescriber.get(job_seeker.pk) or last_by_siae.get((job_seeker.pk, for_siae_pk))
+            if diagnosis is not None:
+                # Share the job seeker instance and its primed approvals.
+                diagnosis.job_seeker = job_seeker
+            result[(job_seeker.pk, for_siae_pk)] = diagnosis
+        return result
+
+    def has_considered_valid_for(self, pairs):
+        """
+        Bulk version of `has_considered_valid()` for `(job_seeker, for_siae)` pairs.
+
+        Returns a `{(job_seeker_pk, for_siae_pk or None): bool}` dict.
+        """
+        pairs = list(pairs)
+        job_seekers = {job_seeker.pk: job_seeker for job_seeker, _for_siae in pairs}
+        return {
+            (job_seeker_pk, for_siae_pk): job_seekers[job_seeker_pk].has_valid_common_approval or diagnosis is not None
+            for (job_seeker_pk, for_siae_pk), diagnosis in self.last_considered_valid_for(pairs).items()
+        }
+
     def last_expired(self, job_seeker, for_siae=None):
         """
         Retrieves the given job seeker's last expired diagnosis or None.
@@ -1,5 +1,10 @@
+import collections
+import contextlib
+import datetime
 import logging
-from io import BytesIO
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import paramiko
 from django.conf import settings
@@ -9,13 +14,78 @@ from rest_framework.renderers import JSONRenderer
 
 from itou.employee_record import constants
 from itou.employee_record.enums import NotificationStatus
+from itou.employee_record.exceptions import SerializationError
 from itou.employee_record.models import EmployeeRecord, EmployeeRecordBatch, EmployeeRecordUpdateNotification, Status
 from itou.employee_record.serializers import EmployeeRecordSerializer, EmployeeRecordUpdateNotificationSerializer
 from itou.utils.command import BaseCommand
 from itou.utils.iterators import chunks
 
 
+def write_json(json_data, file, buffer_size=64 * 1024):
+    """
+    Write `json_data` to `file` exactly like `JSONRenderer().render()` would,
+    without building the whole document in memory.
+    Returns the number of bytes written.
+    """
+    renderer = JSONRenderer()
+    encoder = renderer.encoder_class(
+        ensure_ascii=renderer.ensure_ascii,
+        allow_nan=not renderer.strict,
+        separators=(",", ":") if renderer.compact else (", ", ": "),
+    )
+    size = 0
+    buffer = []
+    buffered = 0
+    for chunk in encoder.iterencode(json_data):
+        # Same escaping as `JSONRenderer`, these code points are never split between chunks.
+        chunk = chunk.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode()
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= buffer_size:
+            file.write(b"".join(buffer))
+            size += buffered
+            buffer, buffered = [], 0
+    if buffer:
+        file.write(b"".join(buffer))
+        size += buffered
+    return size
+
+
 class EmployeeRecordTransferCommand(BaseCommand):
+    """
+    Exchange batches of objects with the ASP SFTP server:
+    - the next batch is serialized while the previous one is uploading,
+    - the next feedback files are downloaded while the current one is processed.
+    Time spent in each phase is logged at the end of the command.
+    """
+
+    # Used in messages, e.g. "faulty employee record objects".
+    OBJECTS_NAME = None
+    # Number of feedback files downloaded ahead of the one being processed.
+    DOWNLOAD_WINDOW = 4
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timings = collections.Counter()
+        self._timings_lock = threading.Lock()
+        self._last_upload_at = None
+
+    @contextlib.contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._timings_lock:
+                self.timings[phase] += time.perf_counter() - start
+
+    def log_timings(self):
+        self.logger.info(
+            "Time spent per phase: %s",
+            ", ".join(f"{phase}={duration:.2f}s" for phase, duration in self.timings.items()) or "none",
+            extra={"timings": dict(self.timings)},
+        )
+
     def add_arguments(self, parser):
         """Subclasses have a preflight option to check for serialization errors."""
         parser.add_argument(
@@ -68,34 +138,26 @@ class EmployeeRecordTransferCommand(BaseCommand):
         Upload `json_data` (as byte array) to given SFTP connection `conn`.
         Returns uploaded filename if ok, `None` otherwise.
         """
-        # JSONRenderer produces *byte array* not strings
-        json_bytes = JSONRenderer().render(json_data)
-        remote_path = f"RIAE_FS_{timezone.now():%Y%m%d%H%M%S}.json"
+        remote_path = self._next_remote_path()
 
         if dry_run:
+            # JSONRenderer produces *byte array* not strings
+            json_bytes = JSONRenderer().render(json_data)
             self.stdout.write(f"DRY-RUN: (not) sending '{remote_path}' ({len(json_bytes)} bytes)")
             self.stdout.write(f"Content: \n{json_bytes}")
 
             return remote_path
 
-        # Using BytesIO objects allows to use them as files
-        # Cool side effect: no temporary file needed
-        json_stream = BytesIO(json_bytes)
-        # After creating a FileIO object, internal pointer is at the end of the buffer
-        # It must be set back to 0 (rewind) otherwise an empty file is sent
-        json_stream.seek(0)
-
         # ASP SFTP server does not return a proper list of transmitted files
         # Whether it's a bug or a paranoid security parameter
         # we must assert that there is no verification of the remote file existence
-        # This is the meaning of `confirm=False`
+        # This is why the file is written directly, without `put()` and its final `stat()`.
         try:
-            sftp.putfo(
-                json_stream,
-                f"{constants.ASP_FS_REMOTE_UPLOAD_DIR}/{remote_path}",
-                file_size=len(json_bytes),
-                confirm=False,
-            )
+            with self.timed("upload"):
+                with sftp.open(f"{constants.ASP_FS_REMOTE_UPLOAD_DIR}/{remote_path}", mode="wb") as remote_file:
+                    # Do not wait for the acknowledgement of each write.
+                    remote_file.set_pipelined(True)
+                    write_json(json_data, remote_file)
         except Exception as ex:
             self.stdout.write(f"Could not upload file: {remote_path}, reason: {ex}")
             return
@@ -103,9 +165,103 @@ class EmployeeRecordTransferCommand(BaseCommand):
 
         return remote_path
 
+    def _next_remote_path(self):
+        # File names have a one second resolution, and batches may now be uploaded within the same second.
+        upload_at = timezone.now().replace(microsecond=0)
+        if self._last_upload_at is not None and upload_at <= self._last_upload_at:
+            upload_at = self._last_upload_at + datetime.timedelta(seconds=1)
+        self._last_upload_at = upload_at
+        return f"RIAE_FS_{upload_at:%Y%m%d%H%M%S}.json"
+
+    def get_batch_serializer_class(self):
+        raise NotImplementedError()
+
+    def _save_sent_batch(self, elements, batch_data, remote_path):
+        raise NotImplementedError()
+
+    def _finish_upload(self, elements, batch_data, upload, dry_run):
+        raw_batch = EmployeeRecordBatch(elements)
+        try:
+            remote_path = upload.result()
+        except SerializationError as ex:
+            self.stdout.write(
+                f"Employee records serialization error during upload, can't process.\n"
+                f"You may want to use --preflight option to check faulty {self.OBJECTS_NAME} objects.\n"
+                f"Check batch details and error: {raw_batch=},\n{ex=}"
+            )
+            return
+        except Exception as ex:
+            # In any other case, bounce exception
+            raise ex from Exception(f"Unhandled error during upload phase for batch: {raw_batch=}")
+
+        if not remote_path:
+            self.stdout.write("Could not upload file, exiting ...")
+            return
+
+        # - update statuses (to SENT)
+        # - store in which file they have been seen
+        if dry_run:
+            self.stdout.write(f"DRY-RUN: Not *really* updating {self.OBJECTS_NAME} statuses")
+            return
+
+        with self.timed("save"):
+            self._save_sent_batch(elements, batch_data, remote_path)
+
+    def upload_batches(self, sftp: paramiko.SFTPClient, batches, dry_run: bool):
+        """
+        Render each batch of objects in JSON format then send it to SFTP upload folder.
+
+        Serialization needs the database and stays in the current thread,
+        the upload of the previous batch happens meanwhile in another thread.
+        """
+        serializer_class = self.get_batch_serializer_class()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = None
+            for elements in batches:
+                with self.timed("serialize"):
+                    batch_data = serializer_class(EmployeeRecordBatch(elements)).data
+                if pending:
+                    self._finish_upload(*pending, dry_run)
+                upload = executor.submit(self.upload_json_file, batch_data, sftp, dry_run)
+                pending = (elements, batch_data, upload)
+            if pending:
+                self._finish_upload(*pending, dry_run)
+
     def _parse_feedback_file(self, feedback_file: str, batch: dict, dry_run: bool) -> int:
         raise NotImplementedError()
 
+    def _open_feedback_files(self, sftp: paramiko.SFTPClient, filenames):
+        """
+        Yield `(filename, remote file or exception)`.
+
+        The next `DOWNLOAD_WINDOW` files are opened and prefetched: paramiko downloads them
+        in the background while the current one is processed.
+        """
+        filenames = iter(filenames)
+        opened = collections.deque()
+
+        def open_next():
+            for filename in filenames:
+                try:
+                    remote_file = sftp.file(filename, mode="r")
+                    remote_file.prefetch()
+                except Exception as ex:
+                    remote_file = ex
+                opened.append((filename, remote_file))
+                return
+
+        for _ in range(self.DOWNLOAD_WINDOW):
+            open_next()
+        try:
+            while opened:
+                filename, remote_file = opened.popleft()
+                open_next()
+                yield filename, remote_file
+        finally:
+            for _filename, remote_file in opened:
+                if not isinstance(remote_file, Exception):
+                    remote_file.close()
+
     def download_json_file(self, sftp: paramiko.SFTPClient, dry_run: bool):
         self.stdout.write("Starting DOWNLOAD of feedback files")
 
@@ -117,13 +273,18 @@ class EmployeeRecordTransferCommand(BaseCommand):
 
         parser = JSONParser()
         successfully_parsed_files = 0
-        for filename in result_files:
+        for filename, result_file in self._open_feedback_files(sftp, result_files):
             errors_in_file = 0  # Number of errors per file
             self.stdout.write(f"Fetching file: {filename}")
             try:
-                with sftp.file(filename, mode="r") as result_file:
-                    # Parse and update employee records with feedback
-                    errors_in_file = self._parse_feedback_file(filename, parser.parse(result_file), dry_run)
+                if isinstance(result_file, Exception):
+                    raise result_file
+                with result_file:
+                    with self.timed("download"):
+                        batch = parser.parse(result_file)
+                # Parse and update employee records with feedback
+                with self.timed("process"):
+                    errors_in_file = self._parse_feedback_file(filename, batch, dry_run)
             except Exception as ex:
                 errors_in_file += 1
                 self.stdout.write(f"Error while parsing file {filename}: {ex=}")
@@ -1,12 +1,13 @@
 import paramiko
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 from rest_framework.renderers import JSONRenderer
 from sentry_sdk.crons import monitor
 
-from itou.approvals.models import Approval
+from itou.approvals.models import Approval, Prolongation, Suspension
 from itou.employee_record.enums import MovementType, Status
-from itou.employee_record.exceptions import SerializationError
 from itou.employee_record.mocks.fake_serializers import TestEmployeeRecordBatchSerializer
 from itou.employee_record.models import EmployeeRecord, EmployeeRecordBatch, EmployeeRecordUpdateNotification
 from itou.employee_record.serializers import EmployeeRecordBatchSerializer
@@ -16,47 +17,24 @@ from ...common_management import EmployeeRecordTransferCommand
 
 
 class Command(EmployeeRecordTransferCommand):
-    def _upload_batch_file(self, sftp: paramiko.SFTPClient, employee_records: list[EmployeeRecord], dry_run: bool):
-        """
-        Render a list of employee records in JSON format then send it to SFTP upload folder
-        """
-        raw_batch = EmployeeRecordBatch(employee_records)
+    OBJECTS_NAME = "employee record"
+
+    def get_batch_serializer_class(self):
         # Ability to use ASP test serializers (using fake SIRET numbers)
         if self.asp_test:
-            batch_data = TestEmployeeRecordBatchSerializer(raw_batch).data
-        else:
-            batch_data = EmployeeRecordBatchSerializer(raw_batch).data
-
-        try:
-            remote_path = self.upload_json_file(batch_data, sftp, dry_run)
-        except SerializationError as ex:
-            self.stdout.write(
-                f"Employee records serialization error during upload, can't process.\n"
-                f"You may want to use --preflight option to check faulty employee record objects.\n"
-                f"Check batch details and error: {raw_batch=},\n{ex=}"
+            return TestEmployeeRecordBatchSerializer
+        return EmployeeRecordBatchSerializer
+
+    def _save_sent_batch(self, employee_records: list[EmployeeRecord], batch_data, remote_path: str):
+        # Now that file is transferred, update employee records status (SENT)
+        # and store in which file they have been sent
+        renderer = JSONRenderer()
+        for idx, employee_record in enumerate(employee_records, 1):
+            employee_record.update_as_sent(
+                remote_path, idx, renderer.render(batch_data["lignesTelechargement"][idx - 1]), commit=False
             )
-            return
-        except Exception as ex:
-            # In any other case, bounce exception
-            raise ex from Exception(f"Unhandled error during upload phase for batch: {raw_batch=}")
-        else:
-            if not remote_path:
-                self.stdout.write("Could not upload file, exiting ...")
-                return
-
-            # - update employee record notifications status (to SENT)
-            # - store in which file they have been seen
-            if dry_run:
-                self.stdout.write("DRY-RUN: Not *really* updating employee records statuses")
-                return
-
-            # Now that file is transferred, update employee records status (SENT)
-            # and store in which file they have been sent
-            renderer = JSONRenderer()
-            for idx, employee_record in enumerate(employee_records, 1):
-                employee_record.update_as_sent(
-                    remote_path, idx, renderer.render(batch_data["lignesTelechargement"][idx - 1])
-                )
+        with transaction.atomic():
+            EmployeeRecord.bulk_save_transitions(employee_records)
 
     def _parse_feedback_file(self, feedback_file: str, batch: dict, dry_run: bool) -> int:
         """
@@ -88,6 +66,14 @@ class Command(EmployeeRecordTransferCommand):
             )
             return 1
 
+        # Now we must find the matching FS, with a single query for the whole file
+        employee_records = {
+            employee_record.asp_batch_line_number: employee_record
+            for employee_record in self.get_employee_records().filter(asp_batch_file=batch_filename)
+        }
+        updated_employee_records = []
+        duplicated_employee_records = []
+
         for idx, raw_employee_record in enumerate(records, 1):
             line_number = raw_employee_record.get("numLigne")
             processing_code = raw_employee_record.get("codeTraitement")
@@ -100,8 +86,7 @@ class Command(EmployeeRecordTransferCommand):
                 record_errors += 1
                 continue
 
-            # Now we must find the matching FS
-            employee_record = EmployeeRecord.objects.find_by_batch(batch_filename, line_number).first()
+            employee_record = employee_records.get(int(line_number))
 
             if not employee_record:
                 self.stdout.write(f"Could not get existing employee record data: {batch_filename=}, {line_number=}")
@@ -118,7 +103,10 @@ class Command(EmployeeRecordTransferCommand):
                 if not dry_run:
                     try:
                         if employee_record.status != Status.PROCESSED:
-                            employee_record.update_as_processed(processing_code, processing_label, archived_json)
+                            employee_record.update_as_processed(
+                                processing_code, processing_label, archived_json, commit=False
+                            )
+                            updated_employee_records.append(employee_record)
                         else:
                             self.stdout.write(f"Already accepted: {employee_record=}")
                     except Exception as ex:
@@ -141,37 +129,62 @@ class Command(EmployeeRecordTransferCommand):
                     if processing_code == EmployeeRecord.ASP_DUPLICATE_ERROR_CODE:
                         employee_record.status = Status.REJECTED
                         employee_record.asp_processing_code = EmployeeRecord.ASP_DUPLICATE_ERROR_CODE
-                        employee_record.update_as_processed_as_duplicate(archived_json)
-
-                        # If the ASP mark the employee record as duplicate,
-                        # and there is a suspension or a prolongation for the associated approval,
-                        # then we create a notification to be sure the ASP has the correct end date.
-                        try:
-                            approval = Approval.objects.get(number=employee_record.approval_number)
-                        except Approval.DoesNotExist:
-                            pass  # No point to send a notification about an approval if it doesn't exist
-                        else:
-                            if approval.suspension_set.exists() or approval.prolongation_set.exists():
-                                # Mimic the SQL trigger function "create_employee_record_notification()"
-                                EmployeeRecordUpdateNotification.objects.update_or_create(
-                                    status=Status.NEW,
-                                    employee_record=employee_record,
-                                    defaults={"updated_at": timezone.now},
-                                )
-
+                        employee_record.update_as_processed_as_duplicate(archived_json, commit=False)
+                        updated_employee_records.append(employee_record)
+                        duplicated_employee_records.append(employee_record)
                         continue
 
                     # Fixes unexpected stop on multiple pass on the same file
                     if employee_record.status != Status.REJECTED:
                         # Standard error / rejection processing
-                        employee_record.update_as_rejected(processing_code, processing_label, archived_json)
+                        employee_record.update_as_rejected(
+                            processing_code, processing_label, archived_json, commit=False
+                        )
+                        updated_employee_records.append(employee_record)
                     else:
                         self.stdout.write(f"Already rejected: {employee_record=}")
                 else:
                     self.stdout.write(f"DRY-RUN: Rejected {employee_record=}, {processing_code=}, {processing_label=}")
 
+        with transaction.atomic():
+            EmployeeRecord.bulk_save_transitions(updated_employee_records)
+            self._notify_extended_duplicates(duplicated_employee_records)
+
         return record_errors
 
+    def _notify_extended_duplicates(self, employee_records):
+        """
+        If the ASP mark the employee record as duplicate,
+        and there is a suspension or a prolongation for the associated approval,
+        then we create a notification to be sure the ASP has the correct end date.
+        """
+        if not employee_records:
+            return
+        # No point to send a notification about an approval if it doesn't exist
+        extended_approval_numbers = set(
+            Approval.objects.filter(
+                number__in={employee_record.approval_number for employee_record in employee_records}
+            )
+            .filter(
+                Exists(Suspension.objects.filter(approval=OuterRef("pk")))
+                | Exists(Prolongation.objects.filter(approval=OuterRef("pk")))
+            )
+            .values_list("number", flat=True)
+        )
+        for employee_record in employee_records:
+            if employee_record.approval_number in extended_approval_numbers:
+                # Mimic the SQL trigger function "create_employee_record_notification()"
+                EmployeeRecordUpdateNotification.objects.update_or_create(
+                    status=Status.NEW,
+                    employee_record=employee_record,
+                    defaults={"updated_at": timezone.now},
+                )
+
+    @staticmethod
+    def get_employee_records():
+        # Everything needed by the serializers and by `EmployeeRecord.clean()`.
+        return EmployeeRecord.objects.full_fetch().select_related("job_application__to_company__convention")
+
     @monitor(monitor_slug="transfer-employee-records-download")
     def download(self, sftp: paramiko.SFTPClient, dry_run: bool):
         """Fetch and process feedback ASP files for employee records"""
@@ -183,9 +196,8 @@ class Command(EmployeeRecordTransferCommand):
         Upload a file composed of all ready employee records
         """
         self.stdout.write("Starting UPLOAD of employee records")
-        ready_employee_records = EmployeeRecord.objects.filter(status=Status.READY)
-        for batch in chunks(ready_employee_records, EmployeeRecordBatch.MAX_EMPLOYEE_RECORDS):
-            self._upload_batch_file(sftp, batch, dry_run)
+        ready_employee_records = self.get_employee_records().filter(status=Status.READY)
+        self.upload_batches(sftp, chunks(ready_employee_records, EmployeeRecordBatch.MAX_EMPLOYEE_RECORDS), dry_run)
 
     def handle(self, *, upload, download, preflight, wet_run, asp_test=False, debug=False, **options):
         if preflight:
@@ -213,5 +225,6 @@ class Command(EmployeeRecordTransferCommand):
                     self.download(sftp, not wet_run)
 
             self.stdout.write("Employee records processing done!")
+            self.log_timings()
         else:
             self.stdout.write("No valid options (upload, download or preflight) were given")
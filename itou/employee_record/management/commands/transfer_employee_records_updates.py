@@ -4,7 +4,6 @@ from rest_framework.renderers import JSONRenderer
 from sentry_sdk.crons import monitor
 
 from itou.employee_record.enums import MovementType, NotificationStatus, Status
-from itou.employee_record.exceptions import SerializationError
 from itou.employee_record.mocks.fake_serializers import TestEmployeeRecordUpdateNotificationBatchSerializer
 from itou.employee_record.models import EmployeeRecordBatch, EmployeeRecordUpdateNotification
 from itou.employee_record.serializers import EmployeeRecordUpdateNotificationBatchSerializer
@@ -20,49 +19,18 @@ class Command(EmployeeRecordTransferCommand):
     - download feedback files of previous upload operations,
     """
 
-    def _upload_batch_file(
-        self, sftp: paramiko.SFTPClient, notifications: list[EmployeeRecordUpdateNotification], dry_run: bool
-    ):
-        """
-        - render the list of employee record notifications in JSON
-        - send it to ASP remote folder.
-        """
-        raw_batch = EmployeeRecordBatch(notifications)
+    OBJECTS_NAME = "notification"
+
+    def get_batch_serializer_class(self):
         # Ability to use ASP test serializers (using fake SIRET numbers)
         if self.asp_test:
-            batch_data = TestEmployeeRecordUpdateNotificationBatchSerializer(raw_batch).data
-        else:
-            batch_data = EmployeeRecordUpdateNotificationBatchSerializer(raw_batch).data
-
-        try:
-            # accessing .data triggers serialization
-            remote_path = self.upload_json_file(batch_data, sftp, dry_run)
-        except SerializationError as ex:
-            self.stdout.write(
-                f"Employee records serialization error during upload, can't process.\n"
-                f"You may want to use --preflight option to check faulty notification objects.\n"
-                f"Check batch details and error: {raw_batch=},\n{ex=}"
-            )
-            return
-        except Exception as ex:
-            # In any other case, bounce exception
-            raise ex from Exception(f"Unhandled error during upload phase for batch: {raw_batch=}")
-        else:
-            if not remote_path:
-                self.stdout.write("Could not upload file, exiting ...")
-                return
-
-            # - update employee record notifications status (to SENT)
-            # - store in which file they have been seen
-            if dry_run:
-                self.stdout.write("DRY-RUN: Not *really* updating notification statuses")
-                return
+            return TestEmployeeRecordUpdateNotificationBatchSerializer
+        return EmployeeRecordUpdateNotificationBatchSerializer
 
-            renderer = JSONRenderer()
-            for idx, notification in enumerate(notifications, 1):
-                notification.update_as_sent(
-                    remote_path, idx, renderer.render(batch_data["lignesTelechargement"][idx - 1])
-                )
+    def _save_sent_batch(self, notifications: list[EmployeeRecordUpdateNotification], batch_data, remote_path: str):
+        renderer = JSONRenderer()
+        for idx, notification in enumerate(notifications, 1):
+            notification.update_as_sent(remote_path, idx, renderer.render(batch_data["lignesTelechargement"][idx - 1]))
 
     def _parse_feedback_file(self, feedback_file: str, batch: dict, dry_run: bool) -> int:
         """
@@ -147,8 +115,7 @@ class Command(EmployeeRecordTransferCommand):
         else:
             self.stdout.write("No new employee record notification found")
 
-        for batch in chunks(new_notifications, EmployeeRecordBatch.MAX_EMPLOYEE_RECORDS):
-            self._upload_batch_file(sftp, batch, dry_run)
+        self.upload_batches(sftp, chunks(new_notifications, EmployeeRecordBatch.MAX_EMPLOYEE_RECORDS), dry_run)
 
     def handle(self, *, upload, download, preflight, wet_run, asp_test=False, debug=False, **options):
         if preflight:
@@ -176,5 +143,6 @@ class Command(EmployeeRecordTransferCommand):
                     self.download(sftp, not wet_run)
 
             self.stdout.write("Employee record notifications processing done!")
+            self.log_timings()
         else:
             self.stdout.write("No valid options (upload, download or preflight) were given")
@@ -164,6 +164,19 @@ class EmployeeRecord(ASPExchangeInformation):
 
     CAN_BE_DISABLED_STATES = [Status.NEW, Status.REJECTED, Status.PROCESSED]
 
+    # Fields changed by the ASP exchange transitions, see `bulk_save_transitions()`.
+    TRANSITION_FIELDS = [
+        "status",
+        "asp_batch_file",
+        "asp_batch_line_number",
+        "asp_processing_code",
+        "asp_processing_label",
+        "archived_json",
+        "processed_at",
+        "processed_as_duplicate",
+        "updated_at",
+    ]
+
     ASP_MOVEMENT_TYPE = MovementType.CREATION
 
     created_at = models.DateTimeField(verbose_name="date de création", default=timezone.now)
@@ -302,7 +315,7 @@ class EmployeeRecord(ASPExchangeInformation):
         self.status = Status.READY
         self.save()
 
-    def update_as_sent(self, asp_filename, line_number, archive):
+    def update_as_sent(self, asp_filename, line_number, archive, *, commit=True):
         """
         An employee record is sent to ASP via a JSON file,
         The file name is stored for further feedback processing (also done via a file)
@@ -316,9 +329,10 @@ class EmployeeRecord(ASPExchangeInformation):
         self.status = Status.SENT
         self.set_asp_batch_information(asp_filename, line_number, archive)
 
-        self.save()
+        if commit:
+            self.save()
 
-    def update_as_rejected(self, code, label, archive):
+    def update_as_rejected(self, code, label, archive, *, commit=True):
         """
         Update status after an ASP rejection of the employee record
 
@@ -331,9 +345,10 @@ class EmployeeRecord(ASPExchangeInformation):
         self.status = Status.REJECTED
         self.set_asp_processing_information(code, label, archive)
 
-        self.save()
+        if commit:
+            self.save()
 
-    def update_as_processed(self, code, label, archive):
+    def update_as_processed(self, code, label, archive, *, commit=True):
         if not self.status == Status.SENT:
             raise InvalidStatusError(self.ERROR_EMPLOYEE_RECORD_INVALID_STATE)
 
@@ -342,7 +357,8 @@ class EmployeeRecord(ASPExchangeInformation):
         self.processed_at = timezone.now()
         self.set_asp_processing_information(code, label, archive)
 
-        self.save()
+        if commit:
+            self.save()
 
     def update_as_disabled(self):
         if not self.can_be_disabled:
@@ -387,7 +403,7 @@ class EmployeeRecord(ASPExchangeInformation):
 
         self.save(update_fields=["status"])
 
-    def update_as_processed_as_duplicate(self, archive):
+    def update_as_processed_as_duplicate(self, archive, *, commit=True):
         """
         Force status to `PROCESSED` if the employee record has been marked
         as duplicate by ASP (error code 3436).
@@ -407,7 +423,20 @@ class EmployeeRecord(ASPExchangeInformation):
         self.processed_as_duplicate = True
         self.set_asp_processing_information(self.ASP_DUPLICATE_ERROR_CODE, "Statut forcé suite à doublon ASP", archive)
 
-        self.save()
+        if commit:
+            self.save()
+
+    @classmethod
+    def bulk_save_transitions(cls, employee_records):
+        """
+        Save employee records updated with `commit=False` by the `update_as_*()` transitions above,
+        with a few UPDATE queries.
+        """
+        now = timezone.now()
+        for employee_record in employee_records:
+            # `auto_now` is not applied by `bulk_update()`.
+            employee_record.updated_at = now
+        cls.objects.bulk_update(employee_records, cls.TRANSITION_FIELDS, batch_size=1000)
 
     @property
     def can_be_disabled(self):
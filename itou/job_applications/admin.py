@@ -93,6 +93,8 @@ class JobApplicationAdmin(InconsistencyCheckMixin, ItouModelAdmin):
     readonly_fields = (
         "created_at",
         "updated_at",
+        "last_change_at",
+        "accepted_at",
         "approval_number_sent_at",
         "approval_manually_delivered_by",
         "approval_manually_refused_by",
@@ -177,6 +179,8 @@ class JobApplicationAdmin(InconsistencyCheckMixin, ItouModelAdmin):
                     "transferred_from",
                     "created_at",
                     "updated_at",
+                    "last_change_at",
+                    "accepted_at",
                 ]
             },
         ),
@@ -1,6 +1,20 @@
+import enum
+import hashlib
+import json
+import time
+
+from django.core.cache import caches
+from django.db.models import Prefetch, prefetch_related_objects
+
+from itou.approvals.models import Approval
+from itou.companies.models import Company
+from itou.eligibility.models import EligibilityDiagnosis
 from itou.job_applications.enums import SenderKind
+from itou.prescribers.models import PrescriberOrganization
 from itou.users.enums import Title
-from itou.utils.export import to_streaming_response
+from itou.users.models import User
+from itou.utils.export import to_storage, to_streaming_response
+from itou.utils.perms.prescriber import get_all_available_job_applications_for_prescriber
 
 
 JOB_APPLICATION_CSV_HEADERS = [
@@ -52,16 +66,15 @@ def _get_prescriber_username(job_application):
 
 
 def _get_selected_jobs(job_application):
-    selected_jobs = "Candidature spontanée"
-    if job_application.selected_jobs.exists:
-        selected_jobs = " ".join(map(lambda j: j.display_name, job_application.selected_jobs.all()))
-    return selected_jobs
+    return " ".join(map(lambda j: j.display_name, job_application.selected_jobs.all()))
 
 
-def _get_eligibility_status(job_application):
+def _get_eligibility_status(job_application, job_seekers_with_valid_diagnosis):
     eligibility = "non"
     # Eligibility diagnoses made by SIAE are ignored.
-    if job_application.job_seeker.has_valid_diagnosis():
+    if job_application.job_seeker.has_valid_common_approval or (
+        job_application.job_seeker_id in job_seekers_with_valid_diagnosis
+    ):
         eligibility = "oui"
 
     return eligibility
@@ -92,7 +105,37 @@ def _resolve_title(title, nir):
     return ""
 
 
-def _serialize_job_application(job_application):
+def _preload_related_data(job_applications):
+    """
+    Load the data read by `_serialize_job_application` with a few queries for the whole batch,
+    instead of several queries per job application.
+
+    The latest approvals of the job seekers are primed on their cached properties.
+    Returns the pks of the job seekers with a valid diagnosis made by a prescriber.
+    """
+    prefetch_related_objects(
+        job_applications,
+        "job_seeker__jobseeker_profile",
+        "to_company",
+        "sender",
+        "sender_prescriber_organization",
+        "selected_jobs__appellation",
+        Prefetch("job_seeker__approvals", queryset=Approval.objects.order_by("-start_at")),
+        "job_seeker__approvals__suspension_set",
+    )
+
+    job_seekers = [job_application.job_seeker for job_application in job_applications]
+    User.prefetch_latest_common_approvals(job_seekers)
+
+    return set(
+        EligibilityDiagnosis.objects.valid()
+        .by_author_kind_prescriber()
+        .filter(job_seeker_id__in={job_seeker.pk for job_seeker in job_seekers})
+        .values_list("job_seeker_id", flat=True)
+    )
+
+
+def _serialize_job_application(job_application, job_seekers_with_valid_diagnosis):
     job_seeker = job_application.job_seeker
     company = job_application.to_company
 
@@ -126,7 +169,7 @@ def _serialize_job_application(job_application):
         _format_date(job_application.hiring_start_at),
         _format_date(job_application.hiring_end_at),
         job_application.get_refusal_reason_display(),
-        _get_eligibility_status(job_application),
+        _get_eligibility_status(job_application, job_seekers_with_valid_diagnosis),
         numero_pass_iae,
         _format_date(approval_start_date),
         _format_date(approval_end_date),
@@ -134,8 +177,13 @@ def _serialize_job_application(job_application):
     ]
 
 
-def _job_applications_serializer(queryset):
-    return [_serialize_job_application(job_application) for job_application in queryset]
+def _job_applications_serializer(job_applications):
+    # Called by `xlsx_streaming` for each batch of job applications.
+    job_seekers_with_valid_diagnosis = _preload_related_data(job_applications)
+    return [
+        _serialize_job_application(job_application, job_seekers_with_valid_diagnosis)
+        for job_application in job_applications
+    ]
 
 
 def stream_xlsx_export(job_applications, filename):
@@ -149,3 +197,97 @@ def stream_xlsx_export(job_applications, filename):
         JOB_APPLICATION_CSV_HEADERS,
         _job_applications_serializer,
     )
+
+
+# Exports built in the background
+# -------------------------------
+
+# Identical exports requested during that period reuse the same file.
+EXPORT_CACHE_TIMEOUT = 60 * 60
+# A pending export without progress for that long is considered lost (e.g. the worker restarted).
+EXPORT_STALE_AFTER = 10 * 60
+
+
+class ExportState(enum.StrEnum):
+    PENDING = "pending"
+    READY = "ready"
+    FAILED = "failed"
+
+
+def export_cache_key(params):
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f"job-applications-export:{digest}"
+
+
+def get_export(cache_key):
+    """
+    Return the state of an export: a dict with the `state`, the number of job applications
+    `done` out of `total`, and the `file` name in the default storage once ready.
+    """
+    return caches["default"].get(cache_key)
+
+
+def set_export(cache_key, state, *, done=0, total=None, file=None):
+    export = {"state": state, "done": done, "total": total, "file": file, "updated_at": time.time()}
+    caches["default"].set(cache_key, export, EXPORT_CACHE_TIMEOUT)
+    return export
+
+
+def should_start_export(export):
+    if export is None or export["state"] == ExportState.FAILED:
+        return True
+    return export["state"] == ExportState.PENDING and time.time() - export["updated_at"] > EXPORT_STALE_AFTER
+
+
+def claim_export(cache_key, export):
+    """
+    Mark the export as pending. Return False when a concurrent request already started it.
+    """
+    if export is None:
+        pending = {"state": ExportState.PENDING, "done": 0, "total": None, "file": None, "updated_at": time.time()}
+        return caches["default"].add(cache_key, pending, EXPORT_CACHE_TIMEOUT)
+    set_export(cache_key, ExportState.PENDING)
+    return True
+
+
+def get_job_applications_to_export(params):
+    """
+    `params` describes the exported job applications with JSON serializable values, to be sent to
+    a task and used as a cache key.
+    """
+    if params["export_for"] == "siae":
+        job_applications = Company.objects.get(pk=params["company"]).job_applications_received.not_archived()
+    else:
+        prescriber_organization = None
+        if params["organization"]:
+            prescriber_organization = PrescriberOrganization.objects.get(pk=params["organization"])
+        job_applications = get_all_available_job_applications_for_prescriber(
+            User.objects.get(pk=params["user"]), prescriber_organization
+        )
+    job_applications = job_applications.with_list_related_data()
+    if params["month_identifier"]:
+        year, month = params["month_identifier"].split("-")
+        job_applications = job_applications.created_on_given_year_and_month(year, month)
+    return job_applications
+
+
+def save_xlsx_export(cache_key, params, filename):
+    done = 0
+    total = None
+
+    def serializer(job_applications):
+        nonlocal done
+        rows = _job_applications_serializer(job_applications)
+        done += len(job_applications)
+        set_export(cache_key, ExportState.PENDING, done=done, total=total)
+        return rows
+
+    try:
+        job_applications = get_job_applications_to_export(params)
+        total = job_applications.count()
+        set_export(cache_key, ExportState.PENDING, done=done, total=total)
+        file = to_storage(job_applications, filename, JOB_APPLICATION_CSV_HEADERS, serializer)
+    except Exception:
+        set_export(cache_key, ExportState.FAILED, done=done, total=total)
+        raise
+    return set_export(cache_key, ExportState.READY, done=total, total=total, file=file)
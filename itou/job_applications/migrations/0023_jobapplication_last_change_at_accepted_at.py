@@ -0,0 +1,23 @@
+# Generated by Django 4.2.8 on 2026-10-16 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("job_applications", "0022_jobapplication_diagoriente_invite_sent_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jobapplication",
+            name="accepted_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name="date d'acceptation"),
+        ),
+        # Nullable until it is filled by the next migration, to avoid rewriting the table.
+        migrations.AddField(
+            model_name="jobapplication",
+            name="last_change_at",
+            field=models.DateTimeField(db_index=True, null=True, verbose_name="date de dernière transition"),
+        ),
+    ]
@@ -0,0 +1,59 @@
+import time
+
+from django.db import migrations
+from django.db.models import Case, DateTimeField, F, OuterRef, Subquery, When
+from django.db.models.functions import Cast, Coalesce, Greatest
+
+from itou.job_applications.enums import Origin
+
+
+BATCH_SIZE = 5_000
+
+
+def _fill_last_change_at_and_accepted_at(apps, schema_editor):
+    JobApplication = apps.get_model("job_applications", "JobApplication")
+    JobApplicationTransitionLog = apps.get_model("job_applications", "JobApplicationTransitionLog")
+
+    last_transition_at = Subquery(
+        JobApplicationTransitionLog.objects.filter(job_application=OuterRef("pk"))
+        .order_by("-timestamp")
+        .values("timestamp")[:1]
+    )
+    last_accept_at = Subquery(
+        JobApplicationTransitionLog.objects.filter(job_application=OuterRef("pk"), transition="accept")
+        .order_by("-timestamp")
+        .values("timestamp")[:1]
+    )
+    accepted_at = Case(
+        # Mega Super duper special case to handle job applications created to generate AI's PASS IAE
+        When(origin=Origin.AI_STOCK, then=Cast("hiring_start_at", output_field=DateTimeField())),
+        When(origin=Origin.PE_APPROVAL, then=F("created_at")),
+        # A job_application created at the accepted status will not have transitions logs
+        When(state="accepted", then=Coalesce(last_accept_at, F("created_at"))),
+        default=last_accept_at,
+    )
+
+    # Job applications created since the previous migration already have their dates.
+    job_applications = JobApplication.objects.filter(last_change_at=None).order_by("pk")
+    updated = 0
+    start = time.perf_counter()
+    # Each batch is committed on its own (the migration is not atomic).
+    while batch := list(job_applications.values_list("pk", flat=True)[:BATCH_SIZE]):
+        # Greatest() ignores NULL values: job applications without logs fall back on `created_at`.
+        updated += JobApplication.objects.filter(pk__in=batch).update(
+            last_change_at=Greatest("created_at", last_transition_at),
+            accepted_at=accepted_at,
+        )
+        print(f"{updated} job applications filled in {time.perf_counter() - start:.2f} sec")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("job_applications", "0023_jobapplication_last_change_at_accepted_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(_fill_last_change_at_and_accepted_at, migrations.RunPython.noop, elidable=True),
+    ]
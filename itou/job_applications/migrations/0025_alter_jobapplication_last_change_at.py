@@ -0,0 +1,18 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("job_applications", "0024_fill_jobapplication_last_change_at_accepted_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="jobapplication",
+            name="last_change_at",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now, verbose_name="date de dernière transition"
+            ),
+        ),
+    ]
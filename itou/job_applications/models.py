@@ -1,14 +1,16 @@
 import datetime
 import uuid
 
+import xworkflows
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import Case, Count, Exists, F, Max, OuterRef, Prefetch, Q, Subquery, When
-from django.db.models.functions import Coalesce, Greatest, TruncMonth
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce, TruncMonth
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django_xworkflows import models as xwf_models
 
 from itou.approvals.models import Approval, Prolongation, Suspension
@@ -181,38 +183,6 @@ class JobApplicationQuerySet(models.QuerySet):
         has_suspended_approval = Suspension.objects.filter(approval=OuterRef("approval")).in_progress()
         return self.annotate(has_suspended_approval=Exists(has_suspended_approval))
 
-    # We should store this in dedicated field and update it at each model.save()
-    def with_last_change(self):
-        return self.annotate(last_change=Greatest("created_at", Max("logs__timestamp")))
-
-    def with_accepted_at(self):
-        created_at_from_transition = Subquery(
-            JobApplicationTransitionLog.objects.filter(
-                job_application=OuterRef("pk"),
-                transition=JobApplicationWorkflow.TRANSITION_ACCEPT,
-            )
-            .order_by("-timestamp")
-            .values("timestamp")[0:1],
-        )
-        return self.annotate(
-            accepted_at=Case(
-                # Mega Super duper special case to handle job applications created to generate AI's PASS IAE
-                When(
-                    origin=Origin.AI_STOCK,
-                    then=F("hiring_start_at"),
-                ),
-                When(origin=Origin.PE_APPROVAL, then=F("created_at")),
-                When(
-                    state=JobApplicationWorkflow.STATE_ACCEPTED,
-                    # A job_application created at the accepted status will
-                    # not have transitions logs, fallback on created_at
-                    then=Coalesce(created_at_from_transition, F("created_at")),
-                ),
-                default=created_at_from_transition,
-                output_field=models.DateTimeField(),
-            )
-        )
-
     def with_jobseeker_eligibility_diagnosis(self):
         """
         Gives the "eligibility_diagnosis" linked to the job application or if none is found
@@ -252,6 +222,25 @@ class JobApplicationQuerySet(models.QuerySet):
         )
         return self.annotate(**{f"eligibility_diagnosis_criterion_{criterion}": Exists(subquery)})
 
+    def with_eligibility_diagnosis_criteria(self, criteria):
+        """
+        Add an annotation by selected criterion, given the `jobseeker_eligibility_diagnosis` annotation.
+        """
+        qs = self
+        for criterion in criteria:
+            # The criterion given to this method is a primary key of an AdministrativeCriteria
+            qs = qs.with_eligibility_diagnosis_criterion(int(criterion))
+        return qs
+
+    def with_list_filters_data(self, criteria=None):
+        """
+        Only the annotations needed by the filters of job applications's lists,
+        e.g. to count the filtered job applications without the cost of `with_list_related_data()`.
+        """
+        if not criteria:
+            return self
+        return self.with_jobseeker_eligibility_diagnosis().with_eligibility_diagnosis_criteria(criteria)
+
     def with_list_related_data(self, criteria=None):
         """
         Stop the deluge of database queries that is caused by accessing related
@@ -273,12 +262,7 @@ class JobApplicationQuerySet(models.QuerySet):
             Prefetch("job_seeker__approvals", queryset=Approval.objects.order_by("-start_at")),
         )
 
-        qs = qs.with_last_change().with_jobseeker_eligibility_diagnosis()
-
-        # Adding an annotation by selected criterion
-        for criterion in criteria:
-            # The criterion given to this method is a primary key of an AdministrativeCriteria
-            qs = qs.with_eligibility_diagnosis_criterion(int(criterion))
+        qs = qs.with_jobseeker_eligibility_diagnosis().with_eligibility_diagnosis_criteria(criteria)
 
         # Many job applications from AI exports share the exact same `created_at` value thus we secondarily order
         # by pk to prevent flakyness in the resulting pagination (a same job application appearing both on page 1
@@ -625,6 +609,11 @@ class JobApplication(xwf_models.WorkflowEnabled, models.Model):
 
     created_at = models.DateTimeField(verbose_name="date de création", default=timezone.now, db_index=True)
     updated_at = models.DateTimeField(verbose_name="date de modification", auto_now=True, db_index=True)
+    # Denormalized from the transition logs, maintained by the workflow hooks below.
+    last_change_at = models.DateTimeField(
+        verbose_name="date de dernière transition", default=timezone.now, db_index=True
+    )
+    accepted_at = models.DateTimeField(verbose_name="date d'acceptation", blank=True, null=True, db_index=True)
 
     # GEIQ only
     prehiring_guidance_days = models.PositiveSmallIntegerField(
@@ -747,8 +736,22 @@ class JobApplication(xwf_models.WorkflowEnabled, models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
+        self.accepted_at = self._get_accepted_at()
         return super().save(*args, **kwargs)
 
+    def _get_accepted_at(self):
+        # Mega Super duper special case to handle job applications created to generate AI's PASS IAE
+        if self.origin == Origin.AI_STOCK:
+            if self.hiring_start_at is None:
+                return None
+            return datetime.datetime.combine(self.hiring_start_at, datetime.time(), datetime.UTC)
+        if self.origin == Origin.PE_APPROVAL:
+            return self.created_at
+        if self.state.is_accepted and self.accepted_at is None:
+            # A job_application created at the accepted status will not have transitions logs
+            return self.created_at
+        return self.accepted_at
+
     @property
     def is_pending(self):
         return self.state in JobApplicationWorkflow.PENDING_STATES
@@ -769,7 +772,7 @@ class JobApplication(xwf_models.WorkflowEnabled, models.Model):
     def is_spontaneous(self):
         return not self.selected_jobs.exists()
 
-    @property
+    @cached_property
     def eligibility_diagnosis_by_siae_required(self):
         """
         Returns True if an eligibility diagnosis must be made by an SIAE
@@ -947,6 +950,14 @@ class JobApplication(xwf_models.WorkflowEnabled, models.Model):
 
     # Workflow transitions.
 
+    @xworkflows.before_transition()
+    def update_last_change_at(self, *args, **kwargs):
+        self.last_change_at = timezone.now()
+
+    @xworkflows.before_transition(JobApplicationWorkflow.TRANSITION_ACCEPT)
+    def update_accepted_at(self, *args, **kwargs):
+        self.accepted_at = timezone.now()
+
     @xwf_models.transition()
     def process(self, *args, **kwargs):
         pass
@@ -0,0 +1,42 @@
+from huey.contrib.djhuey import db_task, lock_task
+from huey.exceptions import TaskLockedException
+
+from itou.job_applications.export import (
+    ExportState,
+    claim_export,
+    export_cache_key,
+    get_export,
+    save_xlsx_export,
+    set_export,
+    should_start_export,
+)
+
+
+# Exports take minutes and share the workers with the emails: build them one at a time.
+# Created at import time, so that the consumer flushes it on startup (see the HUEY setting).
+export_lock = lock_task("job-applications-xlsx-export")
+# Seconds before trying again to start an export waiting for the running one.
+EXPORT_WAIT_DELAY = 30
+
+
+@db_task()
+def huey_save_xlsx_export(cache_key, params, filename):
+    try:
+        with export_lock:
+            save_xlsx_export(cache_key, params, filename)
+    except TaskLockedException:
+        # Keep the export pending (and not stale) while it waits.
+        set_export(cache_key, ExportState.PENDING)
+        huey_save_xlsx_export.schedule((cache_key, params, filename), delay=EXPORT_WAIT_DELAY)
+
+
+def request_xlsx_export(params, filename):
+    """
+    Start building the export described by `params` in the background, unless an identical export
+    was recently requested. Return its state, see `get_export()`.
+    """
+    cache_key = export_cache_key(params)
+    export = get_export(cache_key)
+    if should_start_export(export) and claim_export(cache_key, export):
+        huey_save_xlsx_export(cache_key, params, filename)
+    return get_export(cache_key)
@@ -0,0 +1,56 @@
+import random
+import statistics
+import time
+
+from itou.jobs.models import Appellation, split_words
+from itou.utils.autocomplete import appellations_index
+from itou.utils.command import BaseCommand
+
+
+def typed_terms(name):
+    """Terms sent by the autocomplete while typing the first two words of `name`."""
+    words = split_words(name)[:2]
+    terms = []
+    for i, word in enumerate(words):
+        terms.extend(" ".join(words[:i] + [word[:length]]) for length in range(1, len(word) + 1))
+    return terms
+
+
+def measure(search, terms):
+    durations = []
+    results = []
+    for term in terms:
+        start = time.perf_counter()
+        results.append([appellation.code for appellation in search(term)])
+        durations.append(time.perf_counter() - start)
+    return durations, results
+
+
+class Command(BaseCommand):
+    help = "Compare the latency of the appellations autocomplete index with the full text search query"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sample", type=int, default=200, help="Number of appellations names to type")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def report(self, label, durations):
+        centiles = statistics.quantiles(durations, n=100)
+        self.stdout.write(f"{label}: p50={centiles[49] * 1000:.3f}ms p99={centiles[98] * 1000:.3f}ms")
+
+    def handle(self, *, sample, seed, **options):
+        names = list(Appellation.objects.values_list("name", flat=True))
+        names = random.Random(seed).sample(names, min(sample, len(names)))
+        terms = [term for name in names for term in typed_terms(name)]
+
+        # Load the index before measuring, like any process after its first search.
+        appellations_index.refresh()
+        db_durations, db_results = measure(lambda term: Appellation.objects.autocomplete(term, limit=10), terms)
+        index_durations, index_results = measure(lambda term: appellations_index.search(term, limit=10), terms)
+
+        self.stdout.write(f"Searched {len(terms)} terms typed from {len(names)} appellations")
+        self.report("tsquery", db_durations)
+        self.report("index", index_durations)
+        mismatches = [term for term, db, index in zip(terms, db_results, index_results) if db != index]
+        self.stdout.write(f"{len(mismatches)} terms with different results")
+        for term in mismatches[:20]:
+            self.stdout.write(f"  - {term}")
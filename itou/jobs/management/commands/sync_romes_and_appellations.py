@@ -2,6 +2,7 @@ from django.utils import timezone
 
 from itou.jobs.models import Appellation, Rome
 from itou.utils.apis import pe_api_enums, pole_emploi_api_client
+from itou.utils.autocomplete_versions import bump_version
 from itou.utils.command import BaseCommand
 from itou.utils.sync import yield_sync_diff
 
@@ -67,3 +68,4 @@ class Command(BaseCommand):
                 unique_fields=("code",),
             )
             self.stdout.write(f"len={len(appellations)} Appellation entries have been created or updated.")
+            bump_version(Appellation)
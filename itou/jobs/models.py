@@ -40,6 +40,11 @@ class Rome(models.Model):
         return f"{self.name} ({self.code})"
 
 
+def split_words(search_string):
+    # Keep only words since `to_tsquery` only takes tokens as input.
+    return re.sub(f"[{string.punctuation}]", " ", search_string).split()
+
+
 class AppellationQuerySet(models.QuerySet):
     def autocomplete(self, search_string, limit=10, rome_code=None):
         """
@@ -47,9 +52,7 @@ class AppellationQuerySet(models.QuerySet):
         This is achieved via `to_tsquery` and prefix matching:
         https://www.postgresql.org/docs/11/textsearch-controls.html#TEXTSEARCH-PARSING-QUERIES
         """
-        # Keep only words since `to_tsquery` only takes tokens as input.
-        words = re.sub(f"[{string.punctuation}]", " ", search_string).split()
-        words = [word + ":*" for word in words]
+        words = [word + ":*" for word in split_words(search_string)]
         tsquery = " & ".join(words)
         queryset = self.filter(full_text=SearchQuery(tsquery, config="french_unaccent", search_type="raw"))
         if rome_code:
@@ -3,12 +3,21 @@ Helper methods for manipulating dataframes used by both populate_metabase_emploi
 populate_metabase_fluxiae scripts.
 """
 
+import itertools
+
 import numpy as np
 import pandas as pd
 from psycopg import sql
 from tqdm import tqdm
 
-from itou.metabase.db import MetabaseDatabaseCursor, create_table, get_new_table_name, rename_table_atomically
+from itou.metabase.db import (
+    CommitError,
+    RetryingMetabaseDatabaseCursor,
+    create_table,
+    get_new_table_name,
+    rename_table_atomically,
+)
+from itou.metabase.parquet import ParquetDataset
 
 
 PANDA_DATAFRAME_TO_PSQL_TYPES_MAPPING = {
@@ -32,55 +41,103 @@ def infer_columns_from_df(df):
     ]
 
 
-def store_df(df, table_name, max_attempts=5):
+def store_df(df, table_name, max_attempts=5, parquet_destination=None):
     """
     Store dataframe in database.
 
     Do this chunk by chunk to solve
     psycopg.OperationalError "server closed the connection unexpectedly" error.
 
-    Try up to `max_attempts` times.
+    Try each chunk up to `max_attempts` times.
+
+    With `parquet_destination`, the dataframe is written as a Parquet snapshot there instead of metabase.
     """
     # Recipe from https://stackoverflow.com/questions/44729727/pandas-slice-large-dataframe-in-chunks
     rows_per_chunk = 10 * 1000
-    df_chunks = [df[i : i + rows_per_chunk] for i in range(0, df.shape[0], rows_per_chunk)]
 
-    print(f"Storing {table_name} in {len(df_chunks)} chunks of (max) {rows_per_chunk} rows each ...")
+    def get_df_chunks():
+        # Always store at least one (empty) chunk so that the table gets created.
+        return (df[i : i + rows_per_chunk] for i in range(0, max(df.shape[0], 1), rows_per_chunk))
+
+    store_df_chunks(
+        get_df_chunks(),
+        table_name,
+        columns=infer_columns_from_df(df),
+        max_attempts=max_attempts,
+        parquet_destination=parquet_destination,
+        reload_df_chunks=get_df_chunks,
+    )
+
+
+def store_df_chunks(
+    df_chunks, table_name, columns=None, max_attempts=5, parquet_destination=None, reload_df_chunks=None
+):
+    """
+    Store a dataframe given chunk by chunk in database, so that it never needs to be fully loaded in memory.
 
-    attempts = 0
+    `df_chunks` is an iterable of dataframes sharing the same columns and dtypes.
+    Column types are inferred from the first chunk unless given in `columns`.
+
+    A single connection is used for all the chunks, each chunk being committed on its own.
+    A chunk which could not be stored is tried again on a new connection, up to `max_attempts` times,
+    unless its commit failed (see `RetryingMetabaseDatabaseCursor`): the table is then stored again
+    from scratch, once, with the chunks returned by `reload_df_chunks()` if given.
+
+    With `parquet_destination`, the dataframe is written as a Parquet snapshot there instead of metabase.
+    """
+    print(f"Storing {table_name} chunk by chunk ...")
+    df_chunks = iter(df_chunks)
+    first_df_chunk = next(df_chunks)
+    if columns is None:
+        columns = infer_columns_from_df(first_df_chunk)
+    df_chunks = itertools.chain([first_df_chunk], df_chunks)
+
+    stored_rows = 0
+    if parquet_destination:
+        with ParquetDataset(parquet_destination, table_name, columns) as dataset:
+            for df_chunk in tqdm(df_chunks):
+                dataset.write(df_chunk.replace({np.nan: None}).to_dict(orient="split")["data"])
+                stored_rows += len(df_chunk)
+        print(f"Stored {table_name} as Parquet into {parquet_destination} ({stored_rows} rows).")
+        print("")
+        return
 
     new_table_name = get_new_table_name(table_name)
-    while attempts < max_attempts:
-        try:
-            columns = infer_columns_from_df(df)
-            create_table(new_table_name, columns, reset=True)
+
+    def copy_rows(cursor, rows):
+        with cursor.copy(
+            sql.SQL("COPY {table_name} FROM STDIN WITH (FORMAT BINARY)").format(
+                table_name=sql.Identifier(new_table_name),
+                Fields=sql.SQL(",").join(
+                    [sql.Identifier(col[0]) for col in columns],
+                ),
+            )
+        ) as copy:
+            copy.set_types([col[1] for col in columns])
+            for row in rows:
+                copy.write_row(row)
+
+    def store_chunks(df_chunks):
+        create_table(new_table_name, columns, reset=True)
+        stored_rows = 0
+        with RetryingMetabaseDatabaseCursor(max_attempts=max_attempts) as metabase:
             for df_chunk in tqdm(df_chunks):
                 rows = df_chunk.replace({np.nan: None}).to_dict(orient="split")["data"]
-                with MetabaseDatabaseCursor() as (cursor, conn):
-                    with cursor.copy(
-                        sql.SQL("COPY {table_name} FROM STDIN WITH (FORMAT BINARY)").format(
-                            table_name=sql.Identifier(new_table_name),
-                            Fields=sql.SQL(",").join(
-                                [sql.Identifier(col[0]) for col in columns],
-                            ),
-                        )
-                    ) as copy:
-                        copy.set_types([col[1] for col in columns])
-                        for row in rows:
-                            copy.write_row(row)
-                    conn.commit()
-            break
-        except Exception as e:
-            # Catching all exceptions is a generally a code smell but we eventually reraise it so it's ok.
-            attempts += 1
-            print(f"Attempt #{attempts} failed with exception {repr(e)}.")
-            if attempts == max_attempts:
-                print("No more attemps left, giving up and raising the exception.")
-                raise
-            print("New attempt started...")
+                metabase.run(copy_rows, rows)
+                stored_rows += len(df_chunk)
+        return stored_rows
+
+    try:
+        stored_rows = store_chunks(df_chunks)
+    except CommitError as e:
+        if reload_df_chunks is None:
+            raise
+        # The rows of the failed commit may or may not have been stored, start over with an empty table.
+        print(f"{e!r} while storing {table_name}, storing it again from scratch...")
+        stored_rows = store_chunks(reload_df_chunks())
 
     rename_table_atomically(new_table_name, table_name)
-    print(f"Stored {table_name} in database ({len(df)} rows).")
+    print(f"Stored {table_name} in database ({stored_rows} rows).")
     print("")
 
 
@@ -2,20 +2,30 @@
 Helper methods for manipulating tables used by both populate_metabase_emplois and populate_metabase_fluxiae scripts.
 """
 
+import concurrent.futures
 import copy
 import gc
 import os
+import queue
+import time
 import urllib
 
 import httpx
 import psycopg
 from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
 from psycopg import sql
 
+from itou.metabase.parquet import ParquetDataset
 from itou.metabase.utils import chunked_queryset, compose, convert_boolean_to_int
 
 
+SYNC_STATE_TABLE_NAME = "c1_etat_synchronisation"
+UPDATE_DATE_COLUMN_NAME = "date_mise_à_jour_metabase"
+COPY_CHECKPOINT_ROWS = 10_000
+
+
 class MetabaseDatabaseCursor:
     def __init__(self):
         self.cursor = None
@@ -43,6 +53,66 @@ class MetabaseDatabaseCursor:
             self.connection.close()
 
 
+class CommitError(Exception):
+    """The commit of an operation failed, it may or may not have been committed."""
+
+
+class RetryingMetabaseDatabaseCursor:
+    """
+    Keep a single metabase connection open to run many operations, each one committed on its own.
+
+    An operation which fails is tried again, up to `max_attempts` times, on a new connection.
+    A failed commit is never tried again: the connection may have dropped after the commit succeeded
+    but before it was acknowledged, and trying again would then write the operation twice.
+    `CommitError` is raised instead, callers may start over from scratch.
+    """
+
+    def __init__(self, max_attempts=5):
+        self.max_attempts = max_attempts
+        self.database_cursor = None
+        self.cursor = None
+        self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        if self.database_cursor:
+            self.database_cursor.__exit__(None, None, None)
+        self.database_cursor = self.cursor = self.connection = None
+
+    def run(self, operation, *args):
+        """
+        Call `operation(cursor, *args)` then commit. `operation` must not commit by itself.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if self.database_cursor is None:
+                    self.database_cursor = MetabaseDatabaseCursor()
+                    self.cursor, self.connection = self.database_cursor.__enter__()
+                result = operation(self.cursor, *args)
+            except Exception as e:
+                # Catching all exceptions is a generally a code smell but we eventually reraise it so it's ok.
+                print(f"Attempt #{attempt} failed with exception {repr(e)}.")
+                # The connection may be broken or in an aborted transaction, start over with a new one.
+                self.close()
+                if attempt == self.max_attempts:
+                    print("No more attemps left, giving up and raising the exception.")
+                    raise
+                print("New attempt started...")
+            else:
+                break
+        try:
+            self.connection.commit()
+        except Exception as e:
+            self.close()
+            raise CommitError(f"Could not commit {operation.__name__}") from e
+        return result
+
+
 def get_current_dir():
     return os.path.dirname(os.path.realpath(__file__))
 
@@ -249,28 +319,61 @@ def create_unversioned_tables_if_needed():
         print("Done.")
 
 
-def populate_table(table, batch_size, querysets=None, extra_object=None):
+def get_high_water_mark(table_name):
     """
-    About commits: a single final commit freezes the itou-metabase-db temporarily, making
-    our GUI unable to connect to the db during this commit.
-
-    This is why we instead do small and frequent commits, so that the db stays available
-    throughout the script.
-
-    Note that psycopg will always automatically open a new transaction when none is open.
-    Thus it will open a new one after each such commit.
+    Return the date of the last successful synchronisation of `table_name`,
+    or None when the table was never synchronised (or its synchronisation state is unknown).
     """
+    with MetabaseDatabaseCursor() as (cur, conn):
+        cur.execute(
+            sql.SQL("SELECT to_regclass({sync_state_table_name}) IS NOT NULL").format(
+                sync_state_table_name=sql.Literal(SYNC_STATE_TABLE_NAME),
+            )
+        )
+        [sync_state_table_exists] = cur.fetchone()
+        if not sync_state_table_exists:
+            return None
+        cur.execute(
+            sql.SQL(
+                "SELECT high_water_mark FROM {sync_state_table_name} "
+                "WHERE table_name = {table_name} AND to_regclass({table_name}) IS NOT NULL"
+            ).format(
+                sync_state_table_name=sql.Identifier(SYNC_STATE_TABLE_NAME),
+                table_name=sql.Literal(table_name),
+            )
+        )
+        row = cur.fetchone()
+        return row[0] if row else None
 
-    table_name = table.name
 
-    total_rows = sum([queryset.count() for queryset in querysets])
+def set_high_water_mark(table_name, high_water_mark):
+    with MetabaseDatabaseCursor() as (cur, conn):
+        cur.execute(
+            sql.SQL(
+                "CREATE TABLE IF NOT EXISTS {sync_state_table_name} "
+                "(table_name varchar PRIMARY KEY, high_water_mark timestamp with time zone NOT NULL)"
+            ).format(sync_state_table_name=sql.Identifier(SYNC_STATE_TABLE_NAME))
+        )
+        cur.execute(
+            sql.SQL(
+                "INSERT INTO {sync_state_table_name} (table_name, high_water_mark) VALUES (%s, %s) "
+                "ON CONFLICT (table_name) DO UPDATE SET high_water_mark = EXCLUDED.high_water_mark"
+            ).format(sync_state_table_name=sql.Identifier(SYNC_STATE_TABLE_NAME)),
+            [table_name, high_water_mark],
+        )
+        conn.commit()
 
+
+def get_table_with_metabase_columns(table):
+    """
+    Return a copy of `table` ready to be injected into metabase.
+    """
     table = copy.deepcopy(table)
     # because of tenacity, we can't just add the last column to the global variable
     table.add_columns(
         [
             {
-                "name": "date_mise_à_jour_metabase",
+                "name": UPDATE_DATE_COLUMN_NAME,
                 "type": "date",
                 "comment": "Date de dernière mise à jour de Metabase",
                 # As metabase daily updates run typically every night after midnight, the last day with
@@ -286,6 +389,155 @@ def populate_table(table, batch_size, querysets=None, extra_object=None):
         if c["type"] == "boolean":
             c["type"] = "integer"
             c["fn"] = compose(convert_boolean_to_int, c["fn"])
+    return table
+
+
+def copy_rows(cur, table_name, table_columns, chunk):
+    rows = [[c["fn"](row) for c in table_columns] for row in chunk]
+    with cur.copy(
+        sql.SQL("COPY {table_name} ({fields}) FROM STDIN WITH (FORMAT BINARY)").format(
+            table_name=sql.Identifier(table_name),
+            fields=sql.SQL(",").join(
+                [sql.Identifier(c["name"]) for c in table_columns],
+            ),
+        )
+    ) as copy:
+        copy.set_types([c["type"] for c in table_columns])
+        for row in rows:
+            copy.write_row(row)
+
+
+def format_throughput(stage, rows, duration):
+    return f"{stage}: {rows} rows in seconds={duration:.2f} ({rows / duration if duration else 0:.0f} rows/s)"
+
+
+class PipelinedCopy:
+    """
+    Stream rows into `table_name` from a writer thread, so that the next chunk is read from the itou
+    database and transformed while the previous one is being written into metabase.
+
+    The writer keeps a single COPY open and only ends it every `checkpoint_rows` rows to commit
+    (see `populate_table` about commits).
+    At most `max_pending_chunks` transformed chunks wait for the writer, reading is paused beyond that.
+    """
+
+    def __init__(self, table_name, table_columns, checkpoint_rows, max_pending_chunks=2):
+        self.table_columns = table_columns
+        self.checkpoint_rows = checkpoint_rows
+        self.copy_query = sql.SQL("COPY {table_name} ({fields}) FROM STDIN WITH (FORMAT BINARY)").format(
+            table_name=sql.Identifier(table_name),
+            fields=sql.SQL(",").join([sql.Identifier(c["name"]) for c in table_columns]),
+        )
+        self.queue = queue.Queue(maxsize=max_pending_chunks)
+        self.executor = None
+        self.writer = None
+        self.stats = {stage: {"rows": 0, "duration": 0} for stage in ["read", "transform", "write"]}
+
+    def __enter__(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.writer = self.executor.submit(self.write)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        try:
+            self._enqueue(None)
+        finally:
+            self.executor.shutdown()
+        self.writer.result()
+        for stage, stats in self.stats.items():
+            print(format_throughput(stage, stats["rows"], stats["duration"]))
+
+    def _record(self, stage, rows, before):
+        self.stats[stage]["rows"] += rows
+        self.stats[stage]["duration"] += time.perf_counter() - before
+
+    def _enqueue(self, item):
+        while True:
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                if self.writer.done():
+                    # Raise the writer exception instead of waiting forever.
+                    self.writer.result()
+
+    def put(self, chunk):
+        """
+        Read and transform `chunk` then queue it for writing, return its number of rows.
+        """
+        before = time.perf_counter()
+        objects = list(chunk)
+        self._record("read", len(objects), before)
+
+        before = time.perf_counter()
+        rows = [[c["fn"](o) for c in self.table_columns] for o in objects]
+        self._record("transform", len(rows), before)
+
+        self._enqueue(rows)
+        return len(rows)
+
+    def write(self):
+        with MetabaseDatabaseCursor() as (cur, conn):
+            rows = self.queue.get()
+            while rows is not None:
+                with cur.copy(self.copy_query) as copy:
+                    copy.set_types([c["type"] for c in self.table_columns])
+                    uncommitted_rows = 0
+                    while rows is not None and uncommitted_rows < self.checkpoint_rows:
+                        before = time.perf_counter()
+                        for row in rows:
+                            copy.write_row(row)
+                        self._record("write", len(rows), before)
+                        uncommitted_rows += len(rows)
+                        rows = self.queue.get()
+                conn.commit()
+
+
+def delete_rows(cur, table_name, pks):
+    cur.execute(
+        sql.SQL("DELETE FROM {table_name} WHERE id = ANY(%s)").format(table_name=sql.Identifier(table_name)),
+        [list(pks)],
+    )
+
+
+def populate_table(table, batch_size, querysets=None, extra_object=None, incremental=False, parquet_destination=None):
+    """
+    About commits: a single final commit freezes the itou-metabase-db temporarily, making
+    our GUI unable to connect to the db during this commit.
+
+    This is why we instead do small and frequent commits, so that the db stays available
+    throughout the script.
+
+    Note that psycopg will always automatically open a new transaction when none is open.
+    Thus it will open a new one after each such commit.
+
+    With `incremental`, tables defining `updated_at_lookups` are updated in place with the objects
+    modified since the last successful run instead of being rebuilt from scratch.
+    The table is fully rebuilt when it was never synchronised before.
+
+    With `parquet_destination`, the table is written as a Parquet snapshot there instead of metabase.
+    """
+    if parquet_destination:
+        write_table_as_parquet(table, batch_size, querysets, extra_object, parquet_destination)
+        return
+
+    # Take the high-water mark before reading anything, objects modified while we are reading
+    # them will be read again during the next run.
+    started_at = timezone.now()
+
+    if incremental and table.updated_at_lookups:
+        high_water_mark = get_high_water_mark(table.name)
+        if high_water_mark is not None:
+            update_table_incrementally(table, batch_size, querysets, high_water_mark)
+            set_high_water_mark(table.name, started_at)
+            return
+        print(f"No previous synchronisation found for table {table.name}, rebuilding it from scratch.")
+
+    table_name = table.name
+
+    total_rows = sum([queryset.count() for queryset in querysets])
+
+    table = get_table_with_metabase_columns(table)
 
     print(f"Injecting {total_rows} rows with {len(table.columns)} columns into table {table_name}:")
 
@@ -293,22 +545,6 @@ def populate_table(table, batch_size, querysets=None, extra_object=None):
     create_table(new_table_name, [(c["name"], c["type"]) for c in table.columns], reset=True)
 
     with MetabaseDatabaseCursor() as (cur, conn):
-
-        def inject_chunk(table_columns, chunk, new_table_name):
-            rows = [[c["fn"](row) for c in table_columns] for row in chunk]
-            with cur.copy(
-                sql.SQL("COPY {new_table_name} ({fields}) FROM STDIN WITH (FORMAT BINARY)").format(
-                    new_table_name=sql.Identifier(new_table_name),
-                    fields=sql.SQL(",").join(
-                        [sql.Identifier(c["name"]) for c in table_columns],
-                    ),
-                )
-            ) as copy:
-                copy.set_types([c["type"] for c in table_columns])
-                for row in rows:
-                    copy.write_row(row)
-            conn.commit()
-
         # Add comments on table columns.
         for c in table.columns:
             assert set(c.keys()) == {"name", "type", "comment", "fn"}
@@ -323,20 +559,122 @@ def populate_table(table, batch_size, querysets=None, extra_object=None):
 
         conn.commit()
 
+    with PipelinedCopy(new_table_name, table.columns, checkpoint_rows=max(batch_size, COPY_CHECKPOINT_ROWS)) as pipe:
         if extra_object:
-            inject_chunk(table_columns=table.columns, chunk=[extra_object], new_table_name=new_table_name)
+            pipe.put([extra_object])
 
-        written_rows = 0
+        read_rows = 0
         for queryset in querysets:
-            # Insert rows by batch of batch_size.
+            # Read rows by batch of batch_size.
             # A bigger number makes the script faster until a certain point,
             # but it also increases RAM usage.
-            for chunk_qs in chunked_queryset(queryset, chunk_size=batch_size):
-                inject_chunk(table_columns=table.columns, chunk=chunk_qs, new_table_name=new_table_name)
-                written_rows += chunk_qs.count()
-                print(f"count={written_rows} of total={total_rows} written")
+            for chunk in chunked_queryset(queryset, chunk_size=batch_size):
+                read_rows += pipe.put(chunk)
+                print(f"count={read_rows} of total={total_rows} read")
 
             # Trigger garbage collection to optimize memory use.
             gc.collect()
 
     rename_table_atomically(new_table_name, table_name)
+
+    if table.updated_at_lookups:
+        set_high_water_mark(table_name, started_at)
+
+
+def write_table_as_parquet(table, batch_size, querysets, extra_object, destination):
+    table_name = table.name
+    table = get_table_with_metabase_columns(table)
+
+    print(f"Writing table {table_name} as Parquet into {destination}:")
+
+    with ParquetDataset(destination, table_name, [(c["name"], c["type"]) for c in table.columns]) as dataset:
+        if extra_object:
+            dataset.write([[c["fn"](extra_object) for c in table.columns]])
+
+        written_rows = 0
+        for queryset in querysets:
+            for chunk in chunked_queryset(queryset, chunk_size=batch_size):
+                dataset.write([[c["fn"](o) for c in table.columns] for o in chunk])
+                written_rows += len(chunk)
+                print(f"count={written_rows} written")
+
+            # Trigger garbage collection to optimize memory use.
+            gc.collect()
+
+
+def update_table_incrementally(table, batch_size, querysets, high_water_mark):
+    """
+    Write the rows of the objects modified since `high_water_mark` (or whose related objects
+    listed in `table.updated_at_lookups` were), and of the objects missing from the table.
+    Delete the rows of objects which are no longer part of `querysets`.
+
+    Source and table pks are compared chunk by chunk to keep the memory usage bounded.
+    Each written chunk is deleted then re-inserted in the same transaction so that the table
+    never misses a row, even for a short time. Untouched rows keep their update date.
+    """
+    table_name = table.name
+    table = get_table_with_metabase_columns(table)
+    modified = Q()
+    for lookup in table.updated_at_lookups:
+        modified |= Q(**{f"{lookup}__gt": high_water_mark})
+
+    print(f"Updating rows modified since {high_water_mark} into table {table_name}:")
+
+    with MetabaseDatabaseCursor() as (cur, conn):
+        written_rows = 0
+        for queryset in querysets:
+            # A subquery avoids duplicating the rows of objects with many modified related objects.
+            modified_pks = queryset.model.objects.filter(modified).values("pk")
+            pks_queryset = queryset.select_related(None).prefetch_related(None).only("pk")
+            for pks_chunk in chunked_queryset(pks_queryset, chunk_size=COPY_CHECKPOINT_ROWS):
+                pks = [o.pk for o in pks_chunk]
+                cur.execute(
+                    sql.SQL("SELECT id FROM {table_name} WHERE id = ANY(%s)").format(
+                        table_name=sql.Identifier(table_name)
+                    ),
+                    [pks],
+                )
+                missing_pks = set(pks) - {pk for (pk,) in cur.fetchall()}
+                to_write = queryset.filter(pk__in=pks).filter(Q(pk__in=missing_pks) | Q(pk__in=modified_pks))
+                for chunk in chunked_queryset(to_write, chunk_size=batch_size):
+                    delete_rows(cur, table_name, [o.pk for o in chunk])
+                    copy_rows(cur, table_name, table.columns, chunk)
+                    conn.commit()
+                    written_rows += len(chunk)
+                    print(f"count={written_rows} written")
+
+                # Trigger garbage collection to optimize memory use.
+                gc.collect()
+
+        removed_rows = 0
+        last_pk = None
+        while True:
+            if last_pk is None:
+                cur.execute(
+                    sql.SQL("SELECT id FROM {table_name} ORDER BY id LIMIT %s").format(
+                        table_name=sql.Identifier(table_name)
+                    ),
+                    [COPY_CHECKPOINT_ROWS],
+                )
+            else:
+                cur.execute(
+                    sql.SQL("SELECT id FROM {table_name} WHERE id > %s ORDER BY id LIMIT %s").format(
+                        table_name=sql.Identifier(table_name)
+                    ),
+                    [last_pk, COPY_CHECKPOINT_ROWS],
+                )
+            table_pks = [pk for (pk,) in cur.fetchall()]
+            if not table_pks:
+                break
+            last_pk = table_pks[-1]
+            source_pks = set()
+            for queryset in querysets:
+                source_pks.update(
+                    queryset.filter(pk__in=table_pks).prefetch_related(None).values_list("pk", flat=True)
+                )
+            removed_pks = set(table_pks) - source_pks
+            if removed_pks:
+                delete_rows(cur, table_name, removed_pks)
+                conn.commit()
+                removed_rows += len(removed_pks)
+        print(f"count={removed_rows} removed")
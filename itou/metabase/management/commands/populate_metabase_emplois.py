@@ -11,7 +11,9 @@ french speaking only users, and injects the result into metabase.
 
 The itou production database is never modified, only read.
 
-The metabase database tables are trashed and recreated every time.
+The metabase database tables are trashed and recreated every time, unless the `--incremental` option is used:
+tables able to track their changes are then only updated with what was modified since the last run.
+A run without `--incremental` remains the safety net rebuilding everything from scratch.
 
 The data is heavily denormalized among tables so that the metabase user
 has all the fields needed and thus never needs to perform joining two tables.
@@ -20,10 +22,14 @@ We maintain a google sheet with extensive documentation about all tables and fie
 Its name is "Documentation ITOU METABASE [Master doc]". No direct link here for safety reasons.
 """
 
+import concurrent.futures
+import multiprocessing
+import time
 from collections import OrderedDict
 
 import tenacity
 from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import connections
 from django.db.models import Count, Max, Min, Prefetch, Q
 from django.utils import timezone
 from sentry_sdk.crons import monitor
@@ -83,6 +89,25 @@ def log_retry_attempt(retry_state):
     print(f"attempt failed with outcome={retry_state.outcome}")
 
 
+@tenacity.retry(
+    retry=tenacity.retry_if_not_exception_type(RuntimeError),
+    stop=tenacity.stop_after_attempt(3),
+    wait=tenacity.wait_fixed(5),
+    after=log_retry_attempt,
+)
+def _run_mode(mode, incremental, parquet_destination):
+    """
+    Run a single mode from a fresh command instance.
+    Used with `--all`, possibly in a worker process with its own database connections.
+    """
+    command = Command()
+    command.incremental = incremental
+    command.parquet_destination = parquet_destination
+    before = time.perf_counter()
+    command.MODE_TO_OPERATION[mode]()
+    return time.perf_counter() - before
+
+
 class Command(BaseCommand):
     help = "Populate metabase database."
 
@@ -115,13 +140,45 @@ class Command(BaseCommand):
             "dbt_daily": self.build_dbt_daily,
             "data_inconsistencies": self.report_data_inconsistencies,
         }
+        # Modes which can only start once other modes completed successfully.
+        # DBT builds its models on top of every table.
+        self.MODE_DEPENDENCIES = {"dbt_daily": set(self.MODE_TO_OPERATION) - {"dbt_daily", "data_inconsistencies"}}
 
     def add_arguments(self, parser):
-        parser.add_argument("--mode", action="store", dest="mode", type=str, choices=self.MODE_TO_OPERATION.keys())
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument("--mode", action="store", dest="mode", type=str, choices=self.MODE_TO_OPERATION.keys())
+        group.add_argument("--all", action="store_true", dest="all_modes", help="Run every mode")
+        parser.add_argument(
+            "--jobs",
+            action="store",
+            dest="jobs",
+            type=int,
+            default=1,
+            help="With --all, number of modes run concurrently, each in its own process",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only update the rows modified since the last run in tables supporting it",
+        )
+        parser.add_argument(
+            "--parquet-destination",
+            action="store",
+            dest="parquet_destination",
+            help="Write tables as Parquet snapshots into this directory or S3 URL (s3://bucket/prefix) instead",
+        )
+
+    def populate_table(self, table, **kwargs):
+        populate_table(table, incremental=self.incremental, parquet_destination=self.parquet_destination, **kwargs)
+
+    def store_df(self, df, table_name):
+        store_df(df=df, table_name=table_name, parquet_destination=self.parquet_destination)
 
     def populate_analytics(self):
-        populate_table(analytics.AnalyticsTable, batch_size=10_000, querysets=[Datum.objects.all()])
-        populate_table(analytics.DashboardVisitTable, batch_size=10_000, querysets=[StatsDashboardVisit.objects.all()])
+        self.populate_table(analytics.AnalyticsTable, batch_size=10_000, querysets=[Datum.objects.all()])
+        self.populate_table(
+            analytics.DashboardVisitTable, batch_size=10_000, querysets=[StatsDashboardVisit.objects.all()]
+        )
 
     def populate_companies(self):
         ONE_MONTH_AGO = timezone.now() - timezone.timedelta(days=30)
@@ -189,7 +246,7 @@ class Command(BaseCommand):
             .all()
         )
 
-        populate_table(companies.TABLE, batch_size=100, querysets=[queryset])
+        self.populate_table(companies.TABLE, batch_size=100, querysets=[queryset])
 
     def populate_job_descriptions(self):
         queryset = (
@@ -201,7 +258,7 @@ class Command(BaseCommand):
             .with_job_applications_count()
             .all()
         )
-        populate_table(job_descriptions.TABLE, batch_size=10_000, querysets=[queryset])
+        self.populate_table(job_descriptions.TABLE, batch_size=10_000, querysets=[queryset])
 
     def populate_organizations(self):
         """
@@ -247,7 +304,7 @@ class Command(BaseCommand):
             .all()
         )
 
-        populate_table(
+        self.populate_table(
             organizations.TABLE,
             batch_size=100,
             querysets=[queryset],
@@ -305,11 +362,11 @@ class Command(BaseCommand):
         )
         job_seekers_table = job_seekers.get_table()
 
-        populate_table(job_seekers_table, batch_size=1000, querysets=[queryset])
+        self.populate_table(job_seekers_table, batch_size=1000, querysets=[queryset])
 
     def populate_criteria(self):
         queryset = AdministrativeCriteria.objects.all()
-        populate_table(criteria.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(criteria.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_job_applications(self):
         queryset = (
@@ -346,20 +403,19 @@ class Command(BaseCommand):
             .all()
         )
 
-        populate_table(job_applications.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(job_applications.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_selected_jobs(self):
         """
         Populate associations between job applications and job descriptions.
         """
         queryset = (
-            JobApplication.objects.exclude(origin=Origin.PE_APPROVAL)
-            .filter(to_company_id__in=get_active_companies_pks())
-            .exclude(selected_jobs=None)
-            .values("pk", "selected_jobs__id")
+            JobApplication.selected_jobs.through.objects.exclude(jobapplication__origin=Origin.PE_APPROVAL)
+            .filter(jobapplication__to_company_id__in=get_active_companies_pks())
+            .values("pk", "jobapplication_id", "jobdescription_id")
         )
 
-        populate_table(selected_jobs.TABLE, batch_size=10_000, querysets=[queryset])
+        self.populate_table(selected_jobs.TABLE, batch_size=10_000, querysets=[queryset])
 
     def populate_approvals(self):
         """
@@ -376,65 +432,65 @@ class Command(BaseCommand):
             start_at__gte=approvals.POLE_EMPLOI_APPROVAL_MINIMUM_START_DATE
         ).all()
 
-        populate_table(approvals.TABLE, batch_size=1000, querysets=[queryset1, queryset2])
+        self.populate_table(approvals.TABLE, batch_size=1000, querysets=[queryset1, queryset2])
 
     def populate_prolongations(self):
         queryset = Prolongation.objects.all()
-        populate_table(prolongations.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(prolongations.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_prolongation_requests(self):
         queryset = ProlongationRequest.objects.select_related(
             "prolongation",
             "deny_information",
         ).all()
-        populate_table(prolongation_requests.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(prolongation_requests.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_institutions(self):
         queryset = Institution.objects.all()
-        populate_table(institutions.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(institutions.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_evaluation_campaigns(self):
         queryset = EvaluationCampaign.objects.all()
-        populate_table(evaluation_campaigns.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(evaluation_campaigns.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_evaluated_siaes(self):
         queryset = EvaluatedSiae.objects.prefetch_related(
             "evaluated_job_applications__evaluated_administrative_criteria"
         ).all()
-        populate_table(evaluated_siaes.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(evaluated_siaes.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_evaluated_job_applications(self):
         queryset = EvaluatedJobApplication.objects.prefetch_related("evaluated_administrative_criteria").all()
-        populate_table(evaluated_job_applications.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(evaluated_job_applications.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_evaluated_criteria(self):
         queryset = EvaluatedAdministrativeCriteria.objects.all()
-        populate_table(evaluated_criteria.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(evaluated_criteria.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_users(self):
         queryset = User.objects.filter(
             kind__in=[UserKind.EMPLOYER, UserKind.PRESCRIBER, UserKind.LABOR_INSPECTOR], is_active=True
         )
-        populate_table(users.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(users.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_memberships(self):
         siae_queryset = CompanyMembership.objects.filter(is_active=True)
         prescriber_queryset = PrescriberMembership.objects.filter(is_active=True)
         institution_queryset = InstitutionMembership.objects.filter(is_active=True)
 
-        populate_table(
+        self.populate_table(
             memberships.TABLE, batch_size=1000, querysets=[siae_queryset, prescriber_queryset, institution_queryset]
         )
 
     def populate_rome_codes(self):
         queryset = Rome.objects.all()
 
-        populate_table(rome_codes.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(rome_codes.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_insee_codes(self):
         queryset = City.objects.all()
 
-        populate_table(insee_codes.TABLE, batch_size=1000, querysets=[queryset])
+        self.populate_table(insee_codes.TABLE, batch_size=1000, querysets=[queryset])
 
     def populate_insee_codes_vs_post_codes(self):
         table_name = "codes_insee_vs_codes_postaux"
@@ -450,7 +506,7 @@ class Command(BaseCommand):
                 rows.append(row)
 
         df = get_df_from_rows(rows)
-        store_df(df=df, table_name=table_name)
+        self.store_df(df=df, table_name=table_name)
 
     def populate_departments(self):
         table_name = "departements"
@@ -468,7 +524,7 @@ class Command(BaseCommand):
             rows.append(row)
 
         df = get_df_from_rows(rows)
-        store_df(df=df, table_name=table_name)
+        self.store_df(df=df, table_name=table_name)
 
     def populate_enums(self):
         # TODO(vperron,dejafait): This works as long as we don't have several table creations in the same call.
@@ -483,7 +539,7 @@ class Command(BaseCommand):
             self.stdout.write(f"Preparing content for {table_name} table...")
             rows = [OrderedDict(code=str(item), label=item.label) for item in enum]
             df = get_df_from_rows(rows)
-            store_df(df=df, table_name=table_name)
+            self.store_df(df=df, table_name=table_name)
 
     @timeit
     def report_data_inconsistencies(self):
@@ -508,6 +564,70 @@ class Command(BaseCommand):
     def build_dbt_daily(self):
         build_dbt_daily()
 
+    def run_all_modes(self, jobs):
+        """
+        Run every mode, up to `jobs` at the same time, as soon as their dependencies are completed.
+        A failing mode does not stop the others, but its dependents are skipped.
+        """
+        pending = list(self.MODE_TO_OPERATION)
+        durations = {}
+        failures = {}
+
+        def get_ready_modes():
+            ready = [
+                mode
+                for mode in pending
+                if all(dependency in durations for dependency in self.MODE_DEPENDENCIES.get(mode, []))
+            ]
+            for mode in ready:
+                pending.remove(mode)
+            return ready
+
+        def skip_unreachable_modes():
+            for mode in list(pending):
+                if any(dependency in failures for dependency in self.MODE_DEPENDENCIES.get(mode, [])):
+                    pending.remove(mode)
+                    failures[mode] = "skipped, a dependency failed"
+
+        def on_mode_done(mode, result):
+            try:
+                durations[mode] = result()
+            except Exception as e:
+                failures[mode] = repr(e)
+                self.stdout.write(f"mode={mode} failed with exception {repr(e)}")
+            else:
+                self.stdout.write(f"mode={mode} completed in seconds={durations[mode]:.2f}")
+
+        if jobs == 1:
+            while ready := get_ready_modes():
+                for mode in ready:
+                    on_mode_done(mode, lambda: _run_mode(mode, self.incremental, self.parquet_destination))
+                skip_unreachable_modes()
+        else:
+            # Forked workers would otherwise share the parent database connections.
+            connections.close_all()
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=jobs, mp_context=multiprocessing.get_context("fork")
+            ) as executor:
+                running = {}
+                while True:
+                    for mode in get_ready_modes():
+                        running[executor.submit(_run_mode, mode, self.incremental, self.parquet_destination)] = mode
+                    if not running:
+                        break
+                    done, _not_done = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        on_mode_done(running.pop(future), future.result)
+                    skip_unreachable_modes()
+
+        self.stdout.write("Summary:")
+        for mode, duration in sorted(durations.items(), key=lambda item: item[1], reverse=True):
+            self.stdout.write(f"  {mode}: completed in seconds={duration:.2f}")
+        for mode, failure in failures.items():
+            self.stdout.write(f"  {mode}: FAILED ({failure})")
+        if failures:
+            raise RuntimeError(f"Some modes did not complete: {', '.join(failures)}")
+
     @timeit
     @monitor(monitor_slug="populate-metabase-emplois")
     @tenacity.retry(
@@ -516,5 +636,10 @@ class Command(BaseCommand):
         wait=tenacity.wait_fixed(5),
         after=log_retry_attempt,
     )
-    def handle(self, mode, **options):
-        self.MODE_TO_OPERATION[mode]()
+    def handle(self, mode, *, incremental=False, parquet_destination=None, all_modes=False, jobs=1, **options):
+        self.incremental = incremental
+        self.parquet_destination = parquet_destination
+        if all_modes:
+            self.run_all_modes(jobs)
+        else:
+            self.MODE_TO_OPERATION[mode]()
@@ -3,14 +3,13 @@ Populate metabase with fluxIAE data and some custom tables for our needs.
 
 For itou data, see the other script `populate_metabase_emplois.py`.
 
-This script is launched manually every week by Supportix on a fast machine, not production.
+This script is launched manually every week by Supportix.
 
-It manipulates large dataframes in memory (~10M rows) and thus is not optimized for production low memory environment.
+Files are read and stored chunk by chunk (see `get_fluxiae_df_chunks`), so that memory use stays flat
+even for the largest files (~10M rows) and the script can run on a small machine.
 
 This script takes ~2 hours to complete.
 
-Refactoring it for low memory use would make it even longer and is actually not trivial. It might be attempted though.
-
 1) Vocabulary.
 
 - aka = also known as
@@ -59,12 +58,19 @@ An EMI does not necessarily have a mission.
 
 """
 
+import concurrent.futures
+import os
+
 # FIXME(vperron): Those helpers are shared between populate_metabase and import_siae.
 # It would make a lot more sense, to avoid eventual circular imports, to move everything
 # related to the fluxiae logic in its own application. Some architecture still needs to be thought of there.
 # Another way to do it would be to rationalize our import (to Itou) & export (to Metabase) logic.
-from itou.companies.management.commands._import_siae.utils import get_fluxiae_df, get_fluxiae_referential_filenames
-from itou.metabase.dataframes import store_df
+from itou.companies.management.commands._import_siae.utils import (
+    get_filename,
+    get_fluxiae_df_chunks,
+    get_fluxiae_referential_filenames,
+)
+from itou.metabase.dataframes import store_df_chunks
 from itou.metabase.db import build_dbt_weekly
 from itou.utils.command import BaseCommand
 from itou.utils.python import timeit
@@ -74,14 +80,50 @@ from itou.utils.slack import send_slack_message
 class Command(BaseCommand):
     help = "Populate metabase database with fluxIAE data."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--parquet-destination",
+            action="store",
+            dest="parquet_destination",
+            help="Write tables as Parquet snapshots into this directory or S3 URL (s3://bucket/prefix) instead",
+        )
+        parser.add_argument(
+            "--jobs",
+            action="store",
+            dest="jobs",
+            type=int,
+            default=4,
+            help="Number of files loaded concurrently",
+        )
+
     @timeit
     def populate_fluxiae_view(self, vue_name, skip_first_row=True):
-        df = get_fluxiae_df(vue_name=vue_name, skip_first_row=skip_first_row)
-        store_df(df=df, table_name=vue_name)
+        store_df_chunks(
+            get_fluxiae_df_chunks(vue_name=vue_name, skip_first_row=skip_first_row),
+            table_name=vue_name,
+            parquet_destination=self.parquet_destination,
+            # Read the file again when a chunk could not be committed.
+            reload_df_chunks=lambda: get_fluxiae_df_chunks(vue_name=vue_name, skip_first_row=skip_first_row),
+        )
 
-    def populate_fluxiae_referentials(self):
-        for filename in get_fluxiae_referential_filenames():
-            self.populate_fluxiae_view(vue_name=filename)
+    def populate_fluxiae_views(self, vue_names_to_skip_first_row):
+        """
+        Load several files concurrently, the largest first so that the smallest ones fill the other workers
+        in the meantime.
+        """
+        vue_names = sorted(
+            vue_names_to_skip_first_row,
+            key=lambda vue_name: os.path.getsize(get_filename(vue_name, ".csv")),
+            reverse=True,
+        )
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [
+                executor.submit(self.populate_fluxiae_view, vue_name, vue_names_to_skip_first_row[vue_name])
+                for vue_name in vue_names
+            ]
+        # Raise the first error, if any, once every file had its chance to be loaded.
+        for future in futures:
+            future.result()
 
     @timeit
     def populate_metabase_fluxiae(self):
@@ -89,29 +131,35 @@ class Command(BaseCommand):
             ":rocket: Début de la mise à jour hebdomadaire de Metabase avec les dernières données FluxIAE :rocket:"
         )
 
-        self.populate_fluxiae_referentials()
-
-        self.populate_fluxiae_view(vue_name="fluxIAE_AnnexeFinanciere")
-        self.populate_fluxiae_view(vue_name="fluxIAE_AnnexeFinanciereACI")
-        self.populate_fluxiae_view(vue_name="fluxIAE_Convention")
-        self.populate_fluxiae_view(vue_name="fluxIAE_ContratMission", skip_first_row=False)
-        self.populate_fluxiae_view(vue_name="fluxIAE_Encadrement")
-        self.populate_fluxiae_view(vue_name="fluxIAE_EtatMensuelAgregat")
-        self.populate_fluxiae_view(vue_name="fluxIAE_EtatMensuelIndiv")
-        self.populate_fluxiae_view(vue_name="fluxIAE_Financement")
-        self.populate_fluxiae_view(vue_name="fluxIAE_Formations")
-        self.populate_fluxiae_view(vue_name="fluxIAE_Missions")
-        self.populate_fluxiae_view(vue_name="fluxIAE_MissionsEtatMensuelIndiv")
-        self.populate_fluxiae_view(vue_name="fluxIAE_PMSMP")
-        self.populate_fluxiae_view(vue_name="fluxIAE_Salarie", skip_first_row=False)
-        self.populate_fluxiae_view(vue_name="fluxIAE_Structure")
-
-        build_dbt_weekly()
+        self.populate_fluxiae_views(
+            {vue_name: True for vue_name in get_fluxiae_referential_filenames()}
+            | {
+                "fluxIAE_AnnexeFinanciere": True,
+                "fluxIAE_AnnexeFinanciereACI": True,
+                "fluxIAE_Convention": True,
+                "fluxIAE_ContratMission": False,
+                "fluxIAE_Encadrement": True,
+                "fluxIAE_EtatMensuelAgregat": True,
+                "fluxIAE_EtatMensuelIndiv": True,
+                "fluxIAE_Financement": True,
+                "fluxIAE_Formations": True,
+                "fluxIAE_Missions": True,
+                "fluxIAE_MissionsEtatMensuelIndiv": True,
+                "fluxIAE_PMSMP": True,
+                "fluxIAE_Salarie": False,
+                "fluxIAE_Structure": True,
+            }
+        )
+
+        if not self.parquet_destination:
+            build_dbt_weekly()
 
         send_slack_message(
             ":white_check_mark: Fin de la mise à jour hebdomadaire de Metabase avec les"
             " dernières données FluxIAE :white_check_mark:"
         )
 
-    def handle(self, **options):
+    def handle(self, *, parquet_destination=None, jobs=4, **options):
+        self.parquet_destination = parquet_destination
+        self.jobs = jobs
         self.populate_metabase_fluxiae()
@@ -0,0 +1,113 @@
+"""
+Write metabase tables as Parquet datasets, on local disk or S3, instead of the metabase database.
+
+Each run writes a snapshot partitioned by date, e.g. `candidatures/date_instantane=2024-03-11/part-00000.parquet`,
+so that analysts and dbt can read the snapshots (and compare two of them) without loading the metabase database.
+"""
+
+import datetime
+import io
+import json
+import pathlib
+import urllib.parse
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.utils import timezone
+
+from itou.utils.storage.s3 import s3_client
+
+
+def _to_date(value):
+    if isinstance(value, datetime.datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _to_str(value):
+    return None if value is None else str(value)
+
+
+def _to_json(value):
+    return None if value is None else json.dumps(value)
+
+
+def _identity(value):
+    return value
+
+
+# Arrow type and value conversion for the column types of metabase tables
+# (see `get_field_type_from_field` and `PANDA_DATAFRAME_TO_PSQL_TYPES_MAPPING`).
+PSQL_TO_ARROW_TYPES = {
+    "varchar": (pa.string(), _identity),
+    "text": (pa.string(), _identity),
+    "integer": (pa.int32(), _identity),
+    "bigint": (pa.int64(), _identity),
+    "double precision": (pa.float64(), _identity),
+    "boolean": (pa.bool_(), _identity),
+    "uuid": (pa.string(), _to_str),
+    "jsonb": (pa.string(), _to_json),
+    "date": (pa.date32(), _to_date),
+    "timestamp with time zone": (pa.timestamp("us", tz="UTC"), _identity),
+    "interval": (pa.duration("us"), _identity),
+}
+
+
+class ParquetDataset:
+    """
+    Snapshot of `table_name` made of one Parquet file per call to `write()`, to be used as a context manager.
+
+    `destination` is either a local directory or an S3 URL like `s3://bucket/prefix`.
+    """
+
+    def __init__(self, destination, table_name, columns, snapshot_date=None):
+        self.destination = destination
+        self.columns = columns
+        self.schema = pa.schema([(name, PSQL_TO_ARROW_TYPES[psql_type][0]) for name, psql_type in columns])
+        snapshot_date = snapshot_date or timezone.localdate()
+        self.path = f"{table_name}/date_instantane={snapshot_date.isoformat()}"
+        self.parts = 0
+
+    def __enter__(self):
+        self._clear()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None and not self.parts:
+            # Keep the schema of empty tables.
+            self.write([])
+
+    def write(self, rows):
+        arrays = [
+            pa.array([PSQL_TO_ARROW_TYPES[psql_type][1](row[i]) for row in rows], type=arrow_type)
+            for i, ((_name, psql_type), arrow_type) in enumerate(zip(self.columns, self.schema.types))
+        ]
+        buffer = io.BytesIO()
+        pq.write_table(pa.Table.from_arrays(arrays, schema=self.schema), buffer)
+        self._store(f"{self.path}/part-{self.parts:05d}.parquet", buffer.getvalue())
+        self.parts += 1
+
+    def _get_s3_bucket_and_key(self, relative_path):
+        url = urllib.parse.urlparse(self.destination)
+        return url.netloc, "/".join(part for part in [url.path.strip("/"), relative_path] if part)
+
+    def _clear(self):
+        # Files of a previous snapshot made the same day may outnumber the new ones.
+        if self.destination.startswith("s3://"):
+            bucket, prefix = self._get_s3_bucket_and_key(f"{self.path}/")
+            client = s3_client()
+            for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+                if objects := [{"Key": obj["Key"]} for obj in page.get("Contents", [])]:
+                    client.delete_objects(Bucket=bucket, Delete={"Objects": objects})
+        else:
+            for path in (pathlib.Path(self.destination) / self.path).glob("*.parquet"):
+                path.unlink()
+
+    def _store(self, relative_path, content):
+        if self.destination.startswith("s3://"):
+            bucket, key = self._get_s3_bucket_and_key(relative_path)
+            s3_client().put_object(Bucket=bucket, Key=key, Body=content)
+        else:
+            path = pathlib.Path(self.destination) / relative_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
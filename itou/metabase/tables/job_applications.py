@@ -111,7 +111,17 @@ def get_ja_hiring_date(ja):
     return None
 
 
-TABLE = MetabaseTable(name="candidatures")
+TABLE = MetabaseTable(
+    name="candidatures",
+    # The sender names have no modification date, only a full run refreshes them.
+    updated_at_lookups=(
+        "updated_at",
+        "to_company__updated_at",
+        "sender_company__updated_at",
+        "sender_prescriber_organization__updated_at",
+        "logs__timestamp",
+    ),
+)
 TABLE.add_columns(
     [
         {
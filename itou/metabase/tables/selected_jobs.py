@@ -8,13 +8,13 @@ TABLE.add_columns(
             "name": "id_fiche_de_poste",
             "type": "integer",
             "comment": "ID fiche de poste",
-            "fn": lambda o: o["selected_jobs__id"],
+            "fn": lambda o: o["jobdescription_id"],
         },
         {
             "name": "id_candidature",
             "type": "uuid",
             "comment": "ID de la candidature",
-            "fn": lambda o: o["pk"],
+            "fn": lambda o: o["jobapplication_id"],
         },
     ]
 )
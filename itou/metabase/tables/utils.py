@@ -30,9 +30,13 @@ from itou.users.models import User
 
 
 class MetabaseTable:
-    def __init__(self, name):
+    def __init__(self, name, updated_at_lookups=()):
         self.name = name
         self.columns = []
+        # ORM lookups telling when a source object, or a related object its columns are built from,
+        # was last modified, e.g. `updated_at` and `to_company__updated_at`.
+        # Tables defining them can be updated incrementally, their `id` column being the source object pk.
+        self.updated_at_lookups = updated_at_lookups
 
     def add_columns(self, columns):
         self.columns += columns
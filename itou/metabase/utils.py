@@ -1,3 +1,8 @@
+from operator import attrgetter
+
+from django.db.models import Q
+
+
 def convert_boolean_to_int(b):
     # True => 1, False => 0, None => None.
     return None if b is None else int(b)
@@ -12,24 +17,41 @@ def compose(f, g):
     return lambda *a, **kw: f(g(*a, **kw))
 
 
+def _get_key_value(row, key):
+    if isinstance(row, dict):
+        return row[key]
+    return attrgetter(key.replace("__", "."))(row)
+
+
+def _get_rows_after_filter(keys, values):
+    # Row-value comparison `(k1, k2) > (v1, v2)`, i.e. `k1 > v1 OR (k1 = v1 AND k2 > v2)`.
+    q = Q()
+    for i, key in enumerate(keys):
+        q |= Q(**dict(zip(keys[:i], values[:i])), **{f"{key}__gt": values[i]})
+    return q
+
+
 def chunked_queryset(queryset, chunk_size=10000):
     """
-    Slice a queryset into chunks. This is useful to avoid memory issues when
-    iterating through large querysets.
-    Credits go to:
-    https://medium.com/@rui.jorge.rei/today-i-learned-django-memory-leak-and-the-sql-query-cache-1c152f62f64
-    Code initially adapted from https://djangosnippets.org/snippets/10599/
+    Iterate over a queryset chunk by chunk, each chunk being a list of at most chunk_size rows.
+    This is useful to avoid memory issues when iterating through large querysets.
+
+    Chunks are fetched with keyset pagination (`WHERE key > last_key ORDER BY key LIMIT chunk_size`)
+    instead of OFFSET, so that the last chunk is as fast to fetch as the first one.
+
+    The key is the explicit ordering of the queryset (ascending fields only, which must
+    uniquely identify a row) or the pk (integer or UUID) otherwise.
     """
-    queryset = queryset.order_by("pk")
-    pks = queryset.values_list("pk", flat=True)
-    if not pks:
-        return
-    start_pk = pks[0]
+    keys = queryset.query.order_by or ("pk",)
+    if not all(isinstance(key, str) and not key.startswith("-") for key in keys):
+        raise ValueError(f"Cannot chunk a queryset ordered by {keys}, use ascending fields.")
+    queryset = queryset.order_by(*keys)
+    chunk_qs = queryset
     while True:
-        try:
-            end_pk = pks.filter(pk__gte=start_pk)[chunk_size]
-        except IndexError:
-            break
-        yield queryset.filter(pk__gte=start_pk, pk__lt=end_pk)
-        start_pk = end_pk
-    yield queryset.filter(pk__gte=start_pk)
+        chunk = list(chunk_qs[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_values = [_get_key_value(chunk[-1], key) for key in keys]
+        chunk_qs = queryset.filter(_get_rows_after_filter(keys, last_values))
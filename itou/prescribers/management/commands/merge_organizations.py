@@ -2,6 +2,7 @@ import argparse
 import logging
 
 from django.db import transaction
+from django.utils import timezone
 
 from itou.approvals import models as approvals_models
 from itou.eligibility import models as eligibility_models
@@ -10,6 +11,7 @@ from itou.job_applications import models as job_applications_models
 from itou.prescribers import models as prescribers_models
 from itou.users import models as users_models
 from itou.utils.command import BaseCommand
+from itou.utils.perms.memberships import invalidate_organizations_cache
 
 
 logger = logging.getLogger(__name__)
@@ -114,8 +116,12 @@ def organization_merge_into(from_id, to_id, *, wet_run):
 
     if wet_run:
         with transaction.atomic():
-            job_applications.update(sender_prescriber_organization_id=to_id)
+            # Queryset updates do not bump `updated_at`, which tells the job application changed.
+            job_applications.update(sender_prescriber_organization_id=to_id, updated_at=timezone.now())
+            moved_user_pks = list(members.values_list("user_id", flat=True))
             members.update(organization_id=to_id)
+            # Queryset updates don't send the signals invalidating the memberships resolved by the middleware.
+            transaction.on_commit(lambda: invalidate_organizations_cache(moved_user_pks))
             diagnoses.update(author_prescriber_organization_id=to_id)
             geiq_diagnoses.update(author_prescriber_organization_id=to_id)
             invitations.update(organization_id=to_id)
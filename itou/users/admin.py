@@ -4,6 +4,7 @@ from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import PermissionDenied
+from django.db import transaction
 from django.db.models import Exists, OuterRef
 from django.shortcuts import get_object_or_404, redirect
 from django.template.response import TemplateResponse
@@ -36,6 +37,7 @@ from itou.utils.admin import (
     get_admin_view_link,
 )
 from itou.utils.models import PkSupportRemark
+from itou.utils.perms.memberships import invalidate_organizations_cache
 
 
 class EmailAddressInline(ItouTabularInline):
@@ -407,6 +409,8 @@ class ItouUserAdmin(InconsistencyCheckMixin, UserAdmin):
         user.save(update_fields=("email", "username", "is_active"))
         user.prescribermembership_set.update(is_active=False)
         user.companymembership_set.update(is_active=False)
+        # Queryset updates don't send the signals invalidating the memberships resolved by the middleware.
+        transaction.on_commit(lambda: invalidate_organizations_cache([user.pk]))
 
         messages.success(request, "L'utilisateur peut à présent se créer un nouveau compte")
 
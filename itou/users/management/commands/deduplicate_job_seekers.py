@@ -94,6 +94,8 @@ class Command(XlsxExportMixin, DeprecatedLoggerMixin, BaseCommand):
                         default=F("sender"),
                         output_field=JobApplication._meta.get_field("sender"),
                     ),
+                    # Queryset updates do not bump `updated_at`, which tells the job application changed.
+                    updated_at=timezone.now(),
                 )
                 user.eligibility_diagnoses.update(job_seeker=target)
                 user.delete()
@@ -10,7 +10,7 @@ from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinLengthValidator
 from django.db import models
-from django.db.models import Count, Q
+from django.db.models import Count, Prefetch, Q, prefetch_related_objects
 from django.db.models.functions import Upper
 from django.utils import timezone
 from django.utils.crypto import salted_hmac
@@ -453,6 +453,78 @@ class User(AbstractUser, AddressMixin):
 
         return self.latest_approval or self.latest_pe_approval
 
+    @classmethod
+    def prefetch_latest_common_approvals(cls, users):
+        """
+        Resolve `latest_approval` and `latest_pe_approval` of many users with a constant number of queries,
+        following the same rules as the cached properties above, and prime them on each instance.
+
+        Several instances of the same user can be given, e.g. the job seekers of a list of job applications.
+        Returns a `{user_pk: latest_common_approval}` dict.
+        """
+        users = list(users)
+        prefetch_related_objects(
+            users,
+            "jobseeker_profile",
+            Prefetch("approvals", queryset=Approval.objects.order_by("-start_at")),
+        )
+
+        instances = {}
+        for user in users:
+            instances.setdefault(user.pk, []).append(user)
+
+        nirs = set()
+        pole_emploi_ids = set()
+        birthdates = set()
+        for user, *_others in instances.values():
+            if not user.is_job_seeker:
+                continue
+            if user.jobseeker_profile.nir:
+                nirs.add(user.jobseeker_profile.nir)
+            if user.jobseeker_profile.pole_emploi_id and user.birthdate:
+                pole_emploi_ids.add(user.jobseeker_profile.pole_emploi_id)
+                birthdates.add(user.birthdate)
+        pe_approvals = []
+        if nirs or pole_emploi_ids:
+            # Same lookup as `PoleEmploiApprovalManager.find_for()`, for all the users at once.
+            pe_approvals = list(
+                PoleEmploiApproval.objects.filter(
+                    Q(nir__in=nirs) | Q(pole_emploi_id__in=pole_emploi_ids, birthdate__in=birthdates)
+                )
+            )
+        pe_approvals_by_nir = {}
+        pe_approvals_by_pole_emploi_id = {}
+        for pe_approval in pe_approvals:
+            if pe_approval.nir:
+                pe_approvals_by_nir.setdefault(pe_approval.nir, []).append(pe_approval)
+            if pe_approval.pole_emploi_id and pe_approval.birthdate:
+                key = (pe_approval.pole_emploi_id, pe_approval.birthdate)
+                pe_approvals_by_pole_emploi_id.setdefault(key, []).append(pe_approval)
+
+        common_approvals = {}
+        for pk, (user, *others) in instances.items():
+            latest_approval = latest_pe_approval = None
+            if user.is_job_seeker:
+                approvals = user.approvals.all()
+                latest_approval = _latest_approval(approvals)
+
+                profile = user.jobseeker_profile
+                candidates = {}
+                if profile.nir:
+                    candidates.update((pe.pk, pe) for pe in pe_approvals_by_nir.get(profile.nir, []))
+                if profile.pole_emploi_id and user.birthdate:
+                    key = (profile.pole_emploi_id, user.birthdate)
+                    candidates.update((pe.pk, pe) for pe in pe_approvals_by_pole_emploi_id.get(key, []))
+                approval_numbers = {approval.number for approval in approvals}
+                latest_pe_approval = _latest_pe_approval(
+                    [pe for pe in candidates.values() if pe.number not in approval_numbers]
+                )
+            for instance in [user, *others]:
+                instance.__dict__["latest_approval"] = latest_approval
+                instance.__dict__["latest_pe_approval"] = latest_pe_approval
+            common_approvals[pk] = user.latest_common_approval
+        return common_approvals
+
     @property
     def has_valid_common_approval(self):
         return (self.latest_approval and self.latest_approval.is_valid()) or (
@@ -631,7 +703,7 @@ class User(AbstractUser, AddressMixin):
 
         # Some candidates may not have accepted job applications
         # Assuming its the case can lead to issues downstream
-        return self.job_applications.accepted().with_accepted_at().order_by("-accepted_at", "-hiring_start_at").first()
+        return self.job_applications.accepted().order_by("-accepted_at", "-hiring_start_at").first()
 
     def last_hire_was_made_by_company(self, company):
         if not self.is_job_seeker:
@@ -699,6 +771,35 @@ class User(AbstractUser, AddressMixin):
         return UserKind(self.kind).label
 
 
+def _approvals_sort_key(approval):
+    return (-approval.end_at.toordinal(), approval.start_at.toordinal())
+
+
+def _latest_approval(approvals):
+    # Same rules as `User.latest_approval`, from the prefetched approvals of a job seeker.
+    if not approvals:
+        return None
+    if valid_approvals := [approval for approval in approvals if approval.is_valid()]:
+        # `approvals.valid().first()` follows `Approval.Meta.ordering`.
+        return max(valid_approvals, key=lambda approval: approval.created_at)
+    approval = min(approvals, key=_approvals_sort_key)
+    if approval.waiting_period_has_elapsed:
+        return None
+    return approval
+
+
+def _latest_pe_approval(pe_approvals):
+    # Same rules as `User.latest_pe_approval`, from the PE approvals found for a job seeker.
+    if not pe_approvals:
+        return None
+    # Break ties like `PoleEmploiApproval.objects.find_for()` ordering: `min()` keeps the first of them.
+    pe_approvals = sorted(pe_approvals, key=lambda pe_approval: pe_approval.number, reverse=True)
+    pe_approval = min(pe_approvals, key=_approvals_sort_key)
+    if pe_approval.waiting_period_has_elapsed:
+        return None
+    return pe_approval
+
+
 def get_allauth_account_user_display(user):
     return user.email
 
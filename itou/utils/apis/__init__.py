@@ -3,10 +3,11 @@ from django.conf import settings
 from .pole_emploi import PoleEmploiApiClient
 
 
-def pole_emploi_api_client():
+def pole_emploi_api_client(**kwargs):
     return PoleEmploiApiClient(
         settings.API_ESD["BASE_URL"],
         settings.API_ESD["AUTH_BASE_URL"],
         settings.API_ESD["KEY"],
         settings.API_ESD["SECRET"],
+        **kwargs,
     )
@@ -1,5 +1,7 @@
 import logging
 import re
+import threading
+import time
 
 import httpx
 from django.core.cache import caches
@@ -10,6 +12,7 @@ logger = logging.getLogger(__name__)
 
 API_CLIENT_HTTP_ERROR_CODE = "http_error"
 REFRESH_TOKEN_MARGIN_SECONDS = 10  # arbitrary value, in order not to be *right* on the expiry time.
+RATE_LIMIT_RETRIES = 5  # when a rate limiter is given, calls answered with a 429 are retried that many times
 
 
 class PoleEmploiAPIException(Exception):
@@ -78,16 +81,67 @@ def _pole_emploi_name(name: str, hyphenate=False, max_len=25) -> str:
     return replaced[:max_len]
 
 
+class RateLimiter:
+    """Token bucket shared by the threads calling the API.
+
+    `rate` tokens are added every second, up to `burst` tokens. When the API answers with a 429,
+    the rate is halved (down to `min_rate`) and no token is given for `cooldown` seconds.
+    It then grows back by 10% after each successful call, up to the initial rate.
+    """
+
+    def __init__(self, rate, burst=1, min_rate=0.5, cooldown=1):
+        self.max_rate = self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.cooldown = cooldown
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # _updated_at is in the future during a cooldown.
+        if now > self._updated_at:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._updated_at - now, 0) + (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def slow_down(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0
+            self._updated_at = time.monotonic() + self.cooldown
+        logger.warning("PE API rate limit reached, slowing down to rate=%.2f/s", self.rate)
+
+    def speed_up(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate * 1.1)
+
+
 class PoleEmploiApiClient:
-    def __init__(self, base_url, auth_base_url, key, secret):
+    def __init__(self, base_url, auth_base_url, key, secret, http_client=None, rate_limiter=None):
         self.base_url = base_url
         self.auth_base_url = auth_base_url
         self.key = key
         self.secret = secret
+        # An httpx.Client shares its connections pool between requests (and threads),
+        # the httpx module opens a connection per request.
+        self.http_client = http_client or httpx
+        self.rate_limiter = rate_limiter
+        self._token_lock = threading.Lock()
 
     def _refresh_token(self):
         scopes = " ".join(AUTHORIZED_SCOPES)
-        response = httpx.post(
+        response = self.http_client.post(
             f"{self.auth_base_url}/connexion/oauth2/access_token",
             params={"realm": "/partenaire"},
             data={
@@ -109,13 +163,21 @@ class PoleEmploiApiClient:
         )
         return token
 
-    def _request(self, url, data=None, params=None, method="POST"):
-        try:
+    def _get_token(self):
+        # Don't let concurrent threads refresh the token at the same time.
+        with self._token_lock:
             token = caches["failsafe"].get(CACHE_API_TOKEN_KEY)
             if not token:
                 token = self._refresh_token()
-
-            response = httpx.request(
+            return token
+
+    def _send(self, method, url, params, data):
+        token = self._get_token()
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            response = self.http_client.request(
                 method,
                 url,
                 params=params,
@@ -123,6 +185,19 @@ class PoleEmploiApiClient:
                 headers={"Authorization": token, "Content-Type": "application/json"},
                 timeout=API_TIMEOUT_SECONDS,
             )
+            if self.rate_limiter is None:
+                return response
+            if response.status_code != 429:
+                self.rate_limiter.speed_up()
+                return response
+            self.rate_limiter.slow_down()
+            if attempt == RATE_LIMIT_RETRIES:
+                return response
+            attempt += 1
+
+    def _request(self, url, data=None, params=None, method="POST"):
+        try:
+            response = self._send(method, url, params, data)
             if response.status_code == 204:
                 return None
             if response.status_code == 429:
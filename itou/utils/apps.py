@@ -1,5 +1,6 @@
 from django.apps import AppConfig
 from django.core.checks import Tags, register
+from django.db import models
 
 from itou.utils.checks import check_verbose_name_lower
 
@@ -11,3 +12,36 @@ class UtilsAppConfig(AppConfig):
     def ready(self):
         super().ready()
         register(Tags.models)(check_verbose_name_lower)
+        self.connect_organizations_cache_signals()
+
+    def connect_organizations_cache_signals(self):
+        from itou.companies.models import Company, CompanyMembership, SiaeConvention
+        from itou.institutions.models import Institution, InstitutionMembership
+        from itou.prescribers.models import PrescriberMembership, PrescriberOrganization
+        from itou.users.models import User
+        from itou.utils.perms import memberships
+
+        receivers = [
+            (User, memberships.invalidate_organizations_cache_for_user),
+            (SiaeConvention, memberships.invalidate_organizations_cache_for_convention),
+        ]
+        for model in [CompanyMembership, PrescriberMembership, InstitutionMembership]:
+            receivers.append((model, memberships.invalidate_organizations_cache_for_membership))
+        for model in [Company, PrescriberOrganization, Institution]:
+            receivers.append((model, memberships.invalidate_organizations_cache_for_organization))
+            models.signals.m2m_changed.connect(
+                memberships.invalidate_organizations_cache_for_members_changed,
+                sender=model.members.through,
+                dispatch_uid=f"organizations-cache-{model.__name__}-members",
+            )
+        for model, receiver in receivers:
+            models.signals.post_save.connect(
+                receiver, sender=model, dispatch_uid=f"organizations-cache-{model.__name__}-save"
+            )
+        # Memberships are deleted along with their user or organization.
+        for model in [CompanyMembership, PrescriberMembership, InstitutionMembership]:
+            models.signals.post_delete.connect(
+                memberships.invalidate_organizations_cache_for_membership,
+                sender=model,
+                dispatch_uid=f"organizations-cache-{model.__name__}-delete",
+            )
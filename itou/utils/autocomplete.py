@@ -0,0 +1,242 @@
+"""
+Process-local indexes of the cities, communes and appellations, used by the autocomplete views.
+
+These reference tables only change when `sync_cities`, `sync_communes` and `sync_romes_and_appellations`
+run (or when the staff edits a city in the admin). Instead of querying PostgreSQL on every
+keystroke, each process lazily loads the table once and answers searches from memory.
+
+Indexes are keyed on a version token per model stored in the failsafe cache, which is renewed by the
+sync commands and when an instance is saved (see `itou.utils.autocomplete_versions` and `itou.www.autocomplete.apps`).
+When Redis is down, the already loaded index is kept.
+"""
+
+import bisect
+import heapq
+import itertools
+import threading
+from array import array
+
+from django.db import connection
+from unidecode import unidecode
+
+from itou.asp.models import Commune
+from itou.cities.models import City
+from itou.jobs.models import Appellation, Rome, split_words
+from itou.utils.autocomplete_versions import get_version
+
+
+NGRAM_SIZE = 3
+
+
+def normalize(name):
+    return unidecode(name.lower())
+
+
+def ngrams(text):
+    return {text[i : i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+class VersionedIndex:
+    """
+    Data loaded from `model` by `load()`, reloaded when the version of `model` changes.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+
+    def load(self):
+        raise NotImplementedError
+
+    def refresh(self):
+        version = get_version(self.model)
+        if self._data is not None and (version is None or version == self._version):
+            return self._data
+        with self._lock:
+            if self._data is None or (version is not None and version != self._version):
+                # Swap everything at once, other threads may be searching the previous data.
+                self._data = self.load()
+                self._version = version
+            return self._data
+
+
+class AutocompleteIndex(VersionedIndex):
+    """
+    Substring search on the unaccented name of `model` instances.
+
+    Results are ordered by best match position, then name, then `extra_ordering_by`.
+    Entries are stored in (name, extra_ordering_by) order, so that the position of an entry
+    in the index is its tie breaker.
+    """
+
+    def __init__(self, model, fields, extra_ordering_by, codes, with_period=False):
+        super().__init__(model)
+        self.fields = ["id", "name", extra_ordering_by, *fields]
+        if with_period:
+            self.fields += ["start_date", "end_date"]
+        self.extra_ordering_by = extra_ordering_by
+        self.codes = codes
+
+    def load(self):
+        rows = list(self.model.objects.values(*self.fields))
+        # Approximate the database collation, which ignores accents and case.
+        rows.sort(key=lambda row: (normalize(row["name"]), row["name"], row[self.extra_ordering_by]))
+
+        names = []
+        postings = {}
+        codes = []
+        for idx, row in enumerate(rows):
+            name = normalize(row["name"])
+            names.append(name)
+            # Index n-grams of the name with hyphens folded into spaces, so that a single lookup
+            # finds candidates for both the spaced and the hyphenated versions of the term.
+            for ngram in ngrams(name.replace("-", " ")):
+                postings.setdefault(ngram, array("I")).append(idx)
+            codes.extend((code, idx) for code in self.codes(row))
+        codes.sort()
+        return rows, names, postings, codes
+
+    def _is_valid(self, row, at):
+        if at is None:
+            return True
+        return row["start_date"] <= at and (row["end_date"] is None or row["end_date"] > at)
+
+    def search_name(self, term, limit, at=None):
+        # We started with a trigram similarity and word similarity approach. It is disappointing
+        # since it does return results that are not expected, for instance results containing
+        # letters not present in the search.
+        # It has been decided with the UX to use the simplest approach. It seems that most
+        # people look for a city by "the start of the name", not by "any word within the name"
+        # so the substring match, ordered by index of the matching string, feels more natural.
+        # The hyphenated/unhyphenated thing has been added considering the mess that hyphens
+        # represent in french city names. It should be improved in the future to handle cases
+        # such as search terms “La Chapelle du” not finding La Chapelle-du-Châtelard.
+        rows, names, postings, _codes = self.refresh()
+        term = normalize(term)
+        term_spaced = term.replace("-", " ")
+        term_hyphenated = term.replace(" ", "-")
+
+        if len(term_spaced) >= NGRAM_SIZE:
+            candidates = None
+            for ngram in ngrams(term_spaced):
+                posting = set(postings.get(ngram, ()))
+                candidates = posting if candidates is None else candidates & posting
+                if not candidates:
+                    return []
+        else:
+            candidates = range(len(names))
+
+        matches = []
+        for idx in candidates:
+            name = names[idx]
+            positions = [pos for pos in (name.find(term_spaced), name.find(term_hyphenated)) if pos >= 0]
+            if positions and self._is_valid(rows[idx], at):
+                matches.append((min(positions), idx))
+        return [self.model(**rows[idx]) for _pos, idx in heapq.nsmallest(limit, matches)]
+
+    def search_code(self, term, limit, at=None, prefix=False):
+        rows, _names, _postings, codes = self.refresh()
+        matches = set()
+        for code, idx in itertools.islice(codes, bisect.bisect_left(codes, (term,)), None):
+            if not (code.startswith(term) if prefix else code == term):
+                break
+            if self._is_valid(rows[idx], at):
+                matches.add(idx)
+        return [self.model(**rows[idx]) for idx in heapq.nsmallest(limit, matches)]
+
+
+class AppellationIndex(VersionedIndex):
+    """
+    Prefix search on the full text search lexemes of the appellations, ordered by name.
+
+    It mimics `Appellation.objects.autocomplete()`: every word of the search must be the prefix
+    of a lexeme of the appellation, once stemmed by the `french_unaccent` configuration.
+    The lexemes and the stems of the words used in the appellations names are computed by
+    PostgreSQL when the index is loaded. Other words are stemmed to the longest lexeme they
+    start with, unless they are themselves the prefix of a lexeme (the user is still typing).
+    """
+
+    def __init__(self):
+        super().__init__(Appellation)
+
+    def load(self):
+        rows = list(Appellation.objects.values("code", "name", "rome_id", "rome__name"))
+        # Approximate the database collation, which ignores accents and case.
+        rows.sort(key=lambda row: (normalize(row["name"]), row["name"], row["code"]))
+        code_to_idx = {row["code"]: idx for idx, row in enumerate(rows)}
+
+        postings = {}
+        words = set()
+        for row in rows:
+            words.update(normalize(word) for word in split_words(row["name"]))
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT code, lexeme FROM {Appellation._meta.db_table}, unnest(full_text)")
+            for code, lexeme in cursor.fetchall():
+                postings.setdefault(lexeme, array("I")).append(code_to_idx[code])
+            cursor.execute(
+                """
+                SELECT word, ARRAY(SELECT lexeme FROM unnest(to_tsvector('french_unaccent', word)))
+                FROM unnest(%s::text[]) AS word
+                """,
+                [sorted(words)],
+            )
+            stems = dict(cursor.fetchall())
+        return rows, postings, sorted(postings), stems
+
+    def _stems(self, word, lexemes, stems):
+        if word in stems:
+            # Stop words have no stem and are ignored, like `to_tsquery` does.
+            return stems[word]
+        start = bisect.bisect_left(lexemes, word)
+        if start < len(lexemes) and lexemes[start].startswith(word):
+            return [word]
+        for length in range(len(word) - 1, 0, -1):
+            idx = bisect.bisect_left(lexemes, word[:length])
+            if idx < len(lexemes) and lexemes[idx] == word[:length]:
+                return [word[:length]]
+        return [word]
+
+    def search(self, search_string, limit=10, rome_code=None):
+        rows, postings, lexemes, stems = self.refresh()
+        candidates = None
+        for word in split_words(search_string):
+            for stem in self._stems(normalize(word), lexemes, stems):
+                matches = set()
+                start = bisect.bisect_left(lexemes, stem)
+                for lexeme in itertools.islice(lexemes, start, None):
+                    if not lexeme.startswith(stem):
+                        break
+                    matches.update(postings[lexeme])
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    return []
+        if candidates is None:
+            return []
+        if rome_code:
+            candidates = [idx for idx in candidates if rows[idx]["rome_id"] == rome_code]
+        appellations = []
+        for idx in heapq.nsmallest(limit, candidates):
+            row = rows[idx]
+            rome = Rome(code=row["rome_id"], name=row["rome__name"]) if row["rome_id"] else None
+            appellations.append(Appellation(code=row["code"], name=row["name"], rome=rome))
+        return appellations
+
+
+cities_index = AutocompleteIndex(
+    City,
+    fields=["slug", "post_codes"],
+    extra_ordering_by="department",
+    codes=lambda row: row["post_codes"],
+)
+
+communes_index = AutocompleteIndex(
+    Commune,
+    fields=[],
+    extra_ordering_by="code",
+    codes=lambda row: [row["code"]],
+    with_period=True,
+)
+
+appellations_index = AppellationIndex()
@@ -0,0 +1,28 @@
+"""
+Version tokens of the autocomplete indexes, per model.
+
+Renewing the token of a model makes every process reload its index of that model, see
+`itou.utils.autocomplete`.
+"""
+
+import uuid
+
+from django.core.cache import caches
+
+
+def version_cache_key(model):
+    return f"autocomplete-index-version:{model._meta.label_lower}"
+
+
+def bump_version(sender, **kwargs):
+    caches["failsafe"].set(version_cache_key(sender), uuid.uuid4().hex, None)
+
+
+def get_version(model):
+    cache = caches["failsafe"]
+    key = version_cache_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
@@ -1,11 +1,17 @@
 import io
+import tempfile
+import uuid
 
 import openpyxl
 import xlsx_streaming
 from django import http
+from django.core.files import File
+from django.core.files.storage import default_storage
 from django.utils import timezone
 from django.utils.http import content_disposition_header
 
+from itou.utils.storage.s3 import TEMPORARY_STORAGE_PREFIX
+
 
 def generate_excel_sheet(headers, rows):
     workbook = openpyxl.Workbook()
@@ -31,16 +37,35 @@ def _generate_excel_template(headers):
     return buffer
 
 
+def _stream_xlsx(queryset, headers, serializer):
+    xlsx_streaming.set_export_timezone(timezone.get_default_timezone())
+    template = _generate_excel_template(headers)
+    return xlsx_streaming.stream_queryset_as_xlsx(queryset, template, serializer=serializer)
+
+
 def to_streaming_response(queryset, filename, headers, serializer, with_time=False):
     """Generate a HTTP Streaming response with a XLSX file"""
 
-    xlsx_streaming.set_export_timezone(timezone.get_default_timezone())
     openxml_mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    template = _generate_excel_template(headers)
-    stream = xlsx_streaming.stream_queryset_as_xlsx(queryset, template, serializer=serializer)
+    stream = _stream_xlsx(queryset, headers, serializer)
     response = http.StreamingHttpResponse(stream, content_type=openxml_mimetype)
     if with_time:
         now = timezone.now().isoformat(timespec="seconds").replace(":", "-")
         filename = f"{filename}-{now}"
     response["Content-Disposition"] = content_disposition_header(as_attachment=True, filename=f"{filename}.xlsx")
     return response
+
+
+def to_storage(queryset, filename, headers, serializer):
+    """
+    Write a XLSX file in the default storage and return its name.
+
+    Files are stored with the temporary files, removed by the bucket lifecycle rules.
+    """
+    with tempfile.TemporaryFile() as xlsx_file:
+        for chunk in _stream_xlsx(queryset, headers, serializer):
+            xlsx_file.write(chunk)
+        xlsx_file.seek(0)
+        return default_storage.save(
+            f"{TEMPORARY_STORAGE_PREFIX}/exports/{uuid.uuid4()}/{filename}.xlsx", File(xlsx_file)
+        )
@@ -2,9 +2,22 @@ from django.core.paginator import EmptyPage, InvalidPage, Page, Paginator
 
 
 class ItouPaginator(Paginator):
-    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, max_pages_num=10):
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, max_pages_num=10, count=None):
         super().__init__(object_list, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page)
         self.max_pages_num = max_pages_num
+        self.has_given_count = count is not None
+        if self.has_given_count:
+            # Overrides the `count` cached property, which would count the `object_list`.
+            self.count = count
+
+    def page(self, number):
+        if not self.has_given_count:
+            return super().page(number)
+        # The given count may be slightly outdated (e.g. cached): only rely on it for the pages numbers,
+        # instead of truncating the page to the count like Django does.
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom : bottom + self.per_page], number, self)
 
     def _get_page(self, *args, **kwargs):
         return ItouPage(*args, **kwargs)
@@ -32,7 +45,7 @@ class ItouPage(Page):
         self.display_pager = total_pages > 1
 
 
-def pager(queryset, page, items_per_page=10, pages_num=10):
+def pager(queryset, page, items_per_page=10, pages_num=10, count=None):
     """
     A generic pager built on top of Django core's Paginator.
     https://docs.djangoproject.com/en/dev/topics/pagination/
@@ -42,13 +55,15 @@ def pager(queryset, page, items_per_page=10, pages_num=10):
         page: int, current page number
         items_per_page: int, number of items per page
         pages_num: int, number of pages to display
+        count: int, number of items of the queryset, when it can be computed
+            more efficiently than with `queryset.count()`
 
     Returns:
         custom_pager: a django.core.paginator.Page instance with a few additional attributes:
             pages_to_display: list, allow to iterate and create a google-style pager
             display_pager: bool, True if there are more than one page to display
     """
-    paginator = ItouPaginator(queryset, items_per_page, max_pages_num=pages_num)
+    paginator = ItouPaginator(queryset, items_per_page, max_pages_num=pages_num, count=count)
 
     try:
         page = int(page)
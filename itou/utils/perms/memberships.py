@@ -0,0 +1,123 @@
+"""
+Active memberships of the users, resolved on every request by `ItouCurrentOrganizationMiddleware`.
+"""
+
+from django.core.cache import caches
+
+from itou.companies.models import Company
+from itou.institutions.models import Institution
+from itou.prescribers.models import PrescriberOrganization
+
+
+ORGANIZATIONS_CACHE_TIMEOUT = 5 * 60
+
+
+def organizations_cache_key(user_pk):
+    return f"current-organizations:{user_pk}"
+
+
+def invalidate_organizations_cache(user_pks):
+    caches["failsafe"].delete_many([organizations_cache_key(user_pk) for user_pk in user_pks if user_pk])
+
+
+def invalidate_organizations_cache_for_user(sender, instance, **kwargs):
+    invalidate_organizations_cache([instance.pk])
+
+
+def invalidate_organizations_cache_for_membership(sender, instance, **kwargs):
+    invalidate_organizations_cache([instance.user_id])
+
+
+def invalidate_organizations_cache_for_organization(sender, instance, **kwargs):
+    invalidate_organizations_cache(instance.members.values_list("pk", flat=True))
+
+
+def invalidate_organizations_cache_for_convention(sender, instance, **kwargs):
+    invalidate_organizations_cache(instance.siaes.values_list("members", flat=True))
+
+
+def invalidate_organizations_cache_for_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # `organization.members.add(user)` and the like don't send `post_save` for the membership.
+    if action in ("post_add", "post_remove"):
+        invalidate_organizations_cache([instance.pk] if reverse else pk_set)
+    elif action == "pre_clear":
+        invalidate_organizations_cache([instance.pk] if reverse else instance.members.values_list("pk", flat=True))
+
+
+def get_active_memberships(user):
+    """
+    Return the `(organization, is_admin)` pairs of the active memberships of the user,
+    in the order used to choose the default current organization,
+    and whether the user has any active membership (even in an inactive organization).
+    """
+    if user.is_employer:
+        active_memberships = list(user.companymembership_set.filter(is_active=True).order_by("created_at"))
+        companies = {
+            company.pk: company
+            for company in user.company_set.filter(
+                pk__in=[membership.company_id for membership in active_memberships]
+            ).active_or_in_grace_period()
+        }
+        really_active_memberships = []
+        for membership in active_memberships:
+            if membership.company_id in companies:
+                # The company is active (or in grace period)
+                membership.company = companies[membership.company_id]
+                really_active_memberships.append(membership)
+        # If there is no current company, we want to default to the first active one
+        # (and preferably not one in grace period)
+        really_active_memberships.sort(key=lambda m: (m.company.has_convention_in_grace_period, m.created_at))
+        return [(m.company, m.is_admin) for m in really_active_memberships], bool(active_memberships)
+
+    if user.is_prescriber:
+        memberships = user.prescribermembership_set.select_related("organization")
+        org_through_field = "organization"
+    elif user.is_labor_inspector:
+        memberships = user.institutionmembership_set.select_related("institution")
+        org_through_field = "institution"
+    else:
+        return [], False
+    memberships = [
+        (getattr(membership, org_through_field), membership.is_admin)
+        for membership in memberships.filter(is_active=True).order_by("created_at")
+    ]
+    return memberships, bool(memberships)
+
+
+def get_cached_active_memberships(user):
+    """
+    Cached version of `get_active_memberships()`, saving a few queries on every request.
+
+    Only the `(organization pk, is_admin)` pairs are cached: the organizations themselves are fetched
+    on every request, so that views saving them don't write stale values back.
+
+    Entries are invalidated when a membership, an organization, a convention or the user is saved
+    (see `itou.utils.apps`). Bulk updates don't send signals, and companies may leave their grace
+    period: entries expire after `ORGANIZATIONS_CACHE_TIMEOUT` anyway.
+    """
+    cache = caches["failsafe"]
+    key = organizations_cache_key(user.pk)
+    cached = cache.get(key)
+    if cached is None:
+        memberships, has_active_memberships = get_active_memberships(user)
+        cache.set(
+            key,
+            ([(organization.pk, is_admin) for organization, is_admin in memberships], has_active_memberships),
+            ORGANIZATIONS_CACHE_TIMEOUT,
+        )
+        return memberships, has_active_memberships
+
+    memberships, has_active_memberships = cached
+    if not memberships:
+        return [], has_active_memberships
+    if user.is_employer:
+        model = Company
+    elif user.is_prescriber:
+        model = PrescriberOrganization
+    else:
+        model = Institution
+    organizations = model.objects.in_bulk([pk for pk, _is_admin in memberships])
+    # Organizations deleted in the meantime are skipped.
+    return [
+        (organizations[pk], is_admin) for pk, is_admin in memberships if pk in organizations
+    ], has_active_memberships
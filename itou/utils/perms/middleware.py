@@ -7,20 +7,20 @@ from django.utils.safestring import mark_safe
 
 from itou.users.enums import IdentityProvider, UserKind
 from itou.utils import constants as global_constants
+from itou.utils.perms.memberships import get_cached_active_memberships
 from itou.www.login import urls as login_urls
 
 
-def extract_membership_infos_and_update_session(memberships, org_through_field, session):
+def extract_membership_infos_and_update_session(memberships, session):
     current_org_pk = session.get(global_constants.ITOU_SESSION_CURRENT_ORGANIZATION_KEY)
     orgs = []
     current_org = None
     admin_status = {}
-    for membership in memberships:
-        org = getattr(membership, org_through_field)
+    for org, is_admin in memberships:
         orgs.append(org)
         if org.pk == current_org_pk:
             current_org = org
-        admin_status[org.pk] = membership.is_admin
+        admin_status[org.pk] = is_admin
     if current_org is None:
         if orgs:
             # If an org exists, choose the first one
@@ -51,87 +51,40 @@ class ItouCurrentOrganizationMiddleware:
         user = request.user
 
         redirect_message = None
-        if user.is_authenticated:
-            if user.is_employer:
-                active_memberships = list(user.companymembership_set.filter(is_active=True).order_by("created_at"))
-                companies = {
-                    company.pk: company
-                    for company in user.company_set.filter(
-                        pk__in=[membership.company_id for membership in active_memberships]
-                    ).active_or_in_grace_period()
-                }
-                really_active_memberships = []
-                for membership in active_memberships:
-                    if membership.company_id in companies:
-                        # The company is active (or in grace period)
-                        membership.company = companies[membership.company_id]
-                        really_active_memberships.append(membership)
-                # If there is no current company, we want to default to the first active one
-                # (and preferably not one in grace period)
-                really_active_memberships.sort(key=lambda m: (m.company.has_convention_in_grace_period, m.created_at))
-
-                (
-                    request.organizations,
-                    request.current_organization,
-                    request.is_current_organization_admin,
-                ) = extract_membership_infos_and_update_session(
-                    really_active_memberships,
-                    "company",
-                    request.session,
-                )
-
-                if not request.current_organization:
-                    # SIAE user has no active SIAE and thus must not be able to access any page,
-                    # thus we force a logout with a few exceptions (cf skip_middleware_conditions)
-                    if not active_memberships:
-                        redirect_message = mark_safe(
-                            "Nous sommes désolés, votre compte n'est "
-                            "actuellement rattaché à aucune structure.<br>"
-                            "Nous espérons cependant avoir l'occasion de vous accueillir de "
-                            "nouveau."
-                        )
-                    else:
-                        redirect_message = (
-                            "Nous sommes désolés, votre compte n'est "
-                            "malheureusement plus actif car la ou les "
-                            "structures associées ne sont plus "
-                            "conventionnées. Nous espérons cependant "
-                            "avoir l'occasion de vous accueillir de "
-                            "nouveau."
-                        )
-
-            elif user.is_prescriber:
-                (
-                    request.organizations,
-                    request.current_organization,
-                    request.is_current_organization_admin,
-                ) = extract_membership_infos_and_update_session(
-                    user.prescribermembership_set.filter(is_active=True)
-                    .order_by("created_at")
-                    .select_related("organization"),
-                    "organization",
-                    request.session,
-                )
-
-            elif user.is_labor_inspector:
-                (
-                    request.organizations,
-                    request.current_organization,
-                    request.is_current_organization_admin,
-                ) = extract_membership_infos_and_update_session(
-                    user.institutionmembership_set.filter(is_active=True)
-                    .order_by("created_at")
-                    .select_related("institution"),
-                    "institution",
-                    request.session,
-                )
-                if not request.current_organization:
+        if user.is_authenticated and (user.is_employer or user.is_prescriber or user.is_labor_inspector):
+            memberships, has_active_memberships = get_cached_active_memberships(user)
+            (
+                request.organizations,
+                request.current_organization,
+                request.is_current_organization_admin,
+            ) = extract_membership_infos_and_update_session(memberships, request.session)
+
+            if user.is_employer and not request.current_organization:
+                # SIAE user has no active SIAE and thus must not be able to access any page,
+                # thus we force a logout with a few exceptions (cf skip_middleware_conditions)
+                if not has_active_memberships:
                     redirect_message = mark_safe(
                         "Nous sommes désolés, votre compte n'est "
                         "actuellement rattaché à aucune structure.<br>"
                         "Nous espérons cependant avoir l'occasion de vous accueillir de "
                         "nouveau."
                     )
+                else:
+                    redirect_message = (
+                        "Nous sommes désolés, votre compte n'est "
+                        "malheureusement plus actif car la ou les "
+                        "structures associées ne sont plus "
+                        "conventionnées. Nous espérons cependant "
+                        "avoir l'occasion de vous accueillir de "
+                        "nouveau."
+                    )
+            elif user.is_labor_inspector and not request.current_organization:
+                redirect_message = mark_safe(
+                    "Nous sommes désolés, votre compte n'est "
+                    "actuellement rattaché à aucune structure.<br>"
+                    "Nous espérons cependant avoir l'occasion de vous accueillir de "
+                    "nouveau."
+                )
 
         # Accepting an invitation to join a group is a two-step process.
         # - View one: account creation or login.
@@ -14,16 +14,25 @@ def get_all_available_job_applications_as_prescriber(request):
     through my own user or through my organization.
     This helper filters the data accordingly.
     """
-    from itou.job_applications.models import JobApplication
-
+    prescriber_organization = None
     if request.current_organization and request.user.is_prescriber:  # Set by middleware for prescriber users
         prescriber_organization = get_current_org_or_404(request)
+    return get_all_available_job_applications_for_prescriber(request.user, prescriber_organization)
+
+
+def get_all_available_job_applications_for_prescriber(user, prescriber_organization=None):
+    """
+    Same as `get_all_available_job_applications_as_prescriber`, outside of a request.
+    """
+    from itou.job_applications.models import JobApplication
+
+    if prescriber_organization:
         # Show all applications organization-wide + applications sent by the
         # current user for backward compatibility (in the past, a user could
         # create his prescriber's organization later on).
         return JobApplication.objects.filter(
-            (Q(sender=request.user) & Q(sender_prescriber_organization__isnull=True))
+            (Q(sender=user) & Q(sender_prescriber_organization__isnull=True))
             | Q(sender_prescriber_organization=prescriber_organization)
         )
     else:
-        return request.user.job_applications_sent
+        return user.job_applications_sent
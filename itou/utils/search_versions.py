@@ -0,0 +1,21 @@
+"""
+Version tokens of the cached search results, per kind of results and department.
+
+Renewing the token of a department invalidates the cached results of the searches covering it,
+see `itou.www.search.cache`.
+"""
+
+import uuid
+
+from django.core.cache import caches
+
+
+def version_cache_key(kind, department):
+    return f"search-results-version:{kind}:{department}"
+
+
+def bump_versions(kind, departments):
+    caches["failsafe"].set_many(
+        {version_cache_key(kind, department): uuid.uuid4().hex for department in departments if department},
+        None,
+    )
@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+from django.db import models
+
+
+class ApplyAppConfig(AppConfig):
+    name = "itou.www.apply"
+
+    def ready(self):
+        super().ready()
+        from itou.job_applications.models import JobApplication
+        from itou.www.apply.cache import bump_versions
+
+        models.signals.post_save.connect(bump_versions, sender=JobApplication, dispatch_uid="apply-list-counts-save")
+        models.signals.post_delete.connect(
+            bump_versions, sender=JobApplication, dispatch_uid="apply-list-counts-delete"
+        )
@@ -0,0 +1,68 @@
+"""
+Cache of the number of job applications in the lists of employers and prescribers.
+
+For large organizations, counting the filtered job applications costs as much as fetching the page.
+Counts are keyed on the owners of the list (company, prescriber organization or user), on a version
+token per owner, renewed whenever one of their job applications is saved (see `apps.py`), and on
+the filters. Other changes (e.g. the suspension of an approval) are counted after `COUNT_CACHE_TIMEOUT`.
+
+The `failsafe` cache returns None when Redis is down, so counts are then computed on every request.
+"""
+
+import hashlib
+import json
+import uuid
+
+from django.core.cache import caches
+from django.db.models import Count
+
+
+COUNT_CACHE_TIMEOUT = 60
+
+
+def version_cache_key(model_name, pk):
+    return f"job-applications-list-version:{model_name}:{pk}"
+
+
+def bump_versions(sender, instance, **kwargs):
+    owners = [
+        ("company", instance.to_company_id),
+        ("prescriberorganization", instance.sender_prescriber_organization_id),
+        ("user", instance.sender_id),
+    ]
+    caches["failsafe"].set_many(
+        {version_cache_key(model_name, pk): uuid.uuid4().hex for model_name, pk in owners if pk is not None},
+        None,
+    )
+
+
+def get_version(owner):
+    cache = caches["failsafe"]
+    key = version_cache_key(owner._meta.model_name, owner.pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def count_job_applications(name, queryset, owners, params):
+    """
+    Return the number of distinct job applications of `queryset`, which lists the job applications
+    of `owners` (model instances) filtered by `params`.
+
+    `name` identifies the list and `params` must be JSON serializable.
+    """
+    cache = caches["failsafe"]
+    key_parts = {
+        "owners": [(owner._meta.model_name, owner.pk, get_version(owner)) for owner in owners],
+        "params": params,
+    }
+    digest = hashlib.sha256(json.dumps(key_parts, sort_keys=True, default=str).encode()).hexdigest()
+    key = f"job-applications-list-count:{name}:{digest}"
+    count = cache.get(key)
+    if count is None:
+        # Filtering on selected jobs may return the same job application several times.
+        count = queryset.order_by().aggregate(count=Count("pk", distinct=True))["count"]
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
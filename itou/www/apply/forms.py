@@ -6,7 +6,7 @@ import sentry_sdk
 from dateutil.relativedelta import relativedelta
 from django import forms
 from django.core.exceptions import ValidationError
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.db.models.fields import BLANK_CHOICE_DASH
 from django.urls import reverse
 from django.utils import timezone
@@ -939,7 +939,14 @@ class FilterJobApplicationsForm(forms.Form):
         if departments := data.get("departments"):
             filters.append(Q(job_seeker__department__in=departments))
         if selected_jobs := data.get("selected_jobs"):
-            filters.append(Q(selected_jobs__appellation__code__in=selected_jobs))
+            # Not a join on `selected_jobs`, which would duplicate the applications matching several jobs.
+            filters.append(
+                Exists(
+                    JobApplication.selected_jobs.through.objects.filter(
+                        jobapplication=OuterRef("pk"), jobdescription__appellation__code__in=selected_jobs
+                    )
+                )
+            )
         if criteria := data.get("criteria"):
             # Filter on the `eligibility_diagnosis_criterion_{criterion}` annotation,
             # which is set in `with_list_related_data()`.
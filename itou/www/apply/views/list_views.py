@@ -1,18 +1,22 @@
 from collections import defaultdict
 
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.files.storage import default_storage
+from django.http import HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse_lazy
 from django.utils import timezone
 from django.utils.text import slugify
 
 from itou.companies.enums import SIAE_WITH_CONVENTION_KINDS
-from itou.eligibility.models import SelectedAdministrativeCriteria
-from itou.job_applications.export import stream_xlsx_export
+from itou.eligibility.models import EligibilityDiagnosis, SelectedAdministrativeCriteria
+from itou.job_applications.export import ExportState
 from itou.job_applications.models import JobApplicationWorkflow
+from itou.job_applications.tasks import request_xlsx_export
 from itou.utils.pagination import pager
 from itou.utils.perms.company import get_current_company_or_404
 from itou.utils.perms.prescriber import get_all_available_job_applications_as_prescriber
+from itou.www.apply.cache import count_job_applications
 from itou.www.apply.forms import (
     CompanyFilterJobApplicationsForm,
     FilterJobApplicationsForm,
@@ -31,11 +35,22 @@ def _add_pending_for_weeks(job_applications):
     for job_app in job_applications:
         pending_for_weeks = None
         if job_app.state in JobApplicationWorkflow.PENDING_STATES:
-            pending_for_seconds = (timezone.now() - job_app.last_change).total_seconds()
+            pending_for_seconds = (timezone.now() - job_app.last_change_at).total_seconds()
             pending_for_weeks = int(pending_for_seconds // SECONDS_IN_WEEK)
         job_app.pending_for_weeks = pending_for_weeks
 
 
+def _add_eligibility_diagnosis_by_siae_required(job_applications, company):
+    # Also primes the latest approvals of the job seekers, displayed in the list.
+    has_considered_valid = EligibilityDiagnosis.objects.has_considered_valid_for(
+        (job_application.job_seeker, company) for job_application in job_applications
+    )
+    for job_application in job_applications:
+        job_application.eligibility_diagnosis_by_siae_required = not has_considered_valid[
+            (job_application.job_seeker_id, company.pk)
+        ]
+
+
 def _add_administrative_criteria(job_applications):
     diagnoses_ids = tuple(
         job_application.jobseeker_eligibility_diagnosis
@@ -94,6 +109,10 @@ def list_for_job_seeker(request, template_name="apply/list_for_job_seeker.html")
     return render(request, template_name, context)
 
 
+def _filters_params(request):
+    return {key: sorted(values) for key, values in request.GET.lists() if key != "page"}
+
+
 @login_required
 @user_passes_test(lambda u: u.is_prescriber, login_url=reverse_lazy("search:employers_home"), redirect_field_name=None)
 def list_for_prescriber(request, template_name="apply/list_for_prescriber.html"):
@@ -105,14 +124,25 @@ def list_for_prescriber(request, template_name="apply/list_for_prescriber.html")
     filters_form = PrescriberFilterJobApplicationsForm(job_applications, request.GET or None)
 
     # Add related data giving the criteria for adding the necessary annotations
-    job_applications = job_applications.with_list_related_data(criteria=filters_form.data.getlist("criteria", []))
+    criteria = filters_form.data.getlist("criteria", [])
+    job_applications_to_count = job_applications.with_list_filters_data(criteria)
+    job_applications = job_applications.with_list_related_data(criteria)
 
     filters_counter = 0
     if filters_form.is_valid():
         job_applications = filters_form.filter(job_applications)
+        job_applications_to_count = filters_form.filter(job_applications_to_count)
         filters_counter = filters_form.get_qs_filters_counter()
 
-    job_applications_page = pager(job_applications, request.GET.get("page"), items_per_page=10)
+    owners = [request.user]
+    if request.current_organization:  # Set by middleware for prescriber users
+        owners.append(request.current_organization)
+    job_applications_page = pager(
+        job_applications,
+        request.GET.get("page"),
+        items_per_page=10,
+        count=count_job_applications("prescriber", job_applications_to_count, owners, _filters_params(request)),
+    )
     _add_pending_for_weeks(job_applications_page)
     _add_user_can_view_personal_information(job_applications_page, request.user.can_view_personal_information)
     _add_administrative_criteria(job_applications_page)
@@ -125,6 +155,15 @@ def list_for_prescriber(request, template_name="apply/list_for_prescriber.html")
     return render(request, template_name, context)
 
 
+def _export_response(request, export):
+    """
+    Redirect to the file of a finished export, or display its progress until it is ready.
+    """
+    if export["state"] == ExportState.READY:
+        return HttpResponseRedirect(default_storage.url(export["file"]))
+    return render(request, "apply/export_progress.html", {"export": export, "export_states": ExportState})
+
+
 @login_required
 @user_passes_test(lambda u: u.is_prescriber, login_url=reverse_lazy("search:employers_home"), redirect_field_name=None)
 def list_for_prescriber_exports(request, template_name="apply/list_of_available_exports.html"):
@@ -152,14 +191,17 @@ def list_for_prescriber_exports_download(request, month_identifier=None):
     List of applications for a prescriber for a given month identifier (YYYY-mm),
     exported as a CSV file with immediate download
     """
-    job_applications = get_all_available_job_applications_as_prescriber(request).with_list_related_data()
     filename = "candidatures"
     if month_identifier:
-        year, month = month_identifier.split("-")
         filename = f"{filename}-{month_identifier}"
-        job_applications = job_applications.created_on_given_year_and_month(year, month)
-
-    return stream_xlsx_export(job_applications, filename)
+    params = {
+        "export_for": "prescriber",
+        "user": request.user.pk,
+        # Set by middleware for prescriber users.
+        "organization": request.current_organization.pk if request.current_organization else None,
+        "month_identifier": month_identifier,
+    }
+    return _export_response(request, request_xlsx_export(params, filename))
 
 
 @login_required
@@ -169,28 +211,41 @@ def list_for_siae(request, template_name="apply/list_for_siae.html"):
     """
     company = get_current_company_or_404(request)
     job_applications = company.job_applications_received
-    pending_states_job_applications_count = job_applications.filter(
-        state__in=JobApplicationWorkflow.PENDING_STATES
-    ).count()
+    pending_states_job_applications_count = count_job_applications(
+        "siae-pending",
+        job_applications.filter(state__in=JobApplicationWorkflow.PENDING_STATES),
+        [company],
+        {},
+    )
 
     filters_form = CompanyFilterJobApplicationsForm(job_applications, company, request.GET or None)
 
     # Add related data giving the criteria for adding the necessary annotations
-    job_applications = job_applications.not_archived().with_list_related_data(
-        filters_form.data.getlist("criteria", [])
-    )
+    criteria = filters_form.data.getlist("criteria", [])
+    job_applications = job_applications.not_archived()
+    job_applications_to_count = job_applications.with_list_filters_data(criteria)
+    job_applications = job_applications.with_list_related_data(criteria)
 
     filters_counter = 0
     if filters_form.is_valid():
         job_applications = filters_form.filter(job_applications)
+        job_applications_to_count = filters_form.filter(job_applications_to_count)
         filters_counter = filters_form.get_qs_filters_counter()
 
-    job_applications_page = pager(job_applications, request.GET.get("page"), items_per_page=10)
+    job_applications_page = pager(
+        job_applications,
+        request.GET.get("page"),
+        items_per_page=10,
+        count=count_job_applications("siae", job_applications_to_count, [company], _filters_params(request)),
+    )
     _add_pending_for_weeks(job_applications_page)
 
     # SIAE members have access to personal info
     _add_user_can_view_personal_information(job_applications_page, lambda ja: True)
 
+    if company.is_subject_to_eligibility_rules:
+        _add_eligibility_diagnosis_by_siae_required(job_applications_page, company)
+
     if company.kind in SIAE_WITH_CONVENTION_KINDS:
         _add_administrative_criteria(job_applications_page)
 
@@ -232,11 +287,8 @@ def list_for_siae_exports_download(request, month_identifier=None):
     exported as a CSV file with immediate download
     """
     company = get_current_company_or_404(request)
-    job_applications = company.job_applications_received.not_archived().with_list_related_data()
     filename = f"candidatures-{slugify(company.display_name)}"
     if month_identifier:
-        year, month = month_identifier.split("-")
         filename = f"{filename}-{month_identifier}"
-        job_applications = job_applications.created_on_given_year_and_month(year, month)
-
-    return stream_xlsx_export(job_applications, filename)
+    params = {"export_for": "siae", "company": company.pk, "month_identifier": month_identifier}
+    return _export_response(request, request_xlsx_export(params, filename))
@@ -0,0 +1,21 @@
+from django.apps import AppConfig
+from django.db import models
+
+
+class AutocompleteAppConfig(AppConfig):
+    name = "itou.www.autocomplete"
+
+    def ready(self):
+        super().ready()
+        from itou.asp.models import Commune
+        from itou.cities.models import City
+        from itou.jobs.models import Appellation
+        from itou.utils.autocomplete_versions import bump_version
+
+        for model in [City, Commune, Appellation]:
+            models.signals.post_save.connect(
+                bump_version, sender=model, dispatch_uid=f"autocomplete-{model.__name__}-save"
+            )
+            models.signals.post_delete.connect(
+                bump_version, sender=model, dispatch_uid=f"autocomplete-{model.__name__}-delete"
+            )
@@ -1,44 +1,14 @@
 from datetime import datetime
 
-from django.db.models import F, Q, Value
-from django.db.models.functions import Least, Lower, NullIf, StrIndex
 from django.http import JsonResponse
-from unidecode import unidecode
 
-from itou.asp.models import Commune
-from itou.cities.models import City
-from itou.jobs.models import Appellation
+from itou.utils.autocomplete import appellations_index, cities_index, communes_index
 
 
 # Consider that after 50 matches the user should refine its search.
 MAX_CITIES_TO_RETURN = 50
 
 
-def autocomplete_name(qs, term, extra_ordering_by):
-    term = unidecode(term.lower())
-    term_spaced = term.replace("-", " ")
-    term_hyphenated = term.replace(" ", "-")
-    # We started with a trigram similarity and word similarity approach. It is disappointing
-    # since it does return results that are not expected, for instance results containing
-    # letters not present in the search.
-    # It has been decided with the UX to use the simplest approach. It seems that most
-    # people look for a city by "the start of the name", not by "any word within the name"
-    # so the icontains lookup, ordered by index of the matching string, feels more natural.
-    # The hyphenated/unhyphenated thing has been added considering the mess that hyphens
-    # represent in french city names. It should be improved in the future to handle cases
-    # such as search terms “La Chapelle du” not finding La Chapelle-du-Châtelard.
-
-    return (
-        qs.filter(Q(name__unaccent__icontains=term_spaced) | Q(name__unaccent__icontains=term_hyphenated))
-        .annotate(
-            spaced_index=NullIf(StrIndex(Lower("name__unaccent"), Value(term_spaced)), 0),
-            hyphenated_index=NullIf(StrIndex(Lower("name__unaccent"), Value(term_hyphenated)), 0),
-            best_index=Least(F("spaced_index"), F("hyphenated_index")),
-        )
-        .order_by(F("best_index").asc(nulls_last=True), "name", extra_ordering_by)
-    )
-
-
 def cities_autocomplete(request):
     """
     Returns JSON data compliant with the jQuery UI Autocomplete Widget:
@@ -54,17 +24,16 @@ def cities_autocomplete(request):
 
     if term:
         if term.isdigit():
-            cities = City.objects.filter(post_codes__contains=[term]).order_by("name", "department")
+            cities = cities_index.search_code(term, limit=MAX_CITIES_TO_RETURN)
         else:
-            cities = autocomplete_name(City.objects.all(), term, extra_ordering_by="department")
+            cities = cities_index.search_name(term, limit=MAX_CITIES_TO_RETURN)
 
         if select2_mode:
             cities = [
-                {"text": city.autocomplete_display(), "id": city.slug if slug_mode else city.pk}
-                for city in cities[:MAX_CITIES_TO_RETURN]
+                {"text": city.autocomplete_display(), "id": city.slug if slug_mode else city.pk} for city in cities
             ]
         else:
-            cities = [{"value": city.display_name, "slug": city.slug} for city in cities[:MAX_CITIES_TO_RETURN]]
+            cities = [{"value": city.display_name, "slug": city.slug} for city in cities]
 
     return JsonResponse({"results": cities} if select2_mode else cities, safe=False)
 
@@ -86,7 +55,7 @@ def jobs_autocomplete(request):
                     "text": appellation.autocomplete_display(),
                     "id": appellation.pk,
                 }
-                for appellation in Appellation.objects.autocomplete(term, limit=10)
+                for appellation in appellations_index.search(term, limit=10)
             ]
         else:
             appellations = [
@@ -96,7 +65,7 @@ def jobs_autocomplete(request):
                     "rome": appellation.rome.code,
                     "name": appellation.name,
                 }
-                for appellation in Appellation.objects.autocomplete(term, limit=10)
+                for appellation in appellations_index.search(term, limit=10)
             ]
 
     return JsonResponse({"results": appellations} if select2_mode else appellations, safe=False)
@@ -124,12 +93,11 @@ def communes_autocomplete(request):
         # Can't extract date in ISO format: use today as fallback
         dt = datetime.now()
 
-    active_communes_qs = Commune.objects.filter(start_date__lte=dt).filter(Q(end_date=None) | Q(end_date__gt=dt))
     if term:
         if term.isdigit():
-            communes = active_communes_qs.filter(code__startswith=term).order_by("name", "code")
+            communes = communes_index.search_code(term, limit=MAX_CITIES_TO_RETURN, at=dt.date(), prefix=True)
         else:
-            communes = autocomplete_name(active_communes_qs, term, extra_ordering_by="code")
+            communes = communes_index.search_name(term, limit=MAX_CITIES_TO_RETURN, at=dt.date())
 
         if select2_mode:
             communes = [
@@ -137,7 +105,7 @@ def communes_autocomplete(request):
                     "text": commune.autocomplete_display(),
                     "id": commune.pk,
                 }
-                for commune in communes[:MAX_CITIES_TO_RETURN]
+                for commune in communes
             ]
         else:
             communes = [
@@ -146,7 +114,7 @@ def communes_autocomplete(request):
                     "code": commune.code,
                     "department": commune.department_code,
                 }
-                for commune in communes[:MAX_CITIES_TO_RETURN]
+                for commune in communes
             ]
 
     return JsonResponse({"results": communes} if select2_mode else communes, safe=False)
@@ -0,0 +1,32 @@
+from django.apps import AppConfig
+from django.db import models
+
+
+class DashboardAppConfig(AppConfig):
+    name = "itou.www.dashboard"
+
+    def ready(self):
+        super().ready()
+        from itou.approvals.models import ProlongationRequest
+        from itou.employee_record.models import EmployeeRecord
+        from itou.job_applications.models import JobApplication
+        from itou.www.dashboard.summary import (
+            invalidate_company_summary_for_employee_record,
+            invalidate_company_summary_for_job_application,
+            invalidate_prescriber_organization_summary,
+        )
+
+        for model, receiver in [
+            (JobApplication, invalidate_company_summary_for_job_application),
+            (ProlongationRequest, invalidate_prescriber_organization_summary),
+        ]:
+            models.signals.post_save.connect(receiver, sender=model, dispatch_uid=f"dashboard-{model.__name__}-save")
+            models.signals.post_delete.connect(
+                receiver, sender=model, dispatch_uid=f"dashboard-{model.__name__}-delete"
+            )
+        # The job application of a deleted employee record may already be deleted too, rely on the timeout.
+        models.signals.post_save.connect(
+            invalidate_company_summary_for_employee_record,
+            sender=EmployeeRecord,
+            dispatch_uid="dashboard-EmployeeRecord-save",
+        )
@@ -0,0 +1,92 @@
+"""
+Counters displayed on the dashboards, e.g. the number of job applications to process.
+
+The counters of an organization are computed with a single query of conditional aggregates,
+and cached per organization until a related object is saved or deleted (see `apps.py`).
+Bulk updates don't send signals: entries expire after `SUMMARY_CACHE_TIMEOUT` anyway.
+
+The `failsafe` cache returns None when Redis is down, so counters are then computed on every request.
+"""
+
+from django.core.cache import caches
+from django.db.models import Count, Q
+
+from itou.approvals.enums import ProlongationRequestStatus
+from itou.approvals.models import ProlongationRequest
+from itou.companies.models import Company
+from itou.employee_record.enums import Status
+from itou.job_applications.models import JobApplication, JobApplicationWorkflow
+from itou.prescribers.models import PrescriberOrganization
+
+
+SUMMARY_CACHE_TIMEOUT = 5 * 60
+
+
+def summary_cache_key(model, pk):
+    return f"dashboard-summary:{model._meta.label_lower}:{pk}"
+
+
+def invalidate_summary(model, pk):
+    if pk is not None:
+        caches["failsafe"].delete(summary_cache_key(model, pk))
+
+
+def _get_or_compute(organization, compute):
+    cache = caches["failsafe"]
+    key = summary_cache_key(type(organization), organization.pk)
+    summary = cache.get(key)
+    if summary is None:
+        summary = compute(organization)
+        cache.set(key, summary, SUMMARY_CACHE_TIMEOUT)
+    return summary
+
+
+def get_states_to_process(company):
+    states = [JobApplicationWorkflow.STATE_NEW, JobApplicationWorkflow.STATE_PROCESSING]
+    if company.can_have_prior_action:
+        states.append(JobApplicationWorkflow.STATE_PRIOR_TO_HIRE)
+    return states
+
+
+def _compute_company_summary(company):
+    # Job applications may have several employee records, hence the distinct counts.
+    return JobApplication.objects.filter(to_company=company).aggregate(
+        job_applications_to_process=Count("pk", filter=Q(state__in=get_states_to_process(company)), distinct=True),
+        job_applications_postponed=Count("pk", filter=Q(state=JobApplicationWorkflow.STATE_POSTPONED), distinct=True),
+        rejected_employee_records=Count(
+            "employee_record", filter=Q(employee_record__status=Status.REJECTED), distinct=True
+        ),
+    )
+
+
+def _compute_prescriber_organization_summary(organization):
+    return ProlongationRequest.objects.filter(prescriber_organization=organization).aggregate(
+        pending_prolongation_requests=Count("pk", filter=Q(status=ProlongationRequestStatus.PENDING)),
+    )
+
+
+def get_company_summary(company):
+    """
+    Return the `job_applications_to_process`, `job_applications_postponed`
+    and `rejected_employee_records` counters of the company.
+    """
+    return _get_or_compute(company, _compute_company_summary)
+
+
+def get_prescriber_organization_summary(organization):
+    """
+    Return the `pending_prolongation_requests` counter of the prescriber organization.
+    """
+    return _get_or_compute(organization, _compute_prescriber_organization_summary)
+
+
+def invalidate_company_summary_for_job_application(sender, instance, **kwargs):
+    invalidate_summary(Company, instance.to_company_id)
+
+
+def invalidate_company_summary_for_employee_record(sender, instance, **kwargs):
+    invalidate_summary(Company, instance.job_application.to_company_id)
+
+
+def invalidate_prescriber_organization_summary(sender, instance, **kwargs):
+    invalidate_summary(PrescriberOrganization, instance.prescriber_organization_id)
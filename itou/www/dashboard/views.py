@@ -15,12 +15,8 @@ from django.views.generic import TemplateView
 from rest_framework.authtoken.models import Token
 
 from itou.api.token_auth.views import TOKEN_ID_STR
-from itou.approvals.enums import ProlongationRequestStatus
-from itou.approvals.models import ProlongationRequest
 from itou.companies.enums import CompanyKind
 from itou.companies.models import Company
-from itou.employee_record.enums import Status
-from itou.employee_record.models import EmployeeRecord
 from itou.institutions.models import Institution
 from itou.job_applications.models import JobApplicationWorkflow
 from itou.openid_connect.inclusion_connect import constants as ic_constants
@@ -39,6 +35,11 @@ from itou.www.dashboard.forms import (
     EditUserEmailForm,
     EditUserInfoForm,
 )
+from itou.www.dashboard.summary import (
+    get_company_summary,
+    get_prescriber_organization_summary,
+    get_states_to_process,
+)
 from itou.www.search.forms import SiaeSearchForm
 from itou.www.stats import utils as stats_utils
 
@@ -70,27 +71,26 @@ MOBILEMPLOI_DEPARTMENTS = (
 
 def _employer_dashboard_context(request):
     current_org = get_current_company_or_404(request)
-    states_to_process = [JobApplicationWorkflow.STATE_NEW, JobApplicationWorkflow.STATE_PROCESSING]
-    if current_org.can_have_prior_action:
-        states_to_process.append(JobApplicationWorkflow.STATE_PRIOR_TO_HIRE)
+    summary = get_company_summary(current_org)
+    states_to_process = get_states_to_process(current_org)
 
     job_applications_categories = [
         {
             "name": "À traiter",
             "states": states_to_process,
+            "counter": summary["job_applications_to_process"],
             "icon": "ri-notification-4-line",
             "badge": "bg-info-lighter",
         },
         {
             "name": "En attente",
             "states": [JobApplicationWorkflow.STATE_POSTPONED],
+            "counter": summary["job_applications_postponed"],
             "icon": "ri-time-line",
             "badge": "bg-info-lighter",
         },
     ]
-    job_applications = current_org.job_applications_received.values("state").all()
     for category in job_applications_categories:
-        category["counter"] = len([ja for ja in job_applications if ja["state"] in category["states"]])
         category["url"] = f"{reverse('apply:list_for_siae')}?{'&'.join([f'states={c}' for c in category['states']])}"
 
     show_eiti_webinar_banner = current_org.kind == CompanyKind.EITI
@@ -115,9 +115,7 @@ def _employer_dashboard_context(request):
             .select_related("evaluation_campaign")
         ),
         "job_applications_categories": job_applications_categories,
-        "num_rejected_employee_records": (
-            EmployeeRecord.objects.for_company(current_org).filter(status=Status.REJECTED).count()
-        ),
+        "num_rejected_employee_records": summary["rejected_employee_records"],
         "show_eiti_webinar_banner": show_eiti_webinar_banner,
         "siae_suspension_text_with_dates": (
             current_org.get_active_suspension_text_with_dates()
@@ -172,10 +170,9 @@ def dashboard(request, template_name="dashboard/dashboard.html"):
     elif request.user.is_prescriber:
         if current_org := request.current_organization:
             if current_org.is_authorized:
-                context["pending_prolongation_requests"] = ProlongationRequest.objects.filter(
-                    prescriber_organization=current_org,
-                    status=ProlongationRequestStatus.PENDING,
-                ).count()
+                context["pending_prolongation_requests"] = get_prescriber_organization_summary(current_org)[
+                    "pending_prolongation_requests"
+                ]
             context["show_mobilemploi_prescriber_banner"] = (
                 current_org.department in MOBILEMPLOI_DEPARTMENTS
                 and current_org.kind
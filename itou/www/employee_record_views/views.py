@@ -112,7 +112,6 @@ class AddView(LoginRequiredMixin, NamedUrlSessionWizardView):
             job_application = (
                 JobApplication.objects.filter(to_company=self.company, approval=approval)
                 .accepted()
-                .with_accepted_at()
                 .latest("accepted_at")
             )
             return HttpResponseRedirect(
@@ -0,0 +1,27 @@
+from django.apps import AppConfig
+from django.db import models
+
+
+class SearchAppConfig(AppConfig):
+    name = "itou.www.search"
+
+    def ready(self):
+        super().ready()
+        from itou.companies.models import Company, JobDescription
+        from itou.prescribers.models import PrescriberOrganization
+        from itou.www.search.cache import (
+            bump_company_versions,
+            bump_job_description_versions,
+            bump_prescriber_organization_versions,
+        )
+
+        # Memberships only change the employers search through the index, see `refresh_company_search_index`.
+        for model, bump_versions in [
+            (Company, bump_company_versions),
+            (JobDescription, bump_job_description_versions),
+            (PrescriberOrganization, bump_prescriber_organization_versions),
+        ]:
+            models.signals.post_save.connect(bump_versions, sender=model, dispatch_uid=f"search-{model.__name__}-save")
+            models.signals.post_delete.connect(
+                bump_versions, sender=model, dispatch_uid=f"search-{model.__name__}-delete"
+            )
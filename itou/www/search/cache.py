@@ -0,0 +1,84 @@
+"""
+Cache of the search results, shared by all the (anonymous) users searching around the same city.
+
+Entries are keyed on the normalised search parameters and on the version tokens of the departments
+covered by the search area, for the searched kind of results:
+- `companies` tokens are renewed by `refresh_company_search_index` for the departments whose entries
+  of the index changed, and whenever companies or job descriptions are saved (see `apps.py`);
+- `prescribers` tokens are renewed whenever prescriber organizations are saved.
+Bulk updates don't send signals, and saving a company only renews the token of its department, not the
+ones of its job descriptions located elsewhere: entries expire after `RESULTS_CACHE_TIMEOUT` anyway.
+
+The `failsafe` cache returns None when Redis is down, so results are then computed on every request.
+"""
+
+import hashlib
+import json
+
+from django.contrib.gis.measure import D
+from django.core.cache import caches
+
+from itou.cities.models import City
+from itou.utils.search_versions import bump_versions, version_cache_key
+
+
+RESULTS_CACHE_TIMEOUT = 5 * 60
+DEPARTMENTS_CACHE_TIMEOUT = 24 * 60 * 60
+# Geocoded addresses may lie a few kilometers farther than the center of the closest city of their department.
+DEPARTMENTS_MARGIN_KM = 10
+
+
+def bump_company_versions(sender, instance, **kwargs):
+    bump_versions("companies", {instance.department})
+
+
+def bump_job_description_versions(sender, instance, **kwargs):
+    # Job descriptions without location are located at their company.
+    location = instance.location if instance.location_id else instance.company
+    bump_versions("companies", {location.department})
+
+
+def bump_prescriber_organization_versions(sender, instance, **kwargs):
+    bump_versions("prescribers", {instance.department})
+
+
+def get_departments_around(city, distance):
+    cache = caches["failsafe"]
+    key = f"search-departments:{city.pk}:{distance}"
+    departments = cache.get(key)
+    if departments is None:
+        departments = sorted(
+            set(
+                City.objects.filter(coords__dwithin=(city.coords, D(km=distance + DEPARTMENTS_MARGIN_KM))).values_list(
+                    "department", flat=True
+                )
+            )
+            | {city.department}
+        )
+        cache.set(key, departments, DEPARTMENTS_CACHE_TIMEOUT)
+    return departments
+
+
+def get_or_compute(name, kind, city, distance, params, compute):
+    """
+    Return the cached results of the `name` search of `kind` results around `city` for `params`,
+    or compute and cache them.
+
+    `params` must be JSON serializable, `compute()` must return a picklable value other than None.
+    """
+    cache = caches["failsafe"]
+    departments = get_departments_around(city, distance)
+    key_parts = {
+        "city": city.pk,
+        "distance": distance,
+        # Not `get_many()`, which fails when the failsafe client returns None.
+        "versions": [cache.get(version_cache_key(kind, department)) for department in departments],
+        "params": params,
+    }
+    digest = hashlib.sha256(json.dumps(key_parts, sort_keys=True).encode()).hexdigest()
+    key = f"search-results:{name}:{digest}"
+    results = cache.get(key)
+    if results is None:
+        results = compute()
+        cache.set(key, results, RESULTS_CACHE_TIMEOUT)
+    return results
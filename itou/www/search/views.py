@@ -1,4 +1,4 @@
-from collections import defaultdict, namedtuple
+from collections import namedtuple
 from urllib.parse import urlencode
 
 from django.contrib.gis.db.models.functions import Distance
@@ -8,10 +8,12 @@ from django.views.generic import FormView
 
 from itou.common_apps.address.departments import DEPARTMENTS_WITH_DISTRICTS
 from itou.companies.enums import CompanyKind, ContractNature, JobSource
-from itou.companies.models import Company, JobDescription
+from itou.companies.facets import count_by, count_companies_by_location, count_job_descriptions_by_department
+from itou.companies.models import CompanySearchIndex, JobDescription
 from itou.job_applications.models import JobApplication, JobApplicationWorkflow
 from itou.prescribers.models import PrescriberOrganization
 from itou.utils.pagination import pager
+from itou.www.search.cache import get_or_compute
 from itou.www.search.forms import JobDescriptionSearchForm, PrescriberSearchForm, SiaeSearchForm
 
 
@@ -50,10 +52,9 @@ class EmployerSearchBaseView(FormView):
         # this enables not losing the count while changing tabs.
         contract_types = form.cleaned_data.get("contract_types", self.request.GET.getlist("contract_types", []))
 
-        siaes = (
-            Company.objects.active()
-            .within(city.coords, distance)
-            .annotate(distance=Distance("coords", city.coords) / 1000)
+        # Active companies are read from a periodically refreshed index, see `CompanySearchIndex`.
+        siaes = CompanySearchIndex.objects.within(city.coords, distance).annotate(
+            distance=Distance("coords", city.coords) / 1000
         )
         job_descriptions = (
             JobDescription.objects.active()
@@ -68,7 +69,15 @@ class EmployerSearchBaseView(FormView):
             )
         )
 
-        self.add_form_choices(form, siaes, job_descriptions)
+        facets = get_or_compute(
+            f"{self.cache_name}-facets",
+            "companies",
+            city,
+            int(distance),
+            {},
+            lambda: self.get_facets(siaes, job_descriptions),
+        )
+        self.add_form_choices(form, facets)
 
         if kinds:
             siaes = siaes.filter(kind__in=kinds)
@@ -103,6 +112,7 @@ class EmployerSearchBaseView(FormView):
                 query |= Q(appellation__rome__code__startswith=domain)
             job_descriptions = job_descriptions.filter(query)
 
+        clean_company_pk = None
         company = self.request.GET.get("company")
         if company:
             try:
@@ -112,13 +122,29 @@ class EmployerSearchBaseView(FormView):
             else:
                 siaes = siaes.filter(pk=clean_company_pk)
 
-        results_and_counts = self.get_results_page_and_counts(siaes, job_descriptions)
+        results = get_or_compute(
+            self.cache_name,
+            "companies",
+            city,
+            int(distance),
+            {
+                "kinds": sorted(kinds),
+                "contract_types": sorted(contract_types),
+                "departments": sorted(departments),
+                "districts": sorted(districts),
+                "domains": sorted(domains),
+                "company": clean_company_pk,
+            },
+            lambda: self.get_results(siaes, job_descriptions),
+        )
+        results_and_counts = self.get_results_page_and_counts(results, siaes, job_descriptions)
 
         context = {
             "form": form,
             "ea_eatt_kinds": [CompanyKind.EA, CompanyKind.EATT],
             "city": city,
             "distance": distance,
+            "facets": facets,
             "filters_query_string": urlencode(
                 {
                     "city": city.slug,
@@ -147,53 +173,40 @@ class EmployerSearchBaseView(FormView):
 
 
 class EmployerSearchView(EmployerSearchBaseView):
-    def add_form_choices(self, form, siaes, _job_descriptions):
-        # Extract departments from results to inject them as filters
-        # The DB contains around 4k SIAE (always fast in Python and no need of iterator())
-        departments = set()
-        departments_districts = defaultdict(set)
-        company_choices = []
-        for siae in siaes:
-            company_choices.append((siae.pk, siae.display_name))
-            # Extract the department of SIAE
-            if siae.department:
-                departments.add(siae.department)
-                # Extract the post_code if it's a district to use it as criteria
-                if siae.department in DEPARTMENTS_WITH_DISTRICTS:
-                    if int(siae.post_code) <= DEPARTMENTS_WITH_DISTRICTS[siae.department]["max"]:
-                        departments_districts[siae.department].add(siae.post_code)
+    cache_name = "employers"
+
+    def get_facets(self, siaes, _job_descriptions):
+        departments, departments_districts = count_companies_by_location(siaes)
+        return {
+            "departments": sorted(departments),
+            "districts": {department: sorted(districts) for department, districts in departments_districts.items()},
+            # Same as `Company.display_name`, without loading the companies.
+            "companies": [
+                (pk, brand or name.capitalize())
+                for pk, name, brand in siaes.order_by().values_list("pk", "name", "brand")
+            ],
+        }
 
-        if departments:
-            departments = sorted(departments)
-            form.add_field_departements(departments)
+    def add_form_choices(self, form, facets):
+        if facets["departments"]:
+            form.add_field_departements(facets["departments"])
 
         city = form.cleaned_data["city"]
-        if departments_districts and city.code_insee in INSEE_CODES_WITH_DISTRICTS:
-            for department, districts in departments_districts.items():
-                districts = sorted(districts)
+        if facets["districts"] and city.code_insee in INSEE_CODES_WITH_DISTRICTS:
+            for department, districts in facets["districts"].items():
                 form.add_field_districts(department, districts)
 
-        if company_choices:
-            form.add_field_company(company_choices)
+        if facets["companies"]:
+            form.add_field_company(facets["companies"])
 
-    def get_results_page_and_counts(self, siaes, job_descriptions):
+    def get_results(self, siaes, job_descriptions):
         siaes = (
-            siaes.prefetch_related(
-                Prefetch(
-                    lookup="job_description_through",
-                    queryset=JobDescription.objects.with_annotation_is_popular()
-                    .filter(company__in=siaes, is_active=True)
-                    .select_related("appellation", "location", "company"),
-                    to_attr="active_job_descriptions",
-                )
-            )
             # For sorting let's put siaes in only 2 buckets (boolean has_active_members).
             # If we sort naively by `-_total_active_members` we would show
             # siaes with 10 members (where 10 is the max), then siaes
             # with 9 members, then siaes with 8 members etc...
             # This is clearly not what we want. We want to show siaes with members
             # (whatever the number of members is) then siaes without members.
-            .with_has_active_members()
             # Sort in 4 subgroups in the following order, each subgroup being sorted by job_app_score.
             # 1) has_active_members and not block_job_applications
             # These are the siaes which can currently hire, and should be on top.
@@ -205,66 +218,96 @@ class EmployerSearchView(EmployerSearchBaseView):
             # 4) not has_active_members and block_job_applications
             # This group is supposed to be empty. But itou staff may have
             # detached members from their siae so it could still happen.
-            .order_by("-has_active_members", "block_job_applications", "job_app_score", "pk")
+            siaes.order_by("-has_active_members", "block_job_applications", "job_app_score", "pk")
         )
+        return {
+            "siaes": list(siaes.values_list("pk", flat=True)),
+            "job_descriptions_count": job_descriptions.count(),
+        }
 
-        page = pager(siaes, self.request.GET.get("page"), items_per_page=10)
+    def get_results_page_and_counts(self, results, siaes, _job_descriptions):
+        page = pager(results["siaes"], self.request.GET.get("page"), items_per_page=10)
+        entries = (
+            siaes.select_related("company")
+            .prefetch_related(
+                Prefetch(
+                    lookup="company__job_description_through",
+                    queryset=JobDescription.objects.with_annotation_is_popular()
+                    .filter(is_active=True)
+                    .select_related("appellation", "location", "company"),
+                    to_attr="active_job_descriptions",
+                )
+            )
+            .in_bulk(page.object_list)
+        )
+        companies = []
+        for pk in page.object_list:
+            # Results may have been cached before the company left the index.
+            if entry := entries.get(pk):
+                # Keep the results consistent with the index they were sorted with.
+                entry.company.distance = entry.distance
+                entry.company.has_active_members = entry.has_active_members
+                companies.append(entry.company)
+        page.object_list = companies
         return PageAndCounts(
             results_page=page,
             siaes_count=page.paginator.count,
-            job_descriptions_count=job_descriptions.count(),
+            job_descriptions_count=results["job_descriptions_count"],
         )
 
 
 class JobDescriptionSearchView(EmployerSearchBaseView):
     form_class = JobDescriptionSearchForm
+    cache_name = "job_descriptions"
+
+    def get_facets(self, _siaes, job_descriptions):
+        # FIXME(vperron): on a un problème ici, c'est que les gens ne peuvent pas sélectionner
+        # un arrondissement au moment de la création d'une JobDescription: ils n'ont accès que aux "Cities"
+        # qui ne détaillent pas les arrondissements.
+        # Ce qui signifie que l'info est perdue dès le départ, à moins que l'on ne change le parcours
+        # de création des fiches de poste ou en enrichissant la table "Cities" de tous les arrondissements
+        # de Paris, Lyon et Marseille.
+        # En attendant on ne pourra pas trier par arrondissement pour ces offres.
+        return {
+            "departments": sorted(count_job_descriptions_by_department(job_descriptions)),
+            "contract_types": count_by(job_descriptions, "contract_type"),
+        }
 
-    def add_form_choices(self, form, _siaes, job_descriptions):
-        departments = set()
-        for job_description in job_descriptions:
-            department = None
-            if job_description.location:
-                department = job_description.location.department
-                # FIXME(vperron): on a un problème ici, c'est que les gens ne peuvent pas sélectionner
-                # un arrondissement au moment de la création d'une JobDescription: ils n'ont accès que aux "Cities"
-                # qui ne détaillent pas les arrondissements.
-                # Ce qui signifie que l'info est perdue dès le départ, à moins que l'on ne change le parcours
-                # de création des fiches de poste ou en enrichissant la table "Cities" de tous les arrondissements
-                # de Paris, Lyon et Marseille.
-                # En attendant on ne pourra pas trier par arrondissement pour ces offres.
-            elif job_description.company.department:
-                department = job_description.company.department
-            if department:
-                departments.add(department)
-
-        if departments:
-            departments = sorted(departments)
-            form.add_field_departements(departments)
+    def add_form_choices(self, form, facets):
+        if facets["departments"]:
+            form.add_field_departements(facets["departments"])
 
-    def get_results_page_and_counts(self, siaes, job_descriptions):
+    def get_results(self, siaes, job_descriptions):
         job_descriptions = job_descriptions.order_by(
             F("source_kind").asc(nulls_first=True), "-updated_at", "-created_at"
         )
+        return {
+            "job_descriptions": list(job_descriptions.values_list("pk", flat=True)),
+            "siaes_count": siaes.count(),
+        }
 
-        page = pager(job_descriptions, self.request.GET.get("page"), items_per_page=10)
+    def get_results_page_and_counts(self, results, _siaes, job_descriptions):
+        page = pager(results["job_descriptions"], self.request.GET.get("page"), items_per_page=10)
         # Prefer a prefetch_related over annotating the entire queryset with_annotation_is_popular().
         # That annotation is quite expensive and PostgreSQL runs it on the entire queryset, even
         # though we don’t sort or group by that column. It would be smarter to apply the limit
         # before computing the annotation, but that’s not what PostgreSQL 15 does on 2024-02-21.
-        page.object_list = page.object_list.prefetch_related(
+        job_descriptions = job_descriptions.prefetch_related(
             Prefetch(
                 "jobapplication_set",
                 to_attr="jobapplication_set_pending",
                 queryset=JobApplication.objects.filter(state__in=JobApplicationWorkflow.PENDING_STATES),
             )
-        )
+        ).in_bulk(page.object_list)
+        # Results may have been cached before the job description was deleted.
+        page.object_list = [job_descriptions[pk] for pk in page.object_list if pk in job_descriptions]
         for job_description in page.object_list:
             job_description.is_popular = (
                 len(job_description.jobapplication_set_pending) >= job_description._meta.model.POPULAR_THRESHOLD
             )
         return PageAndCounts(
             results_page=page,
-            siaes_count=siaes.count(),
+            siaes_count=results["siaes_count"],
             job_descriptions_count=page.paginator.count,
         )
 
@@ -292,9 +335,20 @@ def search_prescribers_results(request, template_name="search/prescribers_search
             PrescriberOrganization.objects.filter(is_authorized=True)
             .within(city.coords, distance)
             .annotate(distance=Distance("coords", city.coords))
-            .order_by("distance")
         )
-        prescriber_orgs_page = pager(prescriber_orgs, request.GET.get("page"), items_per_page=10)
+        prescriber_org_pks = get_or_compute(
+            "prescribers",
+            "prescribers",
+            city,
+            int(distance),
+            {},
+            lambda: list(prescriber_orgs.order_by("distance").values_list("pk", flat=True)),
+        )
+        prescriber_orgs_page = pager(prescriber_org_pks, request.GET.get("page"), items_per_page=10)
+        prescriber_orgs = prescriber_orgs.in_bulk(prescriber_orgs_page.object_list)
+        prescriber_orgs_page.object_list = [
+            prescriber_orgs[pk] for pk in prescriber_orgs_page.object_list if pk in prescriber_orgs
+        ]
 
     context = {
         "city": city,
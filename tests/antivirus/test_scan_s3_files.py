@@ -0,0 +1,165 @@
+import datetime
+import io
+import socketserver
+import struct
+import tempfile
+import threading
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from freezegun import freeze_time
+
+from itou.antivirus.management.commands.scan_s3_files import (
+    ClamdError,
+    ClamdStreamTooLarge,
+    Command,
+    clamd_instream,
+)
+from itou.antivirus.models import Scan
+from tests.files.factories import FileFactory
+
+
+EICAR = rb"X5O!P%@AP[4\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"
+STREAM_MAX_LENGTH = 1024
+
+
+class FakeClamdHandler(socketserver.BaseRequestHandler):
+    """Implement the INSTREAM command of clamd, finding EICAR and refusing streams over STREAM_MAX_LENGTH."""
+
+    def recv_exactly(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def handle(self):
+        assert self.recv_exactly(len(b"zINSTREAM\0")) == b"zINSTREAM\0"
+        content = b""
+        while size := struct.unpack("!L", self.recv_exactly(4))[0]:
+            content += self.recv_exactly(size)
+            if len(content) > STREAM_MAX_LENGTH:
+                self.request.sendall(b"INSTREAM size limit exceeded. ERROR\0")
+                return
+        self.server.contents.append(content)
+        if EICAR in content:
+            self.request.sendall(b"stream: Eicar-Signature FOUND\0")
+        else:
+            self.request.sendall(b"stream: OK\0")
+
+
+@pytest.fixture(name="clamd")
+def clamd_fixture():
+    # Short path, UNIX socket paths are limited to about 100 characters.
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with socketserver.ThreadingUnixStreamServer(f"{tmpdir}/clamd.ctl", FakeClamdHandler) as server:
+            server.contents = []
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            yield server
+            server.shutdown()
+            thread.join()
+
+
+def test_clamd_instream_clean(clamd):
+    assert clamd_instream([b"Hello ", b"", b"world"], socket_path=clamd.server_address) is None
+    assert clamd.contents == [b"Hello world"]
+
+
+def test_clamd_instream_infected(clamd):
+    assert clamd_instream([b"Hello", EICAR], socket_path=clamd.server_address) == "Eicar-Signature"
+
+
+def test_clamd_instream_too_large(clamd):
+    chunks = (b"x" * 256 for _ in range(100))
+    with pytest.raises(ClamdStreamTooLarge, match="INSTREAM size limit exceeded. ERROR"):
+        clamd_instream(chunks, socket_path=clamd.server_address)
+
+
+def test_clamd_instream_connection_closed(clamd, mocker):
+    mocker.patch.object(FakeClamdHandler, "handle", return_value=None)
+    with pytest.raises(ClamdError, match="Connection closed by clamd."):
+        clamd_instream([b"Hello"], socket_path=clamd.server_address)
+
+
+@freeze_time("2024-05-01")
+def test_save_scan_new(db):
+    file = FileFactory()
+
+    Command.save_scan(file, timezone.now(), "Eicar-Signature", infected=None)
+
+    scan = Scan.objects.get(file=file)
+    assert scan.clamav_completed_at == timezone.now()
+    assert scan.clamav_signature == "Eicar-Signature"
+    # Left for the staff to review.
+    assert scan.infected is None
+
+
+@freeze_time("2024-05-01")
+def test_save_scan_existing(db):
+    reviewed = Scan.objects.create(
+        file=FileFactory(),
+        clamav_completed_at=timezone.now() - datetime.timedelta(days=40),
+        clamav_signature="Eicar-Signature",
+        # Reviewed by the staff.
+        infected=False,
+        comment="Fichier de test.",
+    )
+
+    Command.save_scan(reviewed.file, timezone.now(), None, infected=False)
+    reviewed.refresh_from_db()
+    assert reviewed.clamav_completed_at == timezone.now()
+    assert reviewed.clamav_signature == "Eicar-Signature"
+    assert reviewed.infected is False
+
+    Command.save_scan(reviewed.file, timezone.now(), "Other-Signature", infected=None)
+    reviewed.refresh_from_db()
+    assert reviewed.clamav_signature == "Other-Signature"
+    # The review is kept.
+    assert reviewed.infected is False
+    assert reviewed.comment == "Fichier de test."
+
+
+# Scan workers use their own database connections.
+@pytest.mark.django_db(transaction=True)
+def test_too_large_files_are_left_for_review(mocker):
+    file = FileFactory()
+    mocker.patch("itou.antivirus.management.commands.scan_s3_files.s3_client")
+    mocker.patch.object(Command, "scan_file", side_effect=ClamdStreamTooLarge("INSTREAM size limit exceeded. ERROR"))
+
+    stderr = io.StringIO()
+    call_command("scan_s3_files", workers=1, stderr=stderr)
+
+    assert "1 too large" in stderr.getvalue()
+    scan = Scan.objects.get(file=file)
+    assert scan.clamav_completed_at is not None
+    assert scan.clamav_signature == "INSTREAM size limit exceeded. ERROR"
+    assert scan.infected is None
+    # It is not scanned again by the next runs.
+    assert not Command.files_to_scan(timezone.now()).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_new_detections_are_left_for_review(mocker):
+    infected_file = FileFactory()
+    clean_file = FileFactory()
+    mocker.patch("itou.antivirus.management.commands.scan_s3_files.s3_client")
+    mocker.patch.object(
+        Command,
+        "scan_file",
+        side_effect=lambda key: ("Eicar-Signature", 68) if key == infected_file.key else (None, 68),
+    )
+
+    stderr = io.StringIO()
+    call_command("scan_s3_files", workers=1, stderr=stderr)
+
+    assert "1 infected" in stderr.getvalue()
+    infected_scan = Scan.objects.get(file=infected_file)
+    assert infected_scan.clamav_signature == "Eicar-Signature"
+    assert infected_scan.infected is None
+    clean_scan = Scan.objects.get(file=clean_file)
+    assert clean_scan.clamav_signature == ""
+    assert clean_scan.infected is False
@@ -91,6 +91,24 @@ class SiaeAPIFetchListTest(APITestCase):
         assert body["count"] == 2
         assert response.status_code == 200
 
+    def test_fetch_siae_list_with_facets(self):
+        CompanyFactory(kind=CompanyKind.ACI, department="44", coords=self.saint_andre.coords)
+        CompanyFactory(kind=CompanyKind.ACI, department="56", coords=self.saint_andre.coords)
+
+        query_params = {"code_insee": self.saint_andre.code_insee, "distance_max_km": 100, "facettes": "true"}
+        response = self.client.get(ENDPOINT_URL, query_params, format="json")
+
+        body = json.loads(response.content)
+        assert body["count"] == 4
+        assert body["facettes"] == {
+            "departement": {"44": 3, "56": 1},
+            "type": {CompanyKind.EI: 2, CompanyKind.ACI: 2},
+        }
+
+        query_params.pop("facettes")
+        response = self.client.get(ENDPOINT_URL, query_params, format="json")
+        assert "facettes" not in json.loads(response.content)
+
     def test_fetch_siae_list_too_far(self):
         """
         Search for siaes in a city that has no SIAES
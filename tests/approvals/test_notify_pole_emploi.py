@@ -4,13 +4,15 @@ import json
 from unittest.mock import patch
 
 import httpx
+import pytest
 import respx
 from django.core import management
 from django.test import override_settings
 from django.utils import timezone
 from freezegun import freeze_time
 
-from itou.approvals.models import Approval, CancelledApproval
+from itou.approvals.management.commands.send_approvals_to_pe import send_notifications
+from itou.approvals.models import Approval
 from itou.companies.enums import CompanyKind, siae_kind_to_pe_type_siae
 from itou.job_applications.enums import SenderKind
 from itou.job_applications.models import JobApplicationWorkflow
@@ -562,13 +564,28 @@ class CancelledApprovalNotifyPoleEmploiIntegrationTest(TestCase):
         assert cancelled_approval.pe_notification_exit_code == "INVALID_SIAE_KIND"
 
 
+@override_settings(
+    API_ESD={
+        "BASE_URL": "https://pe.fake",
+        "AUTH_BASE_URL": "https://auth.fr",
+        "KEY": "foobar",
+        "SECRET": "pe-secret",
+    }
+)
 class ApprovalsSendToPeManagementTestCase(TestCase):
-    @patch.object(CancelledApproval, "notify_pole_emploi")
-    @patch.object(Approval, "notify_pole_emploi")
-    @patch("itou.approvals.management.commands.send_approvals_to_pe.sleep")
+    @respx.mock
     # smaller batch to ease testing
     @patch("itou.approvals.management.commands.send_approvals_to_pe.MAX_APPROVALS_PER_RUN", 10)
-    def test_invalid_job_seeker_for_pole_emploi(self, sleep_mock, notify_mock, cancelled_notify_mock):
+    def test_invalid_job_seeker_for_pole_emploi(self):
+        respx.post("https://auth.fr/connexion/oauth2/access_token?realm=%2Fpartenaire").respond(
+            200, json={"token_type": "foo", "access_token": "batman", "expires_in": 3600}
+        )
+        rech_individu_route = respx.post(
+            "https://pe.fake/rechercheindividucertifie/v1/rechercheIndividuCertifie"
+        ).respond(200, json=API_RECHERCHE_RESULT_KNOWN)
+        maj_pass_route = respx.post("https://pe.fake/maj-pass-iae/v1/passIAE/miseAjour").respond(
+            200, json=API_MAJPASS_RESULT_OK
+        )
         stdout = io.StringIO()
         # create ignored Approvals, will not even be counted in the batch. the cron will wait for
         # the database to have the necessary job application, nir, or start date to fetch them.
@@ -609,7 +626,7 @@ class ApprovalsSendToPeManagementTestCase(TestCase):
         management.call_command(
             "send_approvals_to_pe",
             wet_run=True,
-            delay=3,
+            rate=1000,
             stdout=stdout,
         )
         assert stdout.getvalue().split("\n") == [
@@ -628,21 +645,51 @@ class ApprovalsSendToPeManagementTestCase(TestCase):
         ] + [
             "",
         ]
-        sleep_mock.assert_called_with(3)
-        assert sleep_mock.call_count == 10
-        assert notify_mock.call_count == 3
-        assert cancelled_notify_mock.call_count == 7
+        # error_approval_with_obfuscated_nir does not need a rech_individu call.
+        assert rech_individu_route.call_count == 9
+        assert maj_pass_route.call_count == 10
         for approval in [no_jobapp, missing_user_data1, missing_user_data2, future, cancelled_approval_future]:
             approval.refresh_from_db()
             assert approval.pe_notification_status == api_enums.PEApiNotificationStatus.PENDING
-        # Since the notify_pole_emploi have been mocked, the READY/SHOULD_RETRY approvals kept their statuses
-        retry_approval.refresh_from_db()
-        assert retry_approval.pe_notification_status == api_enums.PEApiNotificationStatus.SHOULD_RETRY
         error_approval.refresh_from_db()
         assert error_approval.pe_notification_status == api_enums.PEApiNotificationStatus.ERROR
-        for approval in [pending_approval, error_approval_with_obfuscated_nir, *cancelled_approvals]:
+        for approval in [pending_approval, retry_approval, error_approval_with_obfuscated_nir]:
             approval.refresh_from_db()
-            assert approval.pe_notification_status == api_enums.PEApiNotificationStatus.READY
+            assert approval.pe_notification_status == api_enums.PEApiNotificationStatus.SUCCESS
+        pending_approval.user.jobseeker_profile.refresh_from_db()
+        assert pending_approval.user.jobseeker_profile.pe_obfuscated_nir == API_RECHERCHE_RESULT_KNOWN["idNationalDE"]
+        for cancelled_approval in cancelled_approvals[:7]:
+            cancelled_approval.refresh_from_db()
+            assert cancelled_approval.pe_notification_status == api_enums.PEApiNotificationStatus.SUCCESS
+            assert cancelled_approval.user_id_national_pe == API_RECHERCHE_RESULT_KNOWN["idNationalDE"]
+        # Batch is full
+        for cancelled_approval in cancelled_approvals[7:]:
+            cancelled_approval.refresh_from_db()
+            assert cancelled_approval.pe_notification_status == api_enums.PEApiNotificationStatus.READY
+
+    @respx.mock
+    def test_send_notifications_saves_the_sent_notifications_on_unexpected_error(self):
+        respx.post("https://auth.fr/connexion/oauth2/access_token?realm=%2Fpartenaire").respond(
+            200, json={"token_type": "foo", "access_token": "batman", "expires_in": 3600}
+        )
+        respx.post("https://pe.fake/maj-pass-iae/v1/passIAE/miseAjour").respond(200, json=API_MAJPASS_RESULT_OK)
+        sent_approval, failing_approval = [
+            ApprovalFactory(with_jobapplication=True, user__jobseeker_profile__pe_obfuscated_nir="something")
+            for _ in range(2)
+        ]
+        pe_send_notification = Approval.pe_send_notification
+
+        def send_or_fail(approval, notification, pe_client):
+            if approval == failing_approval:
+                raise ValueError("Unexpected")
+            pe_send_notification(approval, notification, pe_client)
+
+        with patch.object(Approval, "pe_send_notification", send_or_fail), pytest.raises(ValueError):
+            send_notifications([sent_approval, failing_approval], rate=1000, concurrency=2)
+        sent_approval.refresh_from_db()
+        assert sent_approval.pe_notification_status == api_enums.PEApiNotificationStatus.SUCCESS
+        failing_approval.refresh_from_db()
+        assert failing_approval.pe_notification_status == api_enums.PEApiNotificationStatus.PENDING
 
 
 @override_settings(
@@ -24,7 +24,14 @@ from itou.approvals.admin import JobApplicationInline
 from itou.approvals.admin_forms import ApprovalAdminForm
 from itou.approvals.constants import PROLONGATION_REPORT_FILE_REASONS
 from itou.approvals.enums import ApprovalStatus, Origin, ProlongationReason
-from itou.approvals.models import Approval, CancelledApproval, PoleEmploiApproval, Prolongation, Suspension
+from itou.approvals.models import (
+    Approval,
+    CancelledApproval,
+    PENotificationMixin,
+    PoleEmploiApproval,
+    Prolongation,
+    Suspension,
+)
 from itou.companies.enums import CompanyKind
 from itou.employee_record.enums import Status
 from itou.files.models import File
@@ -1805,6 +1812,13 @@ class ApprovalConcurrentModelTest(TransactionTestCase):
 
 
 class PENotificationMixinTestCase(TestCase):
+    def test_pe_notification_is_required(self):
+        with pytest.raises(TypeError, match=r"must define pe_notification\(\)"):
+
+            class NotNotifiable(PENotificationMixin):
+                class Meta:
+                    app_label = "approvals"
+
     def test_base_values(self):
         approval = ApprovalFactory()
         assert approval.pe_notification_status == "notification_pending"
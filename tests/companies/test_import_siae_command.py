@@ -2,6 +2,7 @@ import collections
 import datetime
 import shutil
 from pathlib import Path
+from unittest import mock
 
 import pandas as pd
 import pytest
@@ -18,7 +19,13 @@ from itou.companies.management.commands._import_siae.siae import (
     check_whether_signup_is_possible_for_all_siaes,
     create_new_siaes,
 )
-from itou.companies.management.commands._import_siae.utils import anonymize_fluxiae_df, could_siae_be_deleted
+from itou.companies.management.commands._import_siae.utils import (
+    _get_fluxiae_read_csv_kwargs,
+    anonymize_fluxiae_df,
+    could_siae_be_deleted,
+    get_fluxiae_df,
+    get_fluxiae_df_chunks,
+)
 from itou.companies.management.commands._import_siae.vue_af import (
     get_conventions_by_siae_key,
     get_vue_af_df,
@@ -52,6 +59,27 @@ class ImportSiaeManagementCommandsTest(TestCase):
         for file in files:
             shutil.copy(file, self.tmp_path)
 
+    def test_get_fluxiae_df_chunks(self):
+        df = get_fluxiae_df(vue_name="fluxIAE_Structure")
+
+        df_chunks = list(get_fluxiae_df_chunks(vue_name="fluxIAE_Structure", chunksize=2))
+
+        assert len(df_chunks) > 1
+        pd.testing.assert_frame_equal(pd.concat(df_chunks), df)
+
+    def test_get_fluxiae_df_chunks_checks_the_number_of_rows(self):
+        kwargs = _get_fluxiae_read_csv_kwargs("fluxIAE_Structure")
+        # More rows than the file contains, as if it was truncated.
+        kwargs["nrows"] += 10
+
+        with mock.patch(
+            "itou.companies.management.commands._import_siae.utils._get_fluxiae_read_csv_kwargs", return_value=kwargs
+        ):
+            df_chunks = get_fluxiae_df_chunks(vue_name="fluxIAE_Structure", chunksize=2)
+            # Nothing is yielded from a truncated file.
+            with pytest.raises(AssertionError):
+                next(df_chunks)
+
     def test_uncreatable_conventions_for_active_siae_with_active_convention(self):
         siret_to_siae_row = get_siret_to_siae_row(get_vue_structure_df())
         conventions_by_siae_key = get_conventions_by_siae_key(get_vue_af_df())
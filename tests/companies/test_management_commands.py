@@ -5,9 +5,11 @@ import operator
 import pytest
 from django.contrib.gis.geos import Point
 from django.core import management
+from django.utils import timezone
 from freezegun import freeze_time
 
 from itou.companies.enums import CompanyKind
+from itou.companies.models import CompanySearchIndex
 from tests.companies import factories as companies_factories
 from tests.job_applications.factories import JobApplicationFactory
 
@@ -72,7 +74,7 @@ class TestMoveCompanyData:
             assert predicate(getattr(company_2, field), getattr(company_1, field))
 
 
-def test_update_companies_job_app_score():
+def test_update_companies_job_app_score(caplog):
     company_1 = companies_factories.CompanyFactory()
     company_2 = JobApplicationFactory(to_company__with_jobs=True).to_company
 
@@ -80,9 +82,10 @@ def test_update_companies_job_app_score():
     assert company_2.job_app_score is None
 
     stdout = io.StringIO()
-    management.call_command("update_companies_job_app_score", stdout=stdout)
+    management.call_command("update_companies_job_app_score", reconcile=True, stdout=stdout)
     # company_1 did not change (from None to None)
     assert "Updated 1 companies" in stdout.getvalue()
+    assert "job_app_score drift on 1 companies" in caplog.messages
 
     company_1.refresh_from_db()
     company_2.refresh_from_db()
@@ -91,6 +94,71 @@ def test_update_companies_job_app_score():
     assert company_2.job_app_score is not None
 
 
+def test_update_companies_job_app_score_for_old_job_applications():
+    company = companies_factories.CompanyFactory(with_jobs=True)
+    other_company = companies_factories.CompanyFactory(with_jobs=True, job_app_score=1.0)
+    with freeze_time(timezone.now() - datetime.timedelta(weeks=3, hours=1)):
+        JobApplicationFactory(to_company=company)
+    company.job_app_score = 0.25
+    company.save(update_fields=["job_app_score"])
+    # Too old to be considered by this run.
+    with freeze_time(timezone.now() - datetime.timedelta(weeks=3, hours=4)):
+        JobApplicationFactory(to_company=other_company)
+
+    stdout = io.StringIO()
+    management.call_command("update_companies_job_app_score", stdout=stdout)
+    assert "Updated 1 companies" in stdout.getvalue()
+
+    company.refresh_from_db()
+    assert company.job_app_score == 0.0
+    other_company.refresh_from_db()
+    assert other_company.job_app_score == 1.0
+
+
+def test_job_app_score_is_updated_in_the_background(django_capture_on_commit_callbacks):
+    company = companies_factories.CompanyFactory(with_jobs=True)
+    with django_capture_on_commit_callbacks(execute=True):
+        job_application = JobApplicationFactory(to_company=company)
+    company.refresh_from_db()
+    assert company.job_app_score == 0.25
+
+    job_description = company.job_description_through.first()
+    job_description.is_active = False
+    with django_capture_on_commit_callbacks(execute=True):
+        job_description.save(update_fields=["is_active"])
+    company.refresh_from_db()
+    assert company.job_app_score == 1 / 3
+
+    with django_capture_on_commit_callbacks(execute=True):
+        job_application.delete()
+    company.refresh_from_db()
+    assert company.job_app_score == 0.0
+
+
+def test_refresh_company_search_index():
+    company = companies_factories.CompanyFactory(with_membership=True, with_jobs=True)
+    companies_factories.CompanyFactory(convention=None)  # inactive
+    stale_company = companies_factories.CompanyFactory()
+    management.call_command("refresh_company_search_index", stdout=io.StringIO())
+
+    stale_company.convention.is_active = False
+    stale_company.convention.save(update_fields=["is_active"])
+    stdout = io.StringIO()
+    management.call_command("refresh_company_search_index", stdout=stdout)
+    assert "Indexed 1 companies" in stdout.getvalue()
+
+    [entry] = CompanySearchIndex.objects.all()
+    assert entry.company == company
+    assert entry.display_name == company.display_name
+    assert entry.has_active_members is True
+    assert entry.active_job_descriptions_count == 4
+    # Only the departments whose entries changed are returned.
+    assert CompanySearchIndex.refresh() == (1, set())
+    company.block_job_applications = True
+    company.save(update_fields=["block_job_applications"])
+    assert CompanySearchIndex.refresh() == (1, {company.department})
+
+
 @freeze_time("2023-05-01")
 def test_update_companies_coords(settings, capsys, respx_mock):
     company_1 = companies_factories.CompanyFactory(
@@ -6,6 +6,7 @@ from django.utils import timezone
 from itou.eligibility.enums import AdministrativeCriteriaLevel, AuthorKind
 from itou.eligibility.models import AdministrativeCriteria, EligibilityDiagnosis
 from itou.eligibility.models.common import AdministrativeCriteriaQuerySet
+from itou.users.models import User
 from tests.approvals.factories import ApprovalFactory, PoleEmploiApprovalFactory
 from tests.companies.factories import CompanyFactory
 from tests.eligibility.factories import (
@@ -229,6 +230,77 @@ class EligibilityDiagnosisManagerTest(TestCase):
         assert last_expired == expired_diagnosis_last
 
 
+class EligibilityDiagnosisManagerBulkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CompanyFactory(with_membership=True)
+        cls.other_company = CompanyFactory(with_membership=True)
+
+    def _create_job_seekers(self):
+        no_diagnosis = JobSeekerFactory()
+        by_prescriber = EligibilityDiagnosisFactory().job_seeker
+        by_siae = EligibilityDiagnosisMadeBySiaeFactory(author_siae=self.company).job_seeker
+        by_other_siae = EligibilityDiagnosisMadeBySiaeFactory(author_siae=self.other_company).job_seeker
+        both_siae_and_prescriber = EligibilityDiagnosisMadeBySiaeFactory(author_siae=self.company).job_seeker
+        EligibilityDiagnosisFactory(job_seeker=both_siae_and_prescriber)
+        expired = ExpiredEligibilityDiagnosisFactory().job_seeker
+        expired_with_approval = ExpiredEligibilityDiagnosisMadeBySiaeFactory(author_siae=self.company).job_seeker
+        ApprovalFactory(user=expired_with_approval)
+        only_approval = ApprovalFactory().user
+        several_diagnoses = JobSeekerFactory()
+        ExpiredEligibilityDiagnosisFactory(job_seeker=several_diagnoses)
+        EligibilityDiagnosisFactory(job_seeker=several_diagnoses, created_at=timezone.now() - relativedelta(days=2))
+        EligibilityDiagnosisFactory(job_seeker=several_diagnoses)
+        return [
+            no_diagnosis,
+            by_prescriber,
+            by_siae,
+            by_other_siae,
+            both_siae_and_prescriber,
+            expired,
+            expired_with_approval,
+            only_approval,
+            several_diagnoses,
+        ]
+
+    def _pairs(self, job_seekers):
+        job_seekers = User.objects.filter(pk__in=[job_seeker.pk for job_seeker in job_seekers]).select_related(
+            "jobseeker_profile"
+        )
+        return [(job_seeker, for_siae) for job_seeker in job_seekers for for_siae in (None, self.company)]
+
+    def test_same_results_as_per_row(self):
+        job_seekers = self._create_job_seekers()
+        expected_last = {}
+        expected_has = {}
+        for job_seeker, for_siae in self._pairs(job_seekers):
+            key = (job_seeker.pk, getattr(for_siae, "pk", None))
+            expected_last[key] = EligibilityDiagnosis.objects.last_considered_valid(job_seeker, for_siae=for_siae)
+            expected_has[key] = EligibilityDiagnosis.objects.has_considered_valid(job_seeker, for_siae=for_siae)
+
+        assert EligibilityDiagnosis.objects.last_considered_valid_for(self._pairs(job_seekers)) == expected_last
+        assert EligibilityDiagnosis.objects.has_considered_valid_for(self._pairs(job_seekers)) == expected_has
+
+    def test_num_queries(self):
+        self._create_job_seekers()
+        pairs = self._pairs(User.objects.all())
+        # 1. Approvals
+        # 2. PE approvals
+        # 3. Diagnoses
+        with self.assertNumQueries(3):
+            EligibilityDiagnosis.objects.has_considered_valid_for(pairs)
+
+        for _ in range(3):
+            self._create_job_seekers()
+        pairs = self._pairs(User.objects.all())
+        with self.assertNumQueries(3):
+            EligibilityDiagnosis.objects.has_considered_valid_for(pairs)
+
+    def test_no_pairs(self):
+        with self.assertNumQueries(0):
+            assert EligibilityDiagnosis.objects.last_considered_valid_for([]) == {}
+
+
 class EligibilityDiagnosisModelTest(TestCase):
     def test_create_diagnosis(self):
         job_seeker = JobSeekerFactory()
@@ -3,7 +3,8 @@ import json
 
 import freezegun
 import pytest
-from django.test.utils import override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils import timezone
 
 from itou.employee_record.enums import NotificationStatus, Status
@@ -146,6 +147,54 @@ def test_upload_and_download(snapshot, sftp_directory, command):
     assert command.stdout.getvalue() == snapshot()
 
 
+@freezegun.freeze_time("2021-09-27")
+def test_upload_several_batches(mocker, sftp_directory, command):
+    mocker.patch.object(EmployeeRecordBatch, "MAX_EMPLOYEE_RECORDS", 2)
+    employee_records = EmployeeRecordFactory.create_batch(5, ready_for_transfer=True)
+
+    command.handle(upload=True, download=False, preflight=False, wet_run=True)
+
+    uploaded_files = sorted(sftp_directory.joinpath("depot").iterdir())
+    assert [file.name for file in uploaded_files] == [
+        "RIAE_FS_20210927000000.json",
+        "RIAE_FS_20210927000001.json",
+        "RIAE_FS_20210927000002.json",
+    ]
+    for file in uploaded_files:
+        lines = json.loads(file.read_text())["lignesTelechargement"]
+        assert [line["numLigne"] for line in lines] == list(range(1, len(lines) + 1))
+    for employee_record in employee_records:
+        employee_record.refresh_from_db()
+        assert employee_record.status == Status.SENT
+    assert sorted((er.asp_batch_file, er.asp_batch_line_number) for er in employee_records) == [
+        ("RIAE_FS_20210927000000.json", 1),
+        ("RIAE_FS_20210927000000.json", 2),
+        ("RIAE_FS_20210927000001.json", 1),
+        ("RIAE_FS_20210927000001.json", 2),
+        ("RIAE_FS_20210927000002.json", 1),
+    ]
+
+
+def test_download_queries_do_not_depend_on_the_number_of_employee_records(sftp_directory, command):
+    def transfer(count, now):
+        employee_records = EmployeeRecordFactory.create_batch(count, ready_for_transfer=True)
+        with freezegun.freeze_time(now):
+            command.handle(upload=True, download=False, preflight=False, wet_run=True)
+        process_incoming_file(sftp_directory, "0000", "OK")
+        for file in sftp_directory.joinpath("depot").iterdir():
+            file.unlink()
+
+        with CaptureQueriesContext(connection) as queries:
+            command.handle(upload=False, download=True, preflight=False, wet_run=True)
+        for employee_record in employee_records:
+            employee_record.refresh_from_db()
+            assert employee_record.status == Status.PROCESSED
+            assert employee_record.archived_json.get("libelleTraitement") == "OK"
+        return len(queries)
+
+    assert transfer(1, "2021-09-27 10:00:00") == transfer(5, "2021-09-27 11:00:00")
+
+
 def test_duplicates_automatic_processing(sftp_directory, command):
     employee_record = EmployeeRecordFactory(ready_for_transfer=True)
 
@@ -6,9 +6,11 @@ from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.core import mail
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.db.models import Max
 from django.forms.models import model_to_dict
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from django_xworkflows import models as xwf_models
@@ -396,16 +398,17 @@ class JobApplicationQuerySetTest(TestCase):
         assert hasattr(qs, "has_suspended_approval")
         assert not qs.has_suspended_approval
 
-    def test_with_last_change(self):
-        job_app = JobApplicationSentByJobSeekerFactory()
-        qs = JobApplication.objects.with_last_change().get(pk=job_app.pk)
-        assert hasattr(qs, "last_change")
-        assert qs.last_change == job_app.created_at
+    def test_last_change_at(self):
+        with freeze_time("2023-12-01 10:00"):
+            job_app = JobApplicationSentByJobSeekerFactory()
+        job_app.refresh_from_db()
+        assert job_app.last_change_at == job_app.created_at
 
-        job_app.process()
-        qs = JobApplication.objects.with_last_change().get(pk=job_app.pk)
+        with freeze_time("2023-12-05 10:00"):
+            job_app.process()
+        job_app.refresh_from_db()
         last_change = job_app.logs.order_by("-timestamp").first()
-        assert qs.last_change == last_change.timestamp
+        assert job_app.last_change_at == last_change.timestamp
 
     def test_with_jobseeker_eligibility_diagnosis(self):
         job_app = JobApplicationFactory(with_approval=True)
@@ -635,16 +638,17 @@ class JobApplicationQuerySetTest(TestCase):
         )
         assert job_app not in JobApplication.objects.eligible_as_employee_record(job_app.to_company)
 
-    def test_with_accepted_at_for_created_from_pe_approval(self):
+    def test_accepted_at_for_created_from_pe_approval(self):
         JobApplicationFactory(
             state=JobApplicationWorkflow.STATE_ACCEPTED,
             origin=Origin.PE_APPROVAL,
         )
 
-        job_application = JobApplication.objects.with_accepted_at().first()
+        job_application = JobApplication.objects.get()
         assert job_application.accepted_at == job_application.created_at
 
-    def test_with_accepted_at_for_accept_transition(self):
+    @freeze_time("2023-12-01 10:00")
+    def test_accepted_at_for_accept_transition(self):
         job_application = JobApplicationSentByCompanyFactory()
         job_application.process()
         job_application.accept(user=job_application.sender)
@@ -653,17 +657,21 @@ class JobApplicationQuerySetTest(TestCase):
             job_application=job_application,
             transition=JobApplicationWorkflow.TRANSITION_ACCEPT,
         ).aggregate(timestamp=Max("timestamp"))["timestamp"]
-        assert JobApplication.objects.with_accepted_at().first().accepted_at == expected_created_at
+        assert JobApplication.objects.get().accepted_at == expected_created_at
 
-    def test_with_accepted_at_with_multiple_transitions(self):
+    def test_accepted_at_with_multiple_transitions(self):
         job_application = JobApplicationSentByCompanyFactory()
-        job_application.process()
-        job_application.accept(user=job_application.sender)
+        with freeze_time("2023-12-01 10:00"):
+            job_application.process()
+            job_application.accept(user=job_application.sender)
         assert job_application.approval.number == "XXXXX0000001"
-        job_application.cancel(user=job_application.sender)
-        job_application.accept(user=job_application.sender)
+        with freeze_time("2023-12-02 10:00"):
+            job_application.cancel(user=job_application.sender)
+        with freeze_time("2023-12-03 10:00"):
+            job_application.accept(user=job_application.sender)
         assert job_application.approval.number == "XXXXX0000002"
-        job_application.cancel(user=job_application.sender)
+        with freeze_time("2023-12-04 10:00"):
+            job_application.cancel(user=job_application.sender)
         assert list(CancelledApproval.objects.order_by("number").values_list("number", flat=True)) == [
             "XXXXX0000001",
             "XXXXX0000002",
@@ -673,9 +681,8 @@ class JobApplicationQuerySetTest(TestCase):
             job_application=job_application,
             transition=JobApplicationWorkflow.TRANSITION_ACCEPT,
         ).aggregate(timestamp=Max("timestamp"))["timestamp"]
-        # We should not have more job applications
-        assert JobApplication.objects.with_accepted_at().count() == JobApplication.objects.count()
-        assert JobApplication.objects.with_accepted_at().first().accepted_at == expected_created_at
+        assert expected_created_at == datetime.datetime(2023, 12, 3, 10, tzinfo=datetime.UTC)
+        assert JobApplication.objects.get().accepted_at == expected_created_at
 
     def test_accept_without_sender(self):
         job_application = JobApplicationFactory(sent_by_authorized_prescriber_organisation=True)
@@ -691,26 +698,26 @@ class JobApplicationQuerySetTest(TestCase):
             recipients.append(recipient)
         assert recipients == [job_application.job_seeker.email, employer.email]
 
-    def test_with_accepted_at_default_value(self):
+    def test_accepted_at_default_value(self):
         job_application = JobApplicationSentByCompanyFactory()
 
-        assert JobApplication.objects.with_accepted_at().first().accepted_at is None
+        assert JobApplication.objects.get().accepted_at is None
 
         job_application.process()  # 1 transition but no accept
-        assert JobApplication.objects.with_accepted_at().first().accepted_at is None
+        assert JobApplication.objects.get().accepted_at is None
 
         job_application.refuse(job_application.sender)  # 2 transitions, still no accept
-        assert JobApplication.objects.with_accepted_at().first().accepted_at is None
+        assert JobApplication.objects.get().accepted_at is None
 
-    def test_with_accepted_at_for_accepted_with_no_transition(self):
+    def test_accepted_at_for_accepted_with_no_transition(self):
         JobApplicationSentByCompanyFactory(state=JobApplicationWorkflow.STATE_ACCEPTED)
-        job_application = JobApplication.objects.with_accepted_at().first()
+        job_application = JobApplication.objects.get()
         assert job_application.accepted_at == job_application.created_at
 
-    def test_with_accepted_at_for_ai_stock(self):
+    def test_accepted_at_for_ai_stock(self):
         JobApplicationFactory(origin=Origin.AI_STOCK)
 
-        job_application = JobApplication.objects.with_accepted_at().first()
+        job_application = JobApplication.objects.get()
         assert job_application.accepted_at.date() == job_application.hiring_start_at
         assert job_application.accepted_at != job_application.created_at
 
@@ -1840,6 +1847,26 @@ class JobApplicationXlsxExportTest(TestCase):
             ],
         ]
 
+    def test_number_of_queries_does_not_depend_on_the_number_of_rows(self):
+        create_test_romes_and_appellations(["M1805"], appellations_per_rome=2)
+
+        def create_job_applications():
+            JobApplicationFactory(with_approval=True, selected_jobs=Appellation.objects.all())
+            job_application = JobApplicationFactory(selected_jobs=Appellation.objects.all())
+            PoleEmploiApprovalFactory(nir=job_application.job_seeker.jobseeker_profile.nir)
+
+        def count_export_queries():
+            with CaptureQueriesContext(connection) as context:
+                get_rows_from_streaming_response(stream_xlsx_export(JobApplication.objects.all(), "filename"))
+            return len(context.captured_queries)
+
+        create_job_applications()
+        num_queries = count_export_queries()
+
+        for _ in range(5):
+            create_job_applications()
+        assert count_export_queries() == num_queries
+
     def test_all_gender_cases_in_export(self):
         assert _resolve_title(title="", nir="") == ""
         assert _resolve_title(title=Title.M, nir="") == Title.M
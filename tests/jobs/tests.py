@@ -1,4 +1,5 @@
 from itou.jobs.models import Appellation, Rome
+from itou.utils.autocomplete import appellations_index
 from tests.jobs.factories import create_test_romes_and_appellations
 from tests.utils.test import TestCase
 
@@ -31,3 +32,24 @@ def test_appellation_autocomplete():
     appellation = Appellation.objects.autocomplete("conducteur", limit=1, rome_code="N4105")[0]
     assert appellation.code == "12859"
     assert appellation.name == "Conducteur collecteur / Conductrice collectrice de lait"
+
+
+def test_appellation_index_matches_autocomplete():
+    create_test_romes_and_appellations(["N1101", "N4105"])
+
+    for term, rome_code in [
+        ("conducteur lait", None),
+        ("chariot armee", None),
+        ("CHAUFFEUR livreuse n4105", None),
+        ("conducteurs", None),
+        ("cond", None),
+        ("de", None),
+        ("conducteur:* & & de:* & !chariot:* & <eleva:*>>>>", None),
+        ("conducteur", "N1101"),
+        ("conducteur", "N4105"),
+    ]:
+        expected = Appellation.objects.autocomplete(term, rome_code=rome_code)
+        results = appellations_index.search(term, rome_code=rome_code)
+        assert [(appellation.code, appellation.autocomplete_display()) for appellation in results] == [
+            (appellation.code, appellation.autocomplete_display()) for appellation in expected
+        ], term
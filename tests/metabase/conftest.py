@@ -1,7 +1,9 @@
+import threading
+
 import pytest
 from django.db import connection
 
-from itou.metabase import dataframes, db
+from itou.metabase import db
 from itou.metabase.tables.utils import (
     get_active_companies_pks,
     get_ai_stock_job_seeker_pks,
@@ -36,8 +38,10 @@ def metabase_fixture(monkeypatch, settings):
         def __exit__(self, exc_type, exc_value, exc_traceback):
             if self.cursor:
                 self.cursor.close()
+            # Rows are written from a thread, which gets its own connection to the test database.
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
 
-    monkeypatch.setattr(dataframes, "MetabaseDatabaseCursor", FakeMetabase)
     monkeypatch.setattr(db, "MetabaseDatabaseCursor", FakeMetabase)
     # This setting need to be editable in `dev` to manually test transferring data from "les emplois" to "pilotage",
     # but the one used in `test` should be fixed, `dev` inheriting from `test` we can't put it in settings.
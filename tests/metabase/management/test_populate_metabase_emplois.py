@@ -1,5 +1,6 @@
 import datetime
 
+import pyarrow.parquet as pq
 import pytest
 from django.contrib.gis.geos import Point
 from django.core import management
@@ -14,6 +15,7 @@ from itou.companies.enums import ContractType
 from itou.companies.models import JobDescription
 from itou.eligibility.models import AdministrativeCriteria
 from itou.geo.utils import coords_to_geometry
+from itou.job_applications.models import JobApplication, JobApplicationWorkflow
 from itou.metabase.tables.utils import hash_content
 from itou.users.enums import IdentityProvider, UserKind
 from tests.analytics.factories import DatumFactory, StatsDashboardVisitFactory
@@ -206,15 +208,12 @@ def test_populate_job_seekers():
     num_queries += 1  # Count rows
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select all elements ids (chunked_queryset)
-    num_queries += 1  # Select last pk for current chunck
     num_queries += 1  # Select job seekers chunck (with annotations)
     num_queries += 1  # Prefetch EligibilityDiagnosis with anotations, author_prescriber_organization and author_siae
     num_queries += 1  # Prefetch JobApplications with Siaes
     num_queries += 1  # Prefetch created_by Users
     num_queries += 1  # Get QPV users
     num_queries += 1  # Select AI stock approvals pks
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -389,10 +388,7 @@ def test_populate_criteria():
     num_queries = 1  # Count criteria
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select criteria IDs
-    num_queries += 1  # Select one chunk of criteria IDs
     num_queries += 1  # Select criteria with columns
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -406,6 +402,22 @@ def test_populate_criteria():
         assert rows[0] == (1, "Bénéficiaire du RSA", "1", "Revenu de solidarité active", datetime.date(2023, 2, 1))
 
 
+@freeze_time("2023-02-02")
+def test_populate_criteria_as_parquet(tmp_path):
+    management.call_command("populate_metabase_emplois", mode="criteria", parquet_destination=str(tmp_path))
+
+    table = pq.read_table(tmp_path / "critères_iae" / "date_instantane=2023-02-02")
+    rows = sorted(table.to_pylist(), key=lambda row: row["id"])
+    assert len(rows) == 18
+    assert rows[0] == {
+        "id": 1,
+        "nom": "Bénéficiaire du RSA",
+        "niveau": "1",
+        "description": "Revenu de solidarité active",
+        "date_mise_à_jour_metabase": datetime.date(2023, 2, 1),
+    }
+
+
 @freeze_time("2023-02-02")
 @pytest.mark.django_db(transaction=True)
 @pytest.mark.usefixtures("metabase")
@@ -426,14 +438,12 @@ def test_populate_job_applications():
     num_queries += 1  # Count job applications
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select job application IDs
-    num_queries += 1  # Select one chunk of job application IDs
     num_queries += 1  # Select job applications with columns
     num_queries += 1  # Select job application transition logs
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
+    num_queries += 1  # COMMIT (set_high_water_mark)
     with assertNumQueries(num_queries):
         management.call_command("populate_metabase_emplois", mode="job_applications")
 
@@ -474,13 +484,10 @@ def test_populate_job_applications():
         ]
 
     # no need for a cache clear for the active siae pks, has been done above
-    num_queries = 1  # Count job applications
+    num_queries = 1  # Count selected jobs
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select job application IDs
-    num_queries += 1  # Select one chunk of job application IDs
-    num_queries += 1  # Select job applications with columns
-    num_queries += 1  # COMMIT (inject_chunk)
+    num_queries += 1  # Select selected jobs with columns
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -500,6 +507,54 @@ def test_populate_job_applications():
         ]
 
 
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures("metabase")
+def test_populate_job_applications_incrementally():
+    with freeze_time("2023-02-01"):
+        company = CompanyFactory(kind="GEIQ")
+        other_company = CompanyFactory(kind="GEIQ")
+        unchanged_ja = JobApplicationFactory(to_company=company)
+        updated_ja = JobApplicationFactory(to_company=company)
+        removed_ja = JobApplicationFactory(to_company=company)
+        moved_ja = JobApplicationFactory(to_company=company)
+        renamed_company_ja = JobApplicationFactory(to_company=other_company)
+        missing_ja = JobApplicationFactory(to_company=company)
+    with freeze_time("2023-02-02"):
+        # No previous run: the table is built from scratch.
+        management.call_command("populate_metabase_emplois", mode="job_applications", incremental=True)
+
+    with freeze_time("2023-02-03"):
+        JobApplication.objects.filter(pk=updated_ja.pk).update(
+            state=JobApplicationWorkflow.STATE_PROCESSING, updated_at=timezone.now()
+        )
+        new_ja = JobApplicationFactory(to_company=company)
+        removed_ja.delete()
+        # Queryset updates setting `updated_at` and related objects modifications are both detected.
+        JobApplication.objects.filter(pk=moved_ja.pk).update(to_company=other_company, updated_at=timezone.now())
+        other_company.name = "Nouveau nom"
+        other_company.save(update_fields=["name", "updated_at"])
+        # E.g. the company of the job application became active.
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM candidatures WHERE id = %s", [missing_ja.pk])
+    with freeze_time("2023-02-04"):
+        management.call_command("populate_metabase_emplois", mode="job_applications", incremental=True)
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, état, id_structure, date_mise_à_jour_metabase FROM candidatures")
+        rows = cursor.fetchall()
+    assert sorted(rows) == sorted(
+        [
+            # Untouched rows keep their update date.
+            (unchanged_ja.pk, "Nouvelle candidature", company.pk, datetime.date(2023, 2, 1)),
+            (updated_ja.pk, "Candidature à l'étude", company.pk, datetime.date(2023, 2, 3)),
+            (new_ja.pk, "Nouvelle candidature", company.pk, datetime.date(2023, 2, 3)),
+            (moved_ja.pk, "Nouvelle candidature", other_company.pk, datetime.date(2023, 2, 3)),
+            (renamed_company_ja.pk, "Nouvelle candidature", other_company.pk, datetime.date(2023, 2, 3)),
+            (missing_ja.pk, "Nouvelle candidature", company.pk, datetime.date(2023, 2, 3)),
+        ]
+    )
+
+
 @freeze_time("2023-02-02")
 @pytest.mark.django_db(transaction=True)
 @pytest.mark.usefixtures("metabase")
@@ -511,18 +566,12 @@ def test_populate_approvals():
     num_queries += 1  # Count PE approvals
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select approval IDs
-    num_queries += 1  # Select approvals IDs, chunk by 1000
     num_queries += 1  # Select approvals with columns
     num_queries += 1  # Prefetch users
     num_queries += 1  # Prefetch JobApplications
-    num_queries += 1  # COMMIT (inject_chunk)
 
-    num_queries += 1  # Select PE approval IDs
-    num_queries += 1  # Select PE approvals IDs, chunk by 1000
     num_queries += 1  # Select PE approvals with columns
     num_queries += 1  # Select prescriber organizations
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -582,10 +631,7 @@ def test_populate_prolongations():
     num_queries = 1  # Count prolongations
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select prolongation IDs
-    num_queries += 1  # Select one chunk of prolongation IDs
     num_queries += 1  # Select prolongations with columns
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -628,10 +674,7 @@ def test_populate_prolongation_requests():
     num_queries = 1  # Count prolongation_requests
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select prolongation_request IDs
-    num_queries += 1  # Select one chunk of prolongation_request IDs
     num_queries += 1  # Select prolongation_requests with columns
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -672,10 +715,7 @@ def test_populate_institutions():
     num_queries = 1  # Count institutions
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select institution IDs
-    num_queries += 1  # Select one chunk of institution IDs
     num_queries += 1  # Select institutions with columns
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -707,10 +747,7 @@ def test_populate_evaluation_campaigns():
     num_queries = 1  # Count campaigns
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select campaign IDs
-    num_queries += 1  # Select one chunk of campaign IDs
     num_queries += 1  # Select campaigns with columns
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -742,12 +779,9 @@ def test_populate_evaluated_siaes():
     num_queries = 1  # Count evaluated siaes
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select evaluated siae IDs
-    num_queries += 1  # Select one chunk of evaluated siae IDs
     num_queries += 1  # Select evaluated siaes with columns
     num_queries += 1  # Select related evaluated job applications
     num_queries += 1  # Select related campaigns
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -779,11 +813,8 @@ def test_populate_evaluated_job_applications():
     num_queries = 1  # Count evaluated job applications
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select evaluated job application IDs
-    num_queries += 1  # Select one chunk of evaluated job application IDs
     num_queries += 1  # Select evaluated job applications with columns
     num_queries += 1  # Select related evaluated siaes
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -814,10 +845,7 @@ def test_populate_evaluated_criteria():
     num_queries = 1  # Count evaluated criteria
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select evaluated criteria IDs
-    num_queries += 1  # Select one chunk of evaluated criteria IDs
     num_queries += 1  # Select evaluated criteria with columns
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -865,10 +893,7 @@ def test_populate_users():
     num_queries = 1  # Count users
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select user IDs
-    num_queries += 1  # Select one chunk of user IDs
     num_queries += 1  # Select users with columns
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -906,20 +931,11 @@ def test_populate_memberships():
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
 
-    num_queries += 1  # Select siae memberships IDs
-    num_queries += 1  # Select one chunk of siae memberships IDs
     num_queries += 1  # Select siae memberships with columns
-    num_queries += 1  # COMMIT (inject_chunk)
 
-    num_queries += 1  # Select prescriber memberships IDs
-    num_queries += 1  # Select one chunk of prescriber memberships IDs
     num_queries += 1  # Select prescriber memberships with columns
-    num_queries += 1  # COMMIT (inject_chunk)
 
-    num_queries += 1  # Select institution memberships IDs
-    num_queries += 1  # Select one chunk of institution memberships IDs
     num_queries += 1  # Select institution memberships with columns
-    num_queries += 1  # COMMIT (inject_chunk)
 
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
@@ -963,7 +979,6 @@ def test_populate_memberships():
 @pytest.mark.usefixtures("metabase")
 def test_populate_enums():
     num_queries = 1  # COMMIT Create table
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -1054,11 +1069,8 @@ def test_populate_job_descriptions():
     num_queries = 1  # Count total rows for job descriptions
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select all job descriptions
-    num_queries += 1  # Select job descriptions chunk
     num_queries += 1  # Select job descriptions with columns
     num_queries += 1  # Annotate job applications count
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -1115,14 +1127,11 @@ def test_populate_companies():
     num_queries = 1  # Count Siaes
     num_queries += 1  # COMMIT Queryset counts (autocommit mode)
     num_queries += 1  # COMMIT Create table
-    num_queries += 1  # Select active SIAES
-    num_queries += 1  # Select one chunk of siaes
     num_queries += 1  # Select siaes with annotations and columns
     num_queries += 1  # Select other siaes with the same convention
     num_queries += 1  # Prefetch siae job descriptions
     num_queries += 1  # Prefecth siae memberships
     num_queries += 1  # Prefetch cities
-    num_queries += 1  # COMMIT (inject_chunk)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically RENAME TABLE)
     num_queries += 1  # COMMIT (rename_table_atomically DROP TABLE)
@@ -1188,3 +1197,36 @@ def test_populate_companies():
                 datetime.date(2023, 2, 1),
             ),
         ]
+
+
+def test_populate_all_modes_runs_dbt_daily_last(mocker):
+    run_mode = mocker.patch(
+        "itou.metabase.management.commands.populate_metabase_emplois._run_mode",
+        return_value=1.0,
+    )
+
+    management.call_command("populate_metabase_emplois", all_modes=True, jobs=1)
+
+    modes = [call.args[0] for call in run_mode.call_args_list]
+    assert "job_applications" in modes
+    assert modes[-1] == "dbt_daily"
+    assert len(modes) == len(set(modes))
+
+
+def test_populate_all_modes_skips_dependents_of_failed_modes(mocker):
+    def run_mode(mode, incremental, parquet_destination):
+        if mode == "approvals":
+            raise ValueError("boom")
+        return 1.0
+
+    run_mode = mocker.patch(
+        "itou.metabase.management.commands.populate_metabase_emplois._run_mode",
+        side_effect=run_mode,
+    )
+
+    with pytest.raises(RuntimeError, match="approvals, dbt_daily"):
+        management.call_command("populate_metabase_emplois", all_modes=True, jobs=1)
+
+    modes = [call.args[0] for call in run_mode.call_args_list]
+    assert "job_applications" in modes
+    assert "dbt_daily" not in modes
@@ -0,0 +1,96 @@
+import pandas as pd
+import psycopg
+import pytest
+
+from itou.metabase.dataframes import store_df, store_df_chunks
+from itou.metabase.db import CommitError, RetryingMetabaseDatabaseCursor
+
+
+@pytest.fixture(name="connections")
+def connections_fixture(mocker):
+    connections = []
+
+    def connect(*args, **kwargs):
+        connection = mocker.MagicMock()
+        connections.append(connection)
+        return connection
+
+    mocker.patch("itou.metabase.db.psycopg.connect", side_effect=connect)
+    return connections
+
+
+def test_retrying_cursor_runs_a_failed_operation_again_on_a_new_connection(connections):
+    operation_calls = []
+
+    def operation(cursor, value):
+        operation_calls.append(value)
+        if len(operation_calls) == 1:
+            raise psycopg.OperationalError("server closed the connection unexpectedly")
+        return value
+
+    with RetryingMetabaseDatabaseCursor() as metabase:
+        assert metabase.run(operation, 42) == 42
+
+    assert operation_calls == [42, 42]
+    assert len(connections) == 2
+    connections[0].commit.assert_not_called()
+    connections[1].commit.assert_called_once_with()
+
+
+def test_retrying_cursor_does_not_run_an_operation_again_when_its_commit_failed(connections):
+    operation_calls = []
+
+    def operation(cursor):
+        operation_calls.append(cursor)
+        connections[-1].commit.side_effect = psycopg.OperationalError("server closed the connection unexpectedly")
+
+    with RetryingMetabaseDatabaseCursor() as metabase:
+        with pytest.raises(CommitError):
+            metabase.run(operation)
+
+    # The rows may have been committed, writing them again could duplicate them.
+    assert len(operation_calls) == 1
+    assert len(connections) == 1
+
+
+@pytest.fixture(name="failing_first_commit")
+def failing_first_commit_fixture(mocker, connections):
+    def connect(*args, **kwargs):
+        connection = mocker.MagicMock()
+        if not connections:
+            connection.commit.side_effect = psycopg.OperationalError("server closed the connection unexpectedly")
+        connections.append(connection)
+        return connection
+
+    mocker.patch("itou.metabase.db.psycopg.connect", side_effect=connect)
+    mocker.patch("itou.metabase.dataframes.rename_table_atomically")
+    return mocker.patch("itou.metabase.dataframes.create_table")
+
+
+def test_store_df_stores_the_table_again_from_scratch_when_a_commit_failed(connections, failing_first_commit):
+    store_df(pd.DataFrame({"id": [1, 2]}), "test_table")
+
+    # The new table is emptied before the rows are stored again.
+    assert [call.kwargs for call in failing_first_commit.call_args_list] == [{"reset": True}, {"reset": True}]
+    assert len(connections) == 2
+    connections[1].commit.assert_called_once_with()
+
+
+def test_store_df_chunks_reloads_the_chunks_once_when_a_commit_failed(connections, failing_first_commit):
+    loads = []
+
+    def get_df_chunks():
+        loads.append(len(loads))
+        return iter([pd.DataFrame({"id": [1, 2]})])
+
+    store_df_chunks(get_df_chunks(), "test_table", reload_df_chunks=get_df_chunks)
+
+    assert loads == [0, 1]
+    assert len(connections) == 2
+
+
+def test_store_df_chunks_gives_up_without_reload_when_a_commit_failed(connections, failing_first_commit):
+    with pytest.raises(CommitError):
+        store_df_chunks(iter([pd.DataFrame({"id": [1, 2]})]), "test_table")
+
+    assert len(connections) == 1
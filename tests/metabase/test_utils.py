@@ -1,6 +1,12 @@
+import pytest
+from pytest_django.asserts import assertNumQueries
+
 from itou.geo.utils import coords_to_geometry
+from itou.job_applications.models import JobApplication
 from itou.metabase.tables.utils import get_qpv_job_seeker_pks, get_zrr_status_for_insee_code
+from itou.metabase.utils import chunked_queryset
 from tests.geo.factories import QPVFactory, ZRRFactory
+from tests.job_applications.factories import JobApplicationFactory
 from tests.users.factories import JobSeekerFactory
 
 
@@ -34,3 +40,34 @@ def test_get_zrr_status_for_insee_code_not_in_zrr():
 def test_get_zrr_status_for_insee_code_partially_in_zrr():
     partially_in_zrr = ZRRFactory(partially_in_zrr=True)
     assert get_zrr_status_for_insee_code(partially_in_zrr.insee_code) == "Partiellement classée en ZRR"
+
+
+def test_chunked_queryset_with_uuid_pks():
+    job_applications = sorted(JobApplicationFactory.create_batch(5), key=lambda ja: ja.pk)
+
+    # One query per chunk, the last one not being full.
+    with assertNumQueries(3):
+        chunks = list(chunked_queryset(JobApplication.objects.all(), chunk_size=2))
+    assert chunks == [job_applications[:2], job_applications[2:4], job_applications[4:]]
+
+    # An extra query is needed to find out the last full chunk was the last one.
+    with assertNumQueries(2):
+        chunks = list(chunked_queryset(JobApplication.objects.all(), chunk_size=5))
+    assert chunks == [job_applications]
+
+
+def test_chunked_queryset_with_composite_key():
+    job_seeker = JobSeekerFactory()
+    job_applications = JobApplicationFactory.create_batch(3, job_seeker=job_seeker) + [JobApplicationFactory()]
+    queryset = JobApplication.objects.values("job_seeker_id", "pk").order_by("job_seeker_id", "pk")
+
+    chunks = list(chunked_queryset(queryset, chunk_size=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2]
+    assert [row["pk"] for chunk in chunks for row in chunk] == [row["pk"] for row in queryset]
+    assert {row["pk"] for row in queryset} == {ja.pk for ja in job_applications}
+
+
+def test_chunked_queryset_rejects_descending_order():
+    with pytest.raises(ValueError):
+        next(chunked_queryset(JobApplication.objects.order_by("-created_at")))
@@ -2,6 +2,7 @@ import pytest
 from django.contrib.admin import helpers
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
 from django.urls import reverse
 from django.utils import timezone
 from freezegun import freeze_time
@@ -11,6 +12,7 @@ from itou.job_applications.enums import SenderKind
 from itou.users.enums import UserKind
 from itou.users.models import IdentityProvider, User
 from itou.utils.models import PkSupportRemark
+from itou.utils.perms.memberships import get_cached_active_memberships, organizations_cache_key
 from tests.job_applications.factories import JobApplicationFactory
 from tests.users.factories import (
     EmployerFactory,
@@ -225,7 +227,7 @@ def test_app_model_change_url(admin_client):
     assert response.status_code == 200
 
 
-def test_free_ic_email(admin_client):
+def test_free_ic_email(admin_client, django_capture_on_commit_callbacks):
     employer = EmployerFactory(with_company=True, username="ic_uuid_username", email="ic_user@email.com")
     prescriber = PrescriberFactory(identity_provider=IdentityProvider.DJANGO)
 
@@ -258,18 +260,22 @@ def test_free_ic_email(admin_client):
     assert prescriber.is_active is True
 
     # When it works
-    response = admin_client.post(
-        reverse("admin:users_user_changelist"),
-        {
-            "action": "free_ic_email",
-            helpers.ACTION_CHECKBOX_NAME: [employer.pk],
-        },
-        follow=True,
-    )
+    get_cached_active_memberships(employer)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = admin_client.post(
+            reverse("admin:users_user_changelist"),
+            {
+                "action": "free_ic_email",
+                helpers.ACTION_CHECKBOX_NAME: [employer.pk],
+            },
+            follow=True,
+        )
     assertContains(response, "L'utilisateur peut à présent se créer un nouveau compte", html=True)
     employer.refresh_from_db()
     assert employer.is_active is False
     assert employer.companymembership_set.get().is_active is False
+    # The memberships resolved by the middleware are invalidated.
+    assert caches["failsafe"].get(organizations_cache_key(employer.pk)) is None
     assert employer.username == "old_ic_uuid_username"
     assert employer.email == "ic_user@email.com_old"
 
@@ -1162,6 +1162,90 @@ class LatestApprovalTestCase(TestCase):
         PoleEmploiApprovalFactory(nir=user.jobseeker_profile.nir, start_at=start_at, end_at=end_at)
         assert user.latest_common_approval is None
 
+    def _create_job_seekers_with_approvals(self):
+        expired_end_at = timezone.localdate() - relativedelta(years=3)
+        expired_start_at = expired_end_at - relativedelta(years=2)
+        waiting_end_at = timezone.localdate() - relativedelta(days=10)
+        waiting_start_at = waiting_end_at - relativedelta(years=2)
+
+        no_approval = JobSeekerFactory()
+        with_approval = ApprovalFactory().user
+        PoleEmploiApprovalFactory(nir=with_approval.jobseeker_profile.nir)
+        only_pe_approval = JobSeekerFactory()
+        PoleEmploiApprovalFactory(nir=only_pe_approval.jobseeker_profile.nir)
+        pe_approval_by_pole_emploi_id = JobSeekerFactory(with_pole_emploi_id=True, jobseeker_profile__nir="")
+        PoleEmploiApprovalFactory(
+            pole_emploi_id=pe_approval_by_pole_emploi_id.jobseeker_profile.pole_emploi_id,
+            birthdate=pe_approval_by_pole_emploi_id.birthdate,
+        )
+        expired_approval = ApprovalFactory(start_at=expired_start_at, end_at=expired_end_at).user
+        PoleEmploiApprovalFactory(nir=expired_approval.jobseeker_profile.nir)
+        approval_in_waiting_period = ApprovalFactory(start_at=waiting_start_at, end_at=waiting_end_at).user
+        PoleEmploiApprovalFactory(nir=approval_in_waiting_period.jobseeker_profile.nir)
+        both_expired = ApprovalFactory(start_at=expired_start_at, end_at=expired_end_at).user
+        PoleEmploiApprovalFactory(
+            nir=both_expired.jobseeker_profile.nir, start_at=expired_start_at, end_at=expired_end_at
+        )
+        return [
+            no_approval,
+            with_approval,
+            only_pe_approval,
+            pe_approval_by_pole_emploi_id,
+            expired_approval,
+            approval_in_waiting_period,
+            both_expired,
+            PrescriberFactory(),
+        ]
+
+    def test_prefetch_latest_common_approvals(self):
+        users = self._create_job_seekers_with_approvals()
+        expected = {
+            user.pk: (user.latest_approval, user.latest_pe_approval, user.latest_common_approval) for user in users
+        }
+
+        users = list(User.objects.filter(pk__in=expected))
+        common_approvals = User.prefetch_latest_common_approvals(users)
+        assert common_approvals == {
+            pk: latest_common_approval for pk, (*_, latest_common_approval) in expected.items()
+        }
+        with self.assertNumQueries(0):
+            assert {
+                user.pk: (user.latest_approval, user.latest_pe_approval, user.latest_common_approval) for user in users
+            } == expected
+
+    def test_prefetch_latest_common_approvals_breaks_ties_on_pe_approval_number(self):
+        user = JobSeekerFactory()
+        for number in ["100000000001", "100000000003", "100000000002"]:
+            PoleEmploiApprovalFactory(nir=user.jobseeker_profile.nir, number=number)
+        assert user.latest_pe_approval.number == "100000000003"
+
+        [user] = User.objects.filter(pk=user.pk)
+        User.prefetch_latest_common_approvals([user])
+        assert user.latest_pe_approval.number == "100000000003"
+
+    def test_prefetch_latest_common_approvals_primes_every_instance(self):
+        user = ApprovalFactory().user
+        instances = [User.objects.get(pk=user.pk), User.objects.get(pk=user.pk)]
+        User.prefetch_latest_common_approvals(instances)
+        with self.assertNumQueries(0):
+            for instance in instances:
+                assert instance.latest_common_approval == user.latest_approval
+
+    def test_prefetch_latest_common_approvals_num_queries(self):
+        self._create_job_seekers_with_approvals()
+        users = list(User.objects.all())
+        # 1. Job seeker profiles
+        # 2. Approvals
+        # 3. PE approvals
+        with self.assertNumQueries(3):
+            User.prefetch_latest_common_approvals(users)
+
+        for _ in range(3):
+            self._create_job_seekers_with_approvals()
+        users = list(User.objects.all())
+        with self.assertNumQueries(3):
+            User.prefetch_latest_common_approvals(users)
+
 
 @pytest.mark.parametrize("initial_asp_uid", ("08b4e9f755a688b554a6487d96d2a0", ""))
 @override_settings(SECRET_KEY="test")
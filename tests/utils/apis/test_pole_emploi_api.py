@@ -1,6 +1,7 @@
 import json
 import math
 import time
+from unittest import mock
 
 import httpx
 import pytest
@@ -9,11 +10,13 @@ from django.core.cache import caches
 
 from itou.utils.apis.pole_emploi import (
     CACHE_API_TOKEN_KEY,
+    RATE_LIMIT_RETRIES,
     REFRESH_TOKEN_MARGIN_SECONDS,
     PoleEmploiAPIBadResponse,
     PoleEmploiApiClient,
     PoleEmploiAPIException,
     PoleEmploiRateLimitException,
+    RateLimiter,
 )
 from itou.utils.mocks import pole_emploi as pole_emploi_api_mocks
 from tests.job_applications.factories import JobApplicationFactory
@@ -113,6 +116,55 @@ class PoleEmploiAPIClientTest(TestCase):
             )
         assert ctx.value.error_code == "http_error"
 
+    @respx.mock
+    def test_rate_limiter_retries_rate_limited_calls(self):
+        job_seeker = JobSeekerFactory()
+        rate_limiter = RateLimiter(rate=1000, cooldown=0)
+        api_client = PoleEmploiApiClient(
+            "https://pe.fake", "https://auth.fr", "foobar", "pe-secret", rate_limiter=rate_limiter
+        )
+        route = respx.post("https://pe.fake/rechercheindividucertifie/v1/rechercheIndividuCertifie")
+        route.side_effect = [
+            httpx.Response(429, json=""),
+            httpx.Response(429, json=""),
+            httpx.Response(200, json=pole_emploi_api_mocks.API_RECHERCHE_RESULT_KNOWN),
+        ]
+        id_national = api_client.recherche_individu_certifie(
+            job_seeker.first_name, job_seeker.last_name, job_seeker.birthdate, job_seeker.jobseeker_profile.nir
+        )
+        assert id_national == "ruLuawDxNzERAFwxw6Na4V8A8UCXg6vXM_WKkx5j8UQ"
+        assert route.call_count == 3
+        # Halved twice, then increased by a successful call
+        assert rate_limiter.rate == 1000 / 4 * 1.1
+
+        route.side_effect = None
+        route.respond(429, json="")
+        with pytest.raises(PoleEmploiRateLimitException):
+            api_client.recherche_individu_certifie(
+                job_seeker.first_name, job_seeker.last_name, job_seeker.birthdate, job_seeker.jobseeker_profile.nir
+            )
+        assert route.call_count == 3 + RATE_LIMIT_RETRIES + 1
+
+    def test_rate_limiter_acquire(self):
+        with (
+            mock.patch("itou.utils.apis.pole_emploi.time.monotonic", return_value=100),
+            mock.patch("itou.utils.apis.pole_emploi.time.sleep") as sleep_mock,
+        ):
+            rate_limiter = RateLimiter(rate=2, burst=2)
+            rate_limiter.acquire()
+            rate_limiter.acquire()
+            sleep_mock.assert_not_called()
+            # The bucket is empty: wait for the next token.
+            sleep_mock.side_effect = lambda seconds: setattr(rate_limiter, "_tokens", 1)
+            rate_limiter.acquire()
+            sleep_mock.assert_called_once_with(0.5)
+
+            # Wait for the end of the cooldown, and for a token at the slower rate.
+            rate_limiter.slow_down()
+            sleep_mock.reset_mock()
+            rate_limiter.acquire()
+            sleep_mock.assert_called_once_with(1 + 1)
+
     @respx.mock
     def test_mise_a_jour_pass_iae_success_with_approval_accepted(self):
         """
@@ -141,6 +141,47 @@ class TestItouCurrentOrganizationMiddleware:
         assert request.organizations == [company]
         assert request.is_current_organization_admin
 
+    def test_employer_memberships_are_cached(self, mocked_get_response_for_middlewaremixin):
+        factory = RequestFactory()
+        company = CompanyMembershipFactory(company__name="1").company
+        user = company.members.first()
+
+        def call_middleware():
+            request = factory.get("/")
+            request.user = user
+            SessionMiddleware(get_response_for_middlewaremixin).process_request(request)
+            ItouCurrentOrganizationMiddleware(mocked_get_response_for_middlewaremixin)(request)
+            return request
+
+        call_middleware()
+        with assertNumQueries(1):  # Retrieve the organizations of the cached memberships
+            request = call_middleware()
+        assert request.organizations == [company]
+
+        # Organizations are not cached, views may save them without writing stale values back.
+        Company.objects.filter(pk=company.pk).update(job_app_score=12.5)
+        request = call_middleware()
+        assert request.current_organization.job_app_score == 12.5
+
+        # Cache is invalidated when the user joins another company.
+        other_company = CompanyFactory(name="2")
+        other_company.members.add(user)
+        request = call_middleware()
+        assert request.organizations == [company, other_company]
+
+        # And when a company is updated.
+        company.name = "0"
+        company.save(update_fields=["name"])
+        request = call_middleware()
+        assert request.organizations[0].name == "0"
+
+        # And when a membership is deactivated.
+        membership = user.companymembership_set.get(company=other_company)
+        membership.is_active = False
+        membership.save(update_fields=["is_active"])
+        request = call_middleware()
+        assert request.organizations == [company]
+
     def test_siae_no_member(self, mocked_get_response_for_middlewaremixin):
         factory = RequestFactory()
         request = factory.get("/")
@@ -1269,6 +1310,20 @@ class TestPaginator:
         assert pager.display_pager
         assert pager.pages_to_display == range(5, 16)
 
+    def test_pager_with_count(self):
+        object_list = range(100)
+        pager = pagination.pager(object_list, 10, items_per_page=5, count=80)
+        assert pager.paginator.count == 80
+        assert pager.pages_to_display == range(5, 16)
+        assert list(pager) == list(range(45, 50))
+
+    def test_pager_with_outdated_count(self):
+        # The page is not truncated to an outdated count.
+        object_list = range(12)
+        pager = pagination.pager(object_list, 1, items_per_page=10, count=5)
+        assert not pager.display_pager
+        assert list(pager) == list(range(10))
+
 
 def test_yield_sync_diff():
     # NOTE(vperron): not ideal, since I'm using models from a different Django app.
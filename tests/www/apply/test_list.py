@@ -1,7 +1,10 @@
 import datetime
+from unittest import mock
+from urllib.parse import urlparse
 
 import pytest
 from dateutil.relativedelta import relativedelta
+from django.db import DatabaseError
 from django.urls import reverse
 from django.utils import timezone
 from freezegun import freeze_time
@@ -11,7 +14,9 @@ from itou.companies.enums import CompanyKind
 from itou.eligibility.enums import AdministrativeCriteriaLevel
 from itou.eligibility.models import AdministrativeCriteria
 from itou.job_applications.enums import SenderKind
+from itou.job_applications.export import ExportState, get_export, save_xlsx_export
 from itou.job_applications.models import JobApplication, JobApplicationWorkflow
+from itou.job_applications.tasks import export_lock, huey_save_xlsx_export
 from itou.jobs.models import Appellation
 from itou.utils.widgets import DuetDatePickerWidget
 from tests.approvals.factories import ApprovalFactory, SuspensionFactory
@@ -233,37 +238,9 @@ class ProcessListSiaeTest(ProcessListTest):
             + 1  # prefetch jobs appellation
             + 1  # prefetch jobs location
             + 1  # prefetch approvals
+            + 1  # PE approvals of the job seekers (User.prefetch_latest_common_approvals)
+            + 1  # last considered valid diagnoses (EligibilityDiagnosis.objects.has_considered_valid_for)
             + 1  # manually prefetch administrative_criteria
-            #
-            # Render template:
-            # 9 job applications (1 per state in JobApplicationWorkflow + 1 sent by prescriber)
-            # 22 requests, maggie has a diagnosis made by a prescriber in this test
-            + 1  # jobapp1: no approval (prefetched ⇒ no query), check PE approval (⇒ no PE approval)
-            + 1  # jobapp1: select last valid diagnosis made by prescriber or SIAE (prescriber)
-            # 24 requests
-            + 1  # jobapp2: no approval (prefetched ⇒ no query), check PE approval (⇒ no PE approval)
-            + 1  # jobapp2: select last valid diagnosis made by prescriber or SIAE (SIAE)
-            # 26 requests
-            + 1  # jobapp3: no approval (prefetched ⇒ no query), check PE approval (⇒ no PE approval)
-            + 1  # jobapp3: select last valid diagnosis made by prescriber or SIAE (SIAE)
-            # 28 requests
-            + 1  # jobapp4: no approval (prefetched ⇒ no query), check PE approval (⇒ no PE approval)
-            + 1  # jobapp4: select last valid diagnosis made by prescriber or SIAE (SIAE)
-            # 30 requests
-            + 1  # jobapp5: no approval (prefetched ⇒ no query), check PE approval (⇒ no PE approval)
-            + 1  # jobapp5: select last valid diagnosis made by prescriber or SIAE (SIAE)
-            # 32 requests
-            + 1  # jobapp6: no approval (prefetched ⇒ no query), check PE approval (⇒ no PE approval)
-            + 1  # jobapp6: select last valid diagnosis made by prescriber or SIAE (SIAE)
-            # 34 requests
-            + 1  # jobapp7: no approval (prefetched ⇒ no query), check PE approval (⇒ no PE approval)
-            + 1  # jobapp7: select last valid diagnosis made by prescriber or SIAE (SIAE)
-            # 36 requests
-            + 1  # jobapp8: no approval (prefetched ⇒ no query), check PE approval (⇒ no PE approval)
-            + 1  # jobapp8: select last valid diagnosis made by prescriber or SIAE (SIAE)
-            # 38 requests, maggie has a diagnosis made by a prescriber in this test
-            + 1  # jobapp9: no approval (prefetched ⇒ no query), check PE approval (⇒ no PE approval)
-            + 1  # jobapp8: select last valid diagnosis made by prescriber or SIAE (prescriber)
             + 3  # update session
         ):
             response = self.client.get(self.siae_base_url)
@@ -400,6 +377,25 @@ class ProcessListSiaeTest(ProcessListTest):
         assert len(applications) == 1
         assert applications[0].state == JobApplicationWorkflow.STATE_PRIOR_TO_HIRE
 
+    def test_list_for_siae_view__count_is_cached_until_a_job_application_is_saved(self):
+        self.client.force_login(self.eddie_hit_pit)
+        params = {"states": [JobApplicationWorkflow.STATE_NEW]}
+        response = self.client.get(self.siae_base_url, params)
+        count = response.context["job_applications_page"].paginator.count
+        assert count > 0
+
+        # Bulk updates don't send signals: the count is kept, but not the listed job applications.
+        self.hit_pit.job_applications_received.filter(state=JobApplicationWorkflow.STATE_NEW).update(
+            state=JobApplicationWorkflow.STATE_REFUSED
+        )
+        response = self.client.get(self.siae_base_url, params)
+        assert response.context["job_applications_page"].paginator.count == count
+        assert len(response.context["job_applications_page"].object_list) == 0
+
+        JobApplicationFactory(to_company=self.hit_pit, state=JobApplicationWorkflow.STATE_NEW)
+        response = self.client.get(self.siae_base_url, params)
+        assert response.context["job_applications_page"].paginator.count == 1
+
     def test_list_for_siae_view__filtered_by_many_states(self):
         """
         Eddie wants to see NEW and PROCESSING job applications.
@@ -689,6 +685,22 @@ class ProcessListSiaeTest(ProcessListTest):
         assert len(applications) == 1
         assert appellation1 in [job_desc.appellation for job_desc in applications[0].selected_jobs.all()]
 
+    def test_view__filtered_by_many_selected_jobs(self):
+        self.client.force_login(self.eddie_hit_pit)
+
+        create_test_romes_and_appellations(["M1805", "N1101"], appellations_per_rome=2)
+        (appellation1, appellation2) = Appellation.objects.all().order_by("?")[:2]
+        job_application = JobApplicationSentByJobSeekerFactory(
+            to_company=self.hit_pit, selected_jobs=[appellation1, appellation2]
+        )
+
+        response = self.client.get(self.siae_base_url, {"selected_jobs": [appellation1.pk, appellation2.pk]})
+        applications = response.context["job_applications_page"].object_list
+
+        # The application matches both jobs but is only listed once.
+        assert [application.pk for application in applications] == [job_application.pk]
+        assert response.context["job_applications_page"].paginator.count == 1
+
 
 class TestListForSiae:
     @pytest.mark.parametrize("filter_state", JobApplicationWorkflow.states)
@@ -843,8 +855,8 @@ class ProcessListPrescriberTest(ProcessListTest):
 
         response = self.client.get(download_url)
 
-        assert 200 == response.status_code
-        assert "spreadsheetml" in response.get("Content-Type")
+        assert 302 == response.status_code
+        assert urlparse(response.url).path.endswith(".xlsx")
 
     def test_view__filtered_by_state(self):
         """
@@ -1017,8 +1029,8 @@ class ProcessListExportsDownloadPrescriberTest(ProcessListTest):
 
         response = self.client.get(download_url)
 
-        assert 200 == response.status_code
-        assert "spreadsheetml" in response.get("Content-Type")
+        assert 302 == response.status_code
+        assert urlparse(response.url).path.endswith(".xlsx")
 
     def test_list_for_prescriber_exports_download_view_by_month(self):
         """
@@ -1035,8 +1047,8 @@ class ProcessListExportsDownloadPrescriberTest(ProcessListTest):
 
         response = self.client.get(download_url)
 
-        assert 200 == response.status_code
-        assert "spreadsheetml" in response.get("Content-Type")
+        assert 302 == response.status_code
+        assert urlparse(response.url).path.endswith(".xlsx")
 
     def test_list_for_siae_exports_download_view(self):
         """
@@ -1069,8 +1081,8 @@ class ProcessListExportsDownloadSiaeTest(ProcessListTest):
 
         response = self.client.get(download_url)
 
-        assert 200 == response.status_code
-        assert "spreadsheetml" in response.get("Content-Type")
+        assert 302 == response.status_code
+        assert urlparse(response.url).path.endswith(".xlsx")
 
     def test_list_for_siae_exports_download_view_by_month(self):
         """
@@ -1085,8 +1097,48 @@ class ProcessListExportsDownloadSiaeTest(ProcessListTest):
 
         response = self.client.get(download_url)
 
+        assert 302 == response.status_code
+        assert urlparse(response.url).path.endswith(".xlsx")
+
+    def test_list_for_siae_exports_download_view_reuses_recent_export(self):
+        self.client.force_login(self.eddie_hit_pit)
+        download_url = reverse("apply:list_for_siae_exports_download")
+
+        response = self.client.get(download_url)
+        assert 302 == response.status_code
+        with mock.patch("itou.job_applications.tasks.huey_save_xlsx_export") as save_export:
+            second_response = self.client.get(download_url)
+        save_export.assert_not_called()
+        assert urlparse(second_response.url).path == urlparse(response.url).path
+
+    def test_list_for_siae_exports_download_view_while_pending(self):
+        self.client.force_login(self.eddie_hit_pit)
+        download_url = reverse("apply:list_for_siae_exports_download")
+
+        with mock.patch("itou.job_applications.tasks.huey_save_xlsx_export") as save_export:
+            response = self.client.get(download_url)
+        save_export.assert_called_once()
         assert 200 == response.status_code
-        assert "spreadsheetml" in response.get("Content-Type")
+        assertContains(response, "Votre fichier est en cours de préparation.")
+
+    def test_list_for_siae_exports_download_view_waits_for_running_export(self):
+        self.client.force_login(self.eddie_hit_pit)
+        download_url = reverse("apply:list_for_siae_exports_download")
+
+        with export_lock, mock.patch.object(huey_save_xlsx_export, "schedule") as schedule:
+            response = self.client.get(download_url)
+        schedule.assert_called_once()
+        assert 200 == response.status_code
+        assertContains(response, "Votre fichier est en cours de préparation.")
+
+    def test_save_xlsx_export_fails_before_counting(self):
+        params = {"export_for": "siae", "company": self.hit_pit.pk, "month_identifier": None}
+        with (
+            mock.patch("itou.job_applications.export.get_job_applications_to_export", side_effect=DatabaseError),
+            pytest.raises(DatabaseError),
+        ):
+            save_xlsx_export("export-key", params, "export.xlsx")
+        assert get_export("export-key")["state"] == ExportState.FAILED
 
     def test_list_for_prescriber_exports_download_view(self):
         """
@@ -112,7 +112,7 @@ class TestApprovalDetailView:
             + 2  # fetch siae membership and siae infos (middleware)
             + 1  # place savepoint right after the middlewares
             + 1  # job_seeker.approval
-            + 1  # job_application.with_accepted_at annotation coming from next query
+            + 1  # last accepted job application coming from next query
             + 1  # approval.suspension active today
             + 1  # Suspension.can_be_handled_by_siae >> User.last_accepted_job_application
             + 1  # select latest approval for user (can_be_prolonged)
@@ -185,21 +185,19 @@ class TestApprovalDetailView:
         expected_num_queries = (
             1  # fetch django session
             + 1  # fetch authenticated user
-            + 1  # fetch siae membership and siae infos (middleware)
+            + 1  # fetch siae infos (memberships are cached by the middleware since the previous requests)
             + 1  # place savepoint right after the middlewares
             + 1  # get approval infos (get_object)
             # get_context_data
             + 1  # for every *active* suspension, check if there is an accepted job application after it
             + 1  # approval.suspension_set.end_at >= today >= approval.suspension_set.start_at (.can_be_suspended)
-            + 1  # job_application.with_accepted_at annotation coming from (.last_hire_was_made_by_company)
+            + 1  # last accepted job application coming from (.last_hire_was_made_by_company)
             + 1  # siae infos (.last_hire_was_made_by_company)
             + 1  # user approvals (.is_last_for_user)
             + 1  # siae infos (job_application.get_eligibility_diagnosis())
             + 1  # approval.suspensions_for_status_card lists approval suspensions
             + 1  # EXISTS accepted job application starting after today
             + 1  # release savepoint before the template rendering
-            # context processors
-            + 1  # siae membership (get_context_siae)
             # template: approvals/includes/status.html
             + 1  # template: approval.remainder fetches approval suspensions to compute remaining days
             + 1  # template: approval.prolongations_for_status_card
@@ -1,6 +1,7 @@
 from django.urls import reverse
 
 from itou.asp.models import Commune
+from itou.cities.models import City
 from tests.cities.factories import create_test_cities
 from tests.companies.factories import CompanyFactory
 from tests.jobs.factories import create_test_romes_and_appellations
@@ -337,6 +338,22 @@ class CitiesAutocompleteTest(TestCase):
             {"slug": "paris-10e-arrondissement-75", "value": "Paris 10e Arrondissement (75)"},
         ]
 
+    def test_index_is_kept_until_cities_change(self):
+        create_test_cities(["01"], num_per_department=20)
+        url = reverse("autocomplete:cities")
+
+        response = self.client.get(url, {"term": "joyeux"})
+        assert response.json() == [{"slug": "joyeux-01", "value": "Joyeux (01)"}]
+
+        # The index is loaded once, the database is not queried anymore.
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {"term": "joyeux"})
+        assert response.json() == [{"slug": "joyeux-01", "value": "Joyeux (01)"}]
+
+        City.objects.get(slug="joyeux-01").delete()
+        response = self.client.get(url, {"term": "joyeux"})
+        assert response.json() == []
+
 
 class Select2CitiesAutocompleteTest(TestCase):
     def test_autocomplete(self):
@@ -529,6 +546,18 @@ class CommunesAutocompleteTest(TestCase):
             {"code": "83100", "department": "083", "value": "PUGET-VILLE (083)"},
         ]
 
+    def test_autocomplete_with_date(self):
+        url = reverse("autocomplete:communes")
+
+        response = self.client.get(url, {"term": "saint j", "date": "1950-01-01", "select2": ""})
+        assert response.json() == {"results": [{"id": 55184, "text": "SAINT-JEAN-DE-LUZ (064)"}]}
+
+        response = self.client.get(url, {"term": "64483", "date": "2000-01-01", "select2": ""})
+        assert response.json() == {"results": [{"id": 55185, "text": "SAINT-JEAN-DE-LUZ (064)"}]}
+
+        response = self.client.get(url, {"term": "64483", "date": "1899-12-31", "select2": ""})
+        assert response.json() == {"results": []}
+
 
 class Select2CommunesAutocompleteTest(TestCase):
     def test_autocomplete(self):
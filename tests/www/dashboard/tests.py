@@ -23,6 +23,7 @@ from itou.cities.models import City
 from itou.companies.enums import CompanyKind
 from itou.employee_record.enums import Status
 from itou.institutions.enums import InstitutionKind
+from itou.job_applications.models import JobApplicationWorkflow
 from itou.job_applications.notifications import (
     NewQualifiedJobAppEmployersNotification,
     NewSpontaneousJobAppEmployersNotification,
@@ -218,6 +219,24 @@ class DashboardViewTest(TestCase):
 
         self.assertContains(response, geiq_url)
 
+    def test_dashboard_job_applications_counters(self):
+        company = CompanyFactory(with_membership=True)
+        employer = company.members.first()
+        JobApplicationFactory(to_company=company, state=JobApplicationWorkflow.STATE_NEW)
+        job_application = JobApplicationFactory(to_company=company, state=JobApplicationWorkflow.STATE_PROCESSING)
+        JobApplicationFactory(to_company=company, state=JobApplicationWorkflow.STATE_POSTPONED)
+        JobApplicationFactory(to_company=company, state=JobApplicationWorkflow.STATE_REFUSED)
+        JobApplicationFactory(state=JobApplicationWorkflow.STATE_NEW)
+        self.client.force_login(employer)
+
+        response = self.client.get(reverse("dashboard:index"))
+        assert [category["counter"] for category in response.context["job_applications_categories"]] == [2, 1]
+
+        # The cached counters are invalidated by the transition.
+        job_application.postpone(user=employer)
+        response = self.client.get(reverse("dashboard:index"))
+        assert [category["counter"] for category in response.context["job_applications_categories"]] == [1, 2]
+
     def test_dashboard_agreements_and_job_postings(self):
         for kind in [
             CompanyKind.AI,
@@ -464,8 +483,7 @@ class DashboardViewTest(TestCase):
         num_queries += 1  #  get user (middleware)
         num_queries += 2  #  get company memberships (middleware)
         num_queries += 1  #  OrganizationAbstract.has_admin()
-        num_queries += 1  #  select job applications states
-        num_queries += 1  #  count employee records
+        num_queries += 1  #  count job applications and rejected employee records (dashboard summary)
         num_queries += 1  #  check if evaluations sanctions exists
         num_queries += 1  #  check siae conventions
         num_queries += 1  #  OrganizationAbstract.has_member()
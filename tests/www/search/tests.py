@@ -1,5 +1,9 @@
+import io
+from unittest import mock
+
 import pytest
 from django.contrib.gis.geos import Point
+from django.core.management import call_command
 from django.template.defaultfilters import capfirst
 from django.test import override_settings
 from django.urls import reverse, reverse_lazy
@@ -8,7 +12,7 @@ from django.utils.http import urlencode
 
 from itou.cities.models import City
 from itou.companies.enums import POLE_EMPLOI_SIRET, CompanyKind, ContractNature, ContractType, JobSource
-from itou.companies.models import Company
+from itou.companies.models import Company, CompanySearchIndex
 from itou.jobs.models import Appellation, Rome
 from tests.cities.factories import create_city_guerande, create_city_saint_andre, create_city_vannes
 from tests.companies.factories import CompanyFactory, CompanyMembershipFactory, JobDescriptionFactory
@@ -51,12 +55,17 @@ class SearchCompanyTest(TestCase):
         company_1 = CompanyFactory(department="75", coords=paris_city.coords, post_code="75001")
         CompanyFactory(department="75", coords=paris_city.coords, post_code="75002")
 
+        CompanySearchIndex.refresh()
+
         # Filter on city
         with self.assertNumQueries(
             BASE_NUM_QUERIES
             + 1  # select the city
-            + 1  # fetch initial companies (to extract the filters afterwards)
-            + 2  # two counts for the tab headers
+            + 1  # find the departments around the city (cache versions)
+            + 1  # count companies by department and post code (to build the filters afterwards)
+            + 1  # fetch company names for the company filter
+            + 1  # list sorted companies pks
+            + 1  # count job descriptions
             + 1  # refetch the city for widget rendering
             + 1  # actual select of the companies, with related objects and annotated distance
             + 1  # prefetch active job descriptions
@@ -90,6 +99,8 @@ class SearchCompanyTest(TestCase):
         city = create_city_saint_andre()
         CompanyFactory(department="44", coords=city.coords, post_code="44117", kind=CompanyKind.AI)
 
+        CompanySearchIndex.refresh()
+
         response = self.client.get(self.URL, {"city": city.slug, "kinds": [CompanyKind.AI]})
         self.assertContains(
             response,
@@ -124,6 +135,8 @@ class SearchCompanyTest(TestCase):
             kind=CompanyKind.AI,
         )
 
+        CompanySearchIndex.refresh()
+
         # 100 km
         response = self.client.get(self.URL, {"city": guerande.slug, "distance": 100})
         self.assertContains(
@@ -200,11 +213,15 @@ class SearchCompanyTest(TestCase):
         )
         created_companies.append(company)
 
+        CompanySearchIndex.refresh()
+
         with self.assertNumQueries(
             BASE_NUM_QUERIES
             + 1  # find city
-            + 1  # find companies
-            + 1  # count companies
+            + 1  # find the departments around the city (cache versions)
+            + 1  # count companies by department and post code
+            + 1  # find company names
+            + 1  # list sorted companies pks
             + 1  # count job descriptions
             + 1  # refetch the city for widget rendering
             + 1  # get companies infos
@@ -219,6 +236,8 @@ class SearchCompanyTest(TestCase):
         city = create_city_saint_andre()
         CompanyFactory(department="44", coords=city.coords, post_code="44117", kind=CompanyKind.OPCS)
 
+        CompanySearchIndex.refresh()
+
         response = self.client.get(self.URL, {"city": city.slug})
         self.assertContains(
             response,
@@ -234,6 +253,7 @@ class SearchCompanyTest(TestCase):
         company = CompanyFactory(department="44", coords=city.coords, post_code="44117", with_membership=True)
         job = JobDescriptionFactory(company=company)
         JobApplicationFactory.create_batch(19, to_company=company, selected_jobs=[job], state="new")
+        CompanySearchIndex.refresh()
         response = self.client.get(self.URL, {"city": city.slug})
         popular_badge = """
             <span class="badge badge-sm rounded-pill bg-accent-03 text-primary">
@@ -257,11 +277,13 @@ class SearchCompanyTest(TestCase):
         company = CompanyFactory(department="44", coords=city.coords, post_code="44117")
         job_description = JobDescriptionFactory(company=company)
         job_description_str = job_description.get_absolute_url()
+        CompanySearchIndex.refresh()
         response = self.client.get(self.URL, {"city": city.slug})
         self.assertNotContains(response, job_description_str)
         self.assertContains(response, no_hiring_str)
 
         CompanyMembershipFactory(company=company)
+        CompanySearchIndex.refresh()
         response = self.client.get(self.URL, {"city": city.slug})
         self.assertContains(response, job_description_str)
         self.assertNotContains(response, no_hiring_str)
@@ -289,11 +311,15 @@ class SearchCompanyTest(TestCase):
             kind=CompanyKind.AI,
         )
 
+        CompanySearchIndex.refresh()
+
         with self.assertNumQueries(
             BASE_NUM_QUERIES
             + 1  # find city (city form field cleaning)
-            + 1  # find companies (add_form_choices)
-            + 1  # count companies (paginator)
+            + 1  # find the departments around the city (cache versions)
+            + 1  # count companies by location (add_form_choices)
+            + 1  # find company names (add_form_choices)
+            + 1  # list sorted companies pks (paginator)
             + 1  # count job descriptions (job_descriptions_count from context)
             + 1  # refetch the city for widget rendering
             + 1  # get companies infos for page
@@ -306,11 +332,11 @@ class SearchCompanyTest(TestCase):
             html=True,
             count=1,
         )
+        # Departments and filters are cached by the previous search.
         with self.assertNumQueries(
             BASE_NUM_QUERIES
             + 1  # find city (city form field cleaning)
-            + 1  # find companies (add_form_choices)
-            + 1  # count companies (paginator)
+            + 1  # list sorted companies pks (paginator)
             + 1  # count job descriptions (job_descriptions_count from context)
             + 1  # refetch the city for widget rendering
             + 1  # get companies infos for page
@@ -335,6 +361,64 @@ class SearchCompanyTest(TestCase):
             count=1,
         )
 
+    def test_results_are_cached(self):
+        city = create_city_saint_andre()
+        company = CompanyFactory(department="44", coords=city.coords, post_code="44117")
+        other_company = CompanyFactory(department="44", coords=city.coords, post_code="44117")
+        other_company.convention.is_active = False
+        other_company.convention.save(update_fields=["is_active"])
+        CompanySearchIndex.refresh()
+        self.client.get(self.URL, {"city": city.slug})
+
+        with self.assertNumQueries(
+            BASE_NUM_QUERIES
+            + 1  # find city (city form field cleaning)
+            + 1  # refetch the city for widget rendering
+            + 1  # get companies infos for page
+            + 1  # get job descriptions infos (prefetch with is_popular annotation)
+        ):
+            response = self.client.get(self.URL, {"city": city.slug})
+        assert list(response.context["results_page"]) == [company]
+
+        # Changes far from the searched city keep the cached results.
+        CompanyFactory(department="2A", post_code="20000")
+        with self.assertNumQueries(
+            BASE_NUM_QUERIES
+            + 1  # find city (city form field cleaning)
+            + 1  # refetch the city for widget rendering
+            + 1  # get companies infos for page
+            + 1  # get job descriptions infos (prefetch with is_popular annotation)
+        ):
+            response = self.client.get(self.URL, {"city": city.slug})
+        assert list(response.context["results_page"]) == [company]
+
+        # Refreshing the index invalidates the cached results of the changed departments.
+        other_company.convention.is_active = True
+        other_company.convention.save(update_fields=["is_active"])
+        call_command("refresh_company_search_index", stdout=io.StringIO())
+        response = self.client.get(self.URL, {"city": city.slug})
+        assert {company.pk for company in response.context["results_page"]} == {company.pk, other_company.pk}
+
+        # Saving a company invalidates the cached results of its department.
+        company.block_job_applications = True
+        company.save(update_fields=["block_job_applications"])
+        CompanySearchIndex.refresh()
+        response = self.client.get(self.URL, {"city": city.slug})
+        assert [company.pk for company in response.context["results_page"]] == [other_company.pk, company.pk]
+
+    def test_results_without_cache(self):
+        city = create_city_saint_andre()
+        CompanyFactory(department="44", coords=city.coords, post_code="44117")
+        CompanySearchIndex.refresh()
+
+        with mock.patch("itou.utils.cache.FailSafeRedisCacheClient.get", side_effect=ConnectionError):
+            response = self.client.get(self.URL, {"city": city.slug})
+        self.assertContains(
+            response,
+            '<span>Employeur</span><span class="badge badge-sm rounded-pill ms-2">1</span>',
+            html=True,
+        )
+
 
 class SearchPrescriberTest(TestCase):
     def test_home(self):
@@ -378,12 +462,17 @@ class JobDescriptionSearchViewTest(TestCase):
         company = CompanyFactory(department="75", coords=paris_city.coords, post_code="75001")
         job = JobDescriptionFactory(company=company)
 
+        CompanySearchIndex.refresh()
+
         # Filter on city
         with self.assertNumQueries(
             BASE_NUM_QUERIES
             + 1  # select the city
-            + 1  # fetch initial job descriptions to add to the form fields
-            + 2  # count the number of results for companies & job descriptions
+            + 1  # find the departments around the city (cache versions)
+            + 1  # count job descriptions by department to add to the form fields
+            + 1  # count job descriptions by contract type
+            + 1  # count the companies
+            + 1  # list sorted job descriptions pks
             + 1  # prefetch job applications for the is_popular attribute
             + 1  # refetch the city for widget rendering
             + 1  # select the job descriptions for the page
@@ -431,6 +520,8 @@ class JobDescriptionSearchViewTest(TestCase):
         city = create_city_saint_andre()
         CompanyFactory(department="44", coords=city.coords, post_code="44117", kind=CompanyKind.AI)
 
+        CompanySearchIndex.refresh()
+
         response = self.client.get(
             self.URL,
             {
@@ -630,6 +721,10 @@ class JobDescriptionSearchViewTest(TestCase):
         self.assertContains(response, job1_name, html=True)
         self.assertContains(response, job2_name, html=True)
         self.assertContains(response, job3_name, html=True)
+        assert response.context["facets"]["contract_types"] == {
+            ContractType.APPRENTICESHIP: 2,
+            ContractType.BUSINESS_CREATION: 1,
+        }
 
         other_company.convention = None
         other_company.save(update_fields=["convention"])